@@ -0,0 +1,89 @@
+"""
+    benchmarks.bench_bulk_post
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the throughput of creating instances with :http:method:`post`
+    requests, both with one request per instance and with one request per
+    batch of instances whose body is a JSON array.
+
+    Run this script from the root of the repository::
+
+        PYTHONPATH=. python benchmarks/bench_bulk_post.py
+
+    :copyright: 2012, 2013, 2014, 2015 Jeffrey Finkelstein
+                <jeffrey.finkelstein@gmail.com> and contributors.
+    :license: GNU AGPLv3+ or BSD
+
+"""
+from __future__ import print_function
+
+import json
+import time
+
+from flask import Flask
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import sessionmaker
+
+from flask_restless import APIManager
+
+#: The number of instances to create in each round.
+INSTANCES = 2000
+
+#: The sizes of the batches of instances to create in a single request.
+BATCH_SIZES = (1, 10, 100, 1000)
+
+Base = declarative_base()
+
+
+class Person(Base):
+    __tablename__ = 'person'
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode)
+    age = Column(Integer)
+
+
+def make_client(session):
+    """Returns a test client for an application exposing an API for
+    :class:`Person` which allows :http:method:`post` requests.
+
+    """
+    app = Flask(__name__)
+    manager = APIManager(app, session=session)
+    manager.create_api(Person, methods=['POST'], max_bulk_size=1000)
+    return app.test_client()
+
+
+def main():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine))
+    client = make_client(session)
+    headers = {'Content-Type': 'application/json'}
+    people = [dict(name=u'Person {0}'.format(i), age=i % 100)
+              for i in range(INSTANCES)]
+    for batch_size in BATCH_SIZES:
+        session.query(Person).delete()
+        session.commit()
+        start = time.time()
+        for i in range(0, INSTANCES, batch_size):
+            if batch_size == 1:
+                data = people[i]
+            else:
+                data = people[i:i + batch_size]
+            response = client.post('/api/person', data=json.dumps(data),
+                                   headers=headers)
+            assert response.status_code == 201
+        seconds = time.time() - start
+        assert session.query(Person).count() == INSTANCES
+        label = 'single' if batch_size == 1 else 'batch {0}'.format(batch_size)
+        print('{0:>10}: {1:10.1f} instances/second'.format(
+            label, INSTANCES / seconds))
+
+
+if __name__ == '__main__':
+    main()
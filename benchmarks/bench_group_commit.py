@@ -0,0 +1,115 @@
+"""
+    benchmarks.bench_group_commit
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the throughput of concurrent :http:method:`post` requests, each
+    creating a single instance in a SQLite file database, with and without
+    group commit.
+
+    Run this script from the root of the repository::
+
+        PYTHONPATH=. python benchmarks/bench_group_commit.py
+
+    :copyright: 2012, 2013, 2014, 2015 Jeffrey Finkelstein
+                <jeffrey.finkelstein@gmail.com> and contributors.
+    :license: GNU AGPLv3+ or BSD
+
+"""
+from __future__ import print_function
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import sessionmaker
+
+from flask_restless import APIManager
+
+#: The number of threads making requests concurrently.
+THREADS = 32
+
+#: The number of requests made by each thread.
+REQUESTS = 50
+
+Base = declarative_base()
+
+
+class Person(Base):
+    __tablename__ = 'person'
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode)
+    age = Column(Integer)
+
+
+def make_app(session, group_commit):
+    """Returns an application exposing an API for :class:`Person` which
+    allows :http:method:`post` requests.
+
+    """
+    app = Flask(__name__)
+    manager = APIManager(app, session=session)
+    manager.create_api(Person, methods=['POST'], group_commit=group_commit)
+    return app
+
+
+def run(app):
+    """Makes :data:`REQUESTS` requests from each of :data:`THREADS` threads
+    and returns the number of seconds elapsed.
+
+    """
+    headers = {'Content-Type': 'application/json'}
+    start = threading.Event()
+
+    def post(thread):
+        client = app.test_client()
+        start.wait()
+        for i in range(REQUESTS):
+            data = dict(name=u'Person {0}-{1}'.format(thread, i), age=i)
+            response = client.post('/api/person', data=json.dumps(data),
+                                   headers=headers)
+            assert response.status_code == 201
+
+    threads = [threading.Thread(target=post, args=(i, ))
+               for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    begin = time.time()
+    start.set()
+    for thread in threads:
+        thread.join()
+    return time.time() - begin
+
+
+def main():
+    for group_commit in (False, True):
+        fd, filename = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        try:
+            # Wait for the lock on the database file instead of failing when
+            # many threads commit at once.
+            engine = create_engine('sqlite:///' + filename,
+                                   connect_args=dict(timeout=60))
+            Base.metadata.create_all(engine)
+            session = scoped_session(sessionmaker(bind=engine))
+            seconds = run(make_app(session, group_commit))
+            assert session.query(Person).count() == THREADS * REQUESTS
+            session.remove()
+            engine.dispose()
+        finally:
+            os.remove(filename)
+        label = 'group' if group_commit else 'single'
+        print('{0:>10}: {1:10.1f} requests/second'.format(
+            label, THREADS * REQUESTS / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+    benchmarks.bench_to_dict
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures how many model instances per second
+    :func:`flask_restless.helpers.to_dict` can serialize.
+
+    Run this script from the root of the repository::
+
+        PYTHONPATH=. python benchmarks/bench_to_dict.py
+
+    :copyright: 2012, 2013, 2014, 2015 Jeffrey Finkelstein
+                <jeffrey.finkelstein@gmail.com> and contributors.
+    :license: GNU AGPLv3+ or BSD
+
+"""
+from __future__ import print_function
+
+import datetime
+import timeit
+
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import Date
+from sqlalchemy import DateTime
+from sqlalchemy import Float
+from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import relationship
+from sqlalchemy.orm import sessionmaker
+
+from flask_restless.helpers import to_dict
+try:
+    from flask_restless.helpers import serialization_plan
+except ImportError:
+    # Older versions of Flask-Restless compute everything in to_dict().
+    serialization_plan = None
+
+#: The number of rows to serialize in each round, corresponding to one page of
+#: a large paginated response.
+ROWS = 100
+
+#: The number of rounds to time.
+ROUNDS = 200
+
+Base = declarative_base()
+
+
+class Person(Base):
+    __tablename__ = 'person'
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode)
+    age = Column(Integer)
+    other = Column(Float)
+    birth_date = Column(Date)
+    created = Column(DateTime)
+    computers = relationship('Computer')
+
+    @hybrid_property
+    def is_minor(self):
+        return self.age < 18
+
+
+class Computer(Base):
+    __tablename__ = 'computer'
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode)
+    owner_id = Column(Integer, ForeignKey('person.id'))
+
+
+def main():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    now = datetime.datetime(2015, 3, 1, 12, 0, 0)
+    for i in range(ROWS):
+        person = Person(name=u'person{0}'.format(i), age=i, other=i / 2.0,
+                        birth_date=now.date(), created=now)
+        person.computers = [Computer(name=u'computer{0}'.format(i))]
+        session.add(person)
+    session.commit()
+    people = session.query(Person).all()
+    # Load the relations up front so that only serialization is timed.
+    for person in people:
+        person.computers
+
+    def flat():
+        for person in people:
+            to_dict(person, exclude=['other'])
+
+    def deep():
+        for person in people:
+            to_dict(person, deep={'computers': {}})
+
+    benchmarks = [('flat', flat), ('deep', deep)]
+    if serialization_plan is not None:
+        plan = serialization_plan(Person, deep={'computers': {}})
+
+        def deep_plan():
+            for person in people:
+                plan(person)
+
+        benchmarks.append(('plan', deep_plan))
+    for name, func in benchmarks:
+        seconds = min(timeit.repeat(func, number=ROUNDS, repeat=3))
+        rate = ROWS * ROUNDS / seconds
+        print('{0:>6}: {1:10.0f} rows/sec'.format(name, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+    benchmarks.bench_view_overhead
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the per-request overhead of the API view by timing a trivial
+    :http:method:`get` request for a single instance, both with the view
+    instantiated on every request (as :meth:`flask.views.View.as_view` does)
+    and with the view instantiated once and shared by all requests.
+
+    Run this script from the root of the repository::
+
+        PYTHONPATH=. python benchmarks/bench_view_overhead.py
+
+    :copyright: 2012, 2013, 2014, 2015 Jeffrey Finkelstein
+                <jeffrey.finkelstein@gmail.com> and contributors.
+    :license: GNU AGPLv3+ or BSD
+
+"""
+from __future__ import print_function
+
+import timeit
+
+from flask import Flask
+from flask.views import View
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import sessionmaker
+
+from flask_restless import APIManager
+from flask_restless.views import API
+
+#: The number of requests to make in each round.
+REQUESTS = 500
+
+#: The number of rounds to time; the fastest one is reported.
+ROUNDS = 5
+
+Base = declarative_base()
+
+
+class Person(Base):
+    __tablename__ = 'person'
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode)
+    age = Column(Integer)
+    computers = relationship('Computer')
+
+
+class Computer(Base):
+    __tablename__ = 'computer'
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode)
+    owner_id = Column(Integer, ForeignKey('person.id'))
+
+
+def make_client(session, per_request):
+    """Returns a test client for an application exposing an API for
+    :class:`Person`.
+
+    If `per_request` is ``True``, the API view is instantiated on every
+    request, as it is by :meth:`flask.views.View.as_view`.
+
+    """
+    app = Flask(__name__)
+    manager = APIManager(app, session=session)
+    if per_request:
+        API.as_view = classmethod(View.as_view.__func__)
+    try:
+        manager.create_api(Person, exclude_columns=['computers.name'],
+                           preprocessors=dict(GET_SINGLE=[lambda **kw: None]),
+                           postprocessors=dict(PUT_SINGLE=[lambda **kw: None]))
+    finally:
+        if per_request:
+            del API.as_view
+    return app.test_client()
+
+
+def main():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine))
+    person = Person(name=u'Jeffrey', age=24)
+    person.computers = [Computer(name=u'lixeiro')]
+    session.add(person)
+    session.commit()
+    timings = []
+    for name, per_request in ('per-request', True), ('shared', False):
+        client = make_client(session, per_request)
+
+        def get():
+            client.get('/api/person/1')
+
+        # Make the first request outside of the timed loop.
+        get()
+        seconds = min(timeit.repeat(get, number=REQUESTS, repeat=ROUNDS))
+        usec = seconds / REQUESTS * 1e6
+        timings.append(usec)
+        print('{0:>11}: {1:8.1f} usec/request'.format(name, usec))
+    saved = timings[0] - timings[1]
+    print('{0:>11}: {1:8.1f} usec/request'.format('saved', saved))
+
+
+if __name__ == '__main__':
+    main()
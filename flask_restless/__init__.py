@@ -20,6 +20,7 @@
 __version__ = '0.17.1-dev'
 
 # make the following names available as part of the public API
+from .helpers import JSONBackend
 from .helpers import url_for
 from .manager import APIManager
 from .manager import IllegalArgumentError
@@ -9,27 +9,82 @@
     :license: GNU AGPLv3+ or BSD
 
 """
+from collections import defaultdict
 import datetime
+import decimal
+from functools import wraps
 import inspect
+import itertools
+import json
+import numbers
+from operator import attrgetter
+from operator import eq
+from operator import itemgetter
+import threading
+import time
 import uuid
+try:
+    from queue import Empty
+    from queue import Queue
+except ImportError:
+    from Queue import Empty
+    from Queue import Queue
 
 from dateutil.parser import parse as parse_datetime
+from sqlalchemy import and_
+from sqlalchemy import Boolean
+from sqlalchemy import case
+from sqlalchemy import Column
 from sqlalchemy import Date
 from sqlalchemy import DateTime
+from sqlalchemy import event
+from sqlalchemy import Float
+from sqlalchemy import Integer
 from sqlalchemy import Interval
+from sqlalchemy import Numeric
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy import Table
+from sqlalchemy import Time
 from sqlalchemy.exc import NoInspectionAvailable
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.associationproxy import AssociationProxy
 from sqlalchemy.ext import hybrid
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy import orm
 from sqlalchemy.orm import ColumnProperty
+from sqlalchemy.orm import Mapper
 from sqlalchemy.orm import RelationshipProperty as RelProperty
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm.attributes import QueryableAttribute
+from sqlalchemy.orm.exc import UnmappedColumnError
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.orm.interfaces import ONETOMANY
 from sqlalchemy.orm.query import Query
 from sqlalchemy.sql import func
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.expression import ClauseElement
 from sqlalchemy.sql.expression import ColumnElement
 from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+try:
+    from sqlalchemy.orm.decl_base import _declarative_constructor
+except ImportError:
+    from sqlalchemy.ext.declarative.base import _declarative_constructor
+# The constructs for dialect-native upserts, which are not available in older
+# versions of SQLAlchemy.
+try:
+    from sqlalchemy.dialects.mysql import insert as mysql_insert
+except ImportError:
+    mysql_insert = None
+try:
+    from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+except ImportError:
+    postgresql_insert = None
+try:
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+except ImportError:
+    sqlite_insert = None
 
 #: Names of attributes which should definitely not be considered relations when
 #: dynamically computing a list of relations of a SQLAlchemy model.
@@ -50,6 +105,103 @@ COLUMN_TYPES = (InstrumentedAttribute, hybrid_property)
 #: value of the field.
 CURRENT_TIME_MARKERS = ('CURRENT_TIMESTAMP', 'CURRENT_DATE', 'LOCALTIMESTAMP')
 
+#: The mapping from name of an operator which the request data of a
+#: :http:method:`patch` request may use to update a column relative to its
+#: current value, as in ``{"views": {"inc": 1}}``, to a function of the column
+#: and the operand which returns the SQL expression of the new value.
+#:
+#: ``'min'`` and ``'max'`` set a column which is ``NULL`` to the operand.
+UPDATE_OPERATORS = {
+    'inc': lambda column, value: column + value,
+    'dec': lambda column, value: column - value,
+    'mul': lambda column, value: column * value,
+    'min': lambda column, value: case([(or_(column.is_(None), column > value),
+                                        value)], else_=column),
+    'max': lambda column, value: case([(or_(column.is_(None), column < value),
+                                        value)], else_=column),
+}
+
+#: Types of columns on which the operators in :data:`UPDATE_OPERATORS` may be
+#: used. :class:`~sqlalchemy.types.Float` is a subclass of
+#: :class:`~sqlalchemy.types.Numeric`.
+_NUMERIC_COLUMN_TYPES = (Integer, Numeric)
+
+#: Types of columns whose values can never be objects, so that an operator
+#: object given as the value of such a column is an error. The values of
+#: columns of other types, like JSON or pickled columns, may be objects which
+#: happen to look like operator objects.
+_SCALAR_COLUMN_TYPES = (Boolean, Date, DateTime, Interval, String, Time)
+
+#: The mapping from name of a relation loading strategy (as accepted by the
+#: ``loading_strategies`` keyword argument to
+#: :meth:`flask.ext.restless.APIManager.create_api`) to the name of the
+#: corresponding SQLAlchemy loader option.
+#:
+#: ``'selectin'`` requires SQLAlchemy 1.2 or later; on earlier versions, it
+#: falls back to ``'subquery'``.
+LOADING_STRATEGIES = {
+    'joined': 'joinedload',
+    'selectin': ('selectinload' if hasattr(orm, 'selectinload')
+                 else 'subqueryload'),
+    'subquery': 'subqueryload',
+    'select': 'lazyload',
+}
+
+#: The registry of metadata about models computed by the functions decorated
+#: with :func:`model_metadata`, keyed by the function, the model, and the
+#: remaining arguments of the function.
+_model_metadata = {}
+
+#: Lock which serializes modifications of :data:`_model_metadata`.
+_model_metadata_lock = threading.Lock()
+
+#: A list containing the number of times :data:`_model_metadata` has been
+#: cleared, so that metadata computed while mappers were being configured is
+#: not registered.
+_model_metadata_generation = [0]
+
+
+def model_metadata(func):
+    """Decorator which memoizes `func`, a function whose first argument is a
+    model and whose remaining arguments are hashable, in the metadata
+    registry.
+
+    The registry is cleared whenever SQLAlchemy finishes configuring mappers,
+    since configuring a mapper may add attributes, like backrefs, to other
+    models. The value returned by `func` is shared by all callers, so it must
+    not be modified.
+
+    """
+    @wraps(func)
+    def wrapper(model, *args):
+        key = (func, model) + args
+        try:
+            return _model_metadata[key]
+        except KeyError:
+            pass
+        generation = _model_metadata_generation[0]
+        result = func(model, *args)
+        with _model_metadata_lock:
+            # Inspecting the model may have caused the mappers to be
+            # configured, in which case `result` may already be out of date.
+            if generation == _model_metadata_generation[0]:
+                _model_metadata[key] = result
+        return result
+    return wrapper
+
+
+@event.listens_for(Mapper, 'after_configured')
+def clear_model_metadata():
+    """Clears the metadata registry used by functions decorated with
+    :func:`model_metadata`.
+
+    This function is called automatically after SQLAlchemy configures mappers.
+
+    """
+    with _model_metadata_lock:
+        _model_metadata.clear()
+        _model_metadata_generation[0] += 1
+
 
 def partition(l, condition):
     """Returns a pair of lists, the left one containing all elements of `l` for
@@ -92,6 +244,7 @@ def upper_keys(d):
     return dict(zip((k.upper() for k in d.keys()), d.values()))
 
 
+@model_metadata
 def get_columns(model):
     """Returns a dictionary-like object containing all the columns of the
     specified `model` class.
@@ -109,17 +262,42 @@ def get_columns(model):
     return columns
 
 
+@model_metadata
 def get_relations(model):
     """Returns a list of relation names of `model` (as a list of strings)."""
-    return [k for k in dir(model)
-            if not (k.startswith('__') or k in RELATION_BLACKLIST)
-            and get_related_model(model, k)]
+    related_models = _related_models(model)
+    return [k for k in dir(model) if k in related_models]
+
+
+@model_metadata
+def _related_models(model):
+    """Returns a dictionary mapping the name of each relation of `model` to
+    the class of the model to which it is related.
+
+    """
+    result = {}
+    for name in dir(model):
+        if not (name.startswith('__') or name in RELATION_BLACKLIST):
+            related_model = _get_related_model(model, name)
+            if related_model:
+                result[name] = related_model
+    return result
 
 
 def get_related_model(model, relationname):
     """Gets the class of the model to which `model` is related by the attribute
     whose name is `relationname`.
 
+    """
+    # Register the relations of the model as a whole, so that looking up
+    # arbitrary names, as given by clients, does not grow the registry.
+    return _related_models(model).get(relationname)
+
+
+def _get_related_model(model, relationname):
+    """Same as :func:`get_related_model`, but without using the metadata
+    registry.
+
     """
     if hasattr(model, relationname):
         attr = getattr(model, relationname)
@@ -156,6 +334,7 @@ def has_field(model, fieldname):
     return hasattr(model, fieldname)
 
 
+@model_metadata
 def get_field_type(model, fieldname):
     """Helper which returns the SQLAlchemy type of the field.
 
@@ -209,6 +388,7 @@ def assign_attributes(model, **kwargs):
         setattr(model, field, value)
 
 
+@model_metadata
 def primary_key_names(model):
     """Returns all the primary keys for a model."""
     return [key for key, field in inspect.getmembers(model)
@@ -241,15 +421,24 @@ def is_like_list(instance, relation):
     relation, or it is a dynamically loaded one-to-many.
 
     """
-    if relation in instance._sa_class_manager:
-        return instance._sa_class_manager[relation].property.uselist
-    elif hasattr(instance, relation):
-        attr = getattr(instance._sa_instance_state.class_, relation)
-        if hasattr(attr, 'property'):
-            return attr.property.uselist
-    related_value = getattr(type(instance), relation, None)
-    if isinstance(related_value, AssociationProxy):
-        local_prop = related_value.local_attr.prop
+    return _is_like_list(type(instance), relation)
+
+
+def _is_like_list(model, relation):
+    """Returns ``True`` if and only if the relation of the `model` class whose
+    name is `relation` is list-like.
+
+    This is the same as :func:`is_like_list`, but it only inspects the class,
+    so it never causes a relation to be loaded from the database.
+
+    """
+    if relation in model._sa_class_manager:
+        return model._sa_class_manager[relation].property.uselist
+    attr = getattr(model, relation, None)
+    if hasattr(attr, 'property'):
+        return attr.property.uselist
+    if isinstance(attr, AssociationProxy):
+        local_prop = attr.local_attr.prop
         if isinstance(local_prop, RelProperty):
             return local_prop.uselist
     return False
@@ -267,6 +456,446 @@ def is_mapped_class(cls):
         return False
 
 
+#: A cache of the results of :func:`is_mapped_class` for the types of values
+#: encountered while serializing instances in :func:`to_dict`.
+_mapped_types = {}
+
+
+def _is_mapped_type(cls):
+    """Same as :func:`is_mapped_class`, but the result is memoized."""
+    try:
+        return _mapped_types[cls]
+    except KeyError:
+        result = _mapped_types[cls] = is_mapped_class(cls)
+        return result
+
+
+def _isoformat(value):
+    """Converts the value of a date, time, or datetime column to an ISO 8601
+    string.
+
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _to_serializable(value):
+    """Converts `value` to a representation that can be serialized to JSON
+    without special JSON encoder behavior, if necessary.
+
+    Datetime objects are converted to ISO 8601 format and UUID objects are
+    converted to hexadecimal strings. Other values are returned unchanged.
+
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+#: The types of values which are never instances of mapped classes, so that
+#: :func:`_to_serializable_nested` need not inspect their types.
+_SCALAR_TYPES = (bool, numbers.Number, type(u''), bytes)
+
+
+def _to_serializable_nested(value):
+    """Same as :func:`_to_serializable`, but also converts instances of
+    SQLAlchemy models to their dictionary representation.
+
+    This is used for the values of fields which are not columns, like hybrid
+    properties and included methods, which may return arbitrary objects.
+
+    """
+    if isinstance(value, _SCALAR_TYPES):
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if _is_mapped_type(type(value)):
+        return to_dict(value)
+    return value
+
+
+def encode_native_types(value):
+    """Converts `value`, an object of a type which JSON encoders do not know
+    how to encode, to a representation that can be serialized to JSON.
+
+    This function is suitable as the ``default`` argument of
+    :func:`json.dumps` and of most other JSON encoders. Datetime objects are
+    converted to ISO 8601 format and UUID objects are converted to hexadecimal
+    strings, just as in :func:`to_dict`. For any other object, this function
+    raises :exc:`TypeError`.
+
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError('{0!r} is not JSON serializable'.format(value))
+
+
+class JSONBackend(object):
+    """Encodes and decodes the JSON documents of requests and responses.
+
+    `dumps` is a function which returns the JSON representation of a Python
+    object, either as a string or as bytes encoded in UTF-8. `loads` is a
+    function which returns the Python object represented by a JSON string; it
+    must raise :exc:`ValueError` (or a subclass) if the string is not valid
+    JSON. For example, to use the standard library::
+
+        import json
+
+        backend = JSONBackend(json.dumps, json.loads)
+
+    If `native_types` is ``True``, `dumps` must itself encode
+    :class:`datetime.datetime`, :class:`datetime.date`,
+    :class:`datetime.time`, and :class:`uuid.UUID` objects, exactly as
+    :func:`encode_native_types` does, so instances of models need not be
+    converted before they are encoded.
+
+    If `adapt` is ``True``, `dumps` is called with the keyword argument
+    ``default=encode_native_types``, which teaches encoders that accept such
+    an argument, like :func:`json.dumps`, to encode these types; this implies
+    `native_types`.
+
+    """
+
+    def __init__(self, dumps, loads, native_types=False, adapt=False):
+        if adapt:
+            encode = dumps
+
+            def dumps(obj):
+                return encode(obj, default=encode_native_types)
+
+            native_types = True
+        self._dumps = dumps
+        self._loads = loads
+        #: Whether the encoder of this backend encodes dates, times, and UUIDs
+        #: itself.
+        self.native_types = native_types
+
+    def dumps(self, obj):
+        """Returns the JSON representation of `obj` as a string."""
+        result = self._dumps(obj)
+        if isinstance(result, bytes):
+            result = result.decode('utf-8')
+        return result
+
+    def encode(self, obj):
+        """Returns the JSON representation of `obj` as bytes encoded in
+        UTF-8.
+
+        """
+        result = self._dumps(obj)
+        if not isinstance(result, bytes):
+            result = result.encode('utf-8')
+        return result
+
+    def loads(self, data):
+        """Returns the Python object represented by the JSON document `data`,
+        which may be either a string or bytes encoded in UTF-8.
+
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return self._loads(data)
+
+
+#: Types of columns whose values need no conversion before being serialized to
+#: JSON.
+_PLAIN_COLUMN_TYPES = (Boolean, Float, Integer, String)
+
+#: Types of columns whose values are converted to ISO 8601 strings before
+#: being serialized to JSON.
+_DATE_COLUMN_TYPES = (Date, DateTime, Time)
+
+
+def _column_converter(prop):
+    """Returns the function which converts the value of the column specified
+    by the :class:`~sqlalchemy.orm.ColumnProperty` `prop` to a serializable
+    value, or ``None`` if the values of that column need no conversion.
+
+    """
+    columntype = prop.columns[0].type
+    if isinstance(columntype, _DATE_COLUMN_TYPES):
+        return _isoformat
+    if isinstance(columntype, _PLAIN_COLUMN_TYPES):
+        return None
+    return _to_serializable
+
+
+def _call_method(name):
+    """Returns a function which gets the attribute named `name` from an
+    instance, calling it if it is callable.
+
+    This allows properties and static attributes in ``include_methods``.
+
+    """
+    def getter(instance):
+        value = getattr(instance, name)
+        if callable(value):
+            value = value()
+        return value
+    return getter
+
+
+def _freeze(value):
+    """Returns a hashable version of `value`, a (possibly nested) structure of
+    dictionaries, lists, and strings, for use as part of a cache key.
+
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class SerializationPlan(object):
+    """A precomputed plan for converting instances of a SQLAlchemy model to
+    dictionaries, as described in :func:`to_dict`.
+
+    Instances of this class should not be created directly; use
+    :func:`serialization_plan` instead, which returns cached plans.
+
+    The constructor inspects the mapper of `model` exactly once and computes
+    the ordered tuple of fields to serialize, along with the function which
+    converts the value of each field to a JSON-serializable value. Calling the
+    plan on an instance of `model` returns the dictionary representation of
+    that instance.
+
+    The remaining arguments are the same as the arguments of
+    :func:`serialization_plan`.
+
+    """
+
+    def __init__(self, model, deep=None, exclude=None, include=None,
+                 exclude_relations=None, include_relations=None,
+                 include_methods=None, native_types=False):
+        if (exclude is not None or exclude_relations is not None) and \
+                (include is not None or include_relations is not None):
+            raise ValueError('Cannot specify both include and exclude.')
+        self.model = model
+        # This raises NoInspectionAvailable if `model` is not a mapped class.
+        inspected = sqlalchemy_inspect(model)
+        deep = deep or {}
+        # Compute the names of columns, including hybrid properties.
+        column_props = [(prop.key, prop) for prop in inspected.column_attrs]
+        hybrid_columns = [k for k, d in inspected.all_orm_descriptors.items()
+                          if d.extension_type == hybrid.HYBRID_PROPERTY
+                          and k not in deep]
+        column_names = set(k for k, prop in column_props)
+
+        def wanted(name):
+            if name.startswith('__') or name in COLUMN_BLACKLIST:
+                return False
+            if exclude is not None:
+                return name not in exclude
+            if include is not None:
+                return name in include
+            return True
+
+        fields = []
+        for name, prop in column_props:
+            if wanted(name):
+                converter = None if native_types else _column_converter(prop)
+                fields.append((name, attrgetter(name), converter))
+        for name in hybrid_columns:
+            if wanted(name):
+                fields.append((name, attrgetter(name),
+                               _to_serializable_nested))
+        # Included methods override columns of the same name.
+        for method in include_methods or ():
+            if '.' not in method:
+                if method in column_names:
+                    converter = None if native_types else _to_serializable
+                else:
+                    converter = _to_serializable_nested
+                fields = [f for f in fields if f[0] != method]
+                fields.append((method, _call_method(method), converter))
+        #: The ordered tuple of triples of the form ``(name, getter,
+        #: converter)``, one for each field of the model to serialize.
+        self.fields = tuple(fields)
+        # Determine the plans for each of the `deep` relations.
+        relations = []
+        for relation, rdeep in deep.items():
+            # Determine the included and excluded fields for the related model.
+            newexclude = None
+            newinclude = None
+            if exclude_relations is not None and relation in exclude_relations:
+                newexclude = exclude_relations[relation]
+            elif (include_relations is not None and
+                  relation in include_relations):
+                newinclude = include_relations[relation]
+            # Determine the included methods for the related model.
+            newmethods = None
+            if include_methods is not None:
+                newmethods = [method.split('.', 1)[1]
+                              for method in include_methods
+                              if method.split('.', 1)[0] == relation]
+            args = (rdeep, newexclude, newinclude, None, None, newmethods,
+                    native_types)
+            relations.append((relation, _is_like_list(model, relation), args,
+                              {}))
+        #: The tuple of the form ``(name, is_list, args, plans)``, one for each
+        #: relation to serialize, where ``args`` are the arguments to
+        #: :func:`serialization_plan` for the related model and ``plans`` is a
+        #: cache mapping the type of a related instance to its plan.
+        self.relations = tuple(relations)
+        self._args = (deep, exclude, include, exclude_relations,
+                      include_relations, include_methods, native_types)
+        self._methods = frozenset(m for m in include_methods or ()
+                                  if '.' not in m)
+        self._sql_columns = None
+
+    def sql_columns(self):
+        """Returns the list of SQL expressions which, when selected in that
+        order, yield the values of the fields of this plan, or ``None`` if
+        some field cannot be computed in SQL.
+
+        This is the case if the plan serializes any relations, included
+        methods, or hybrid properties (whose SQL expressions need not compute
+        the same values as their Python implementations), or if the model has
+        subclasses, whose instances may have more fields than the model itself.
+
+        The rows returned by a query for these expressions can be converted
+        to dictionaries by :meth:`serialize_row`.
+
+        """
+        if self._sql_columns is None:
+            self._sql_columns = self._compute_sql_columns() or False
+        return self._sql_columns or None
+
+    def _compute_sql_columns(self):
+        if self.relations or self._methods:
+            return None
+        if len(sqlalchemy_inspect(self.model).self_and_descendants) > 1:
+            return None
+        columns = []
+        for name, getter, converter in self.fields:
+            column = getattr(self.model, name, None)
+            if not isinstance(column, QueryableAttribute) or \
+                    not isinstance(column.property, ColumnProperty):
+                return None
+            columns.append(column)
+        return columns
+
+    def serialize_row(self, row):
+        """Returns the dictionary representation of `row`, a row returned by
+        a query for the expressions returned by :meth:`sql_columns`.
+
+        Any values in `row` beyond those expressions are ignored.
+
+        """
+        result = {}
+        for (name, getter, converter), value in zip(self.fields, row):
+            if converter is not None and value is not None:
+                value = converter(value)
+            result[name] = value
+        return result
+
+    def __call__(self, instance):
+        """Returns the dictionary representation of `instance`."""
+        # If the instance is of a subclass of the model of this plan (for
+        # example, in the case of polymorphic inheritance), use the plan for
+        # that subclass instead.
+        instance_type = type(instance)
+        if instance_type is not self.model:
+            plan = serialization_plan(instance_type, *self._args)
+            return plan(instance)
+        result = {}
+        for name, getter, converter in self.fields:
+            value = getter(instance)
+            if converter is not None and value is not None:
+                value = converter(value)
+            result[name] = value
+        for relation, is_list, args, plans in self.relations:
+            # Get the related value so we can see if it is None, a list, a
+            # query (as specified by a dynamic relationship loader), or an
+            # actual instance of a model.
+            relatedvalue = getattr(instance, relation)
+            if relatedvalue is None:
+                result[relation] = None
+                continue
+            if is_list:
+                result[relation] = [_serialize_related(inst, args, plans)
+                                    for inst in relatedvalue]
+                continue
+            # If the related value is dynamically loaded, resolve the query to
+            # get the single instance.
+            if isinstance(relatedvalue, Query):
+                relatedvalue = relatedvalue.one()
+            result[relation] = _serialize_related(relatedvalue, args, plans)
+        return result
+
+
+def _serialize_related(value, args, plans):
+    """Returns the dictionary representation of `value`, an instance related
+    to an instance being serialized by a :class:`SerializationPlan`.
+
+    `args` are the arguments to :func:`serialization_plan` for the related
+    instance and `plans` is a dictionary in which the plan for each type of
+    related instance is cached. If `value` is not an instance of a mapped
+    class (for example, it is the value of an association proxy to a scalar
+    attribute), it is returned unchanged.
+
+    """
+    if isinstance(value, _SCALAR_TYPES):
+        return value
+    value_type = type(value)
+    try:
+        plan = plans[value_type]
+    except KeyError:
+        try:
+            plan = serialization_plan(value_type, *args)
+        except NoInspectionAvailable:
+            plan = None
+        plans[value_type] = plan
+    if plan is None:
+        return value
+    return plan(value)
+
+
+#: A cache of the serialization plans computed by :func:`serialization_plan`,
+#: keyed by the model and the (frozen) arguments with which they were created.
+_serialization_plans = {}
+
+
+def serialization_plan(model, deep=None, exclude=None, include=None,
+                       exclude_relations=None, include_relations=None,
+                       include_methods=None, native_types=False):
+    """Returns the :class:`SerializationPlan` for instances of `model` with the
+    specified arguments, creating it if necessary.
+
+    The arguments are the same as the keyword arguments of :func:`to_dict`,
+    except `native_types`. If `native_types` is ``True``, the values of
+    columns are left as they are, instead of converting dates, times, and
+    UUIDs to strings, for use with a :class:`JSONBackend` which encodes these
+    types itself.
+
+    Plans are cached, so the mapper of `model` is inspected only once for each
+    distinct combination of arguments. If `model` is not a mapped class, this
+    function raises :exc:`sqlalchemy.exc.NoInspectionAvailable`.
+
+    """
+    key = (model, _freeze(deep), _freeze(exclude), _freeze(include),
+           _freeze(exclude_relations), _freeze(include_relations),
+           _freeze(include_methods), native_types)
+    try:
+        return _serialization_plans[key]
+    except KeyError:
+        plan = SerializationPlan(model, deep, exclude, include,
+                                 exclude_relations, include_relations,
+                                 include_methods, native_types)
+        _serialization_plans[key] = plan
+        return plan
+
+
 # This code was adapted from :meth:`elixir.entity.Entity.to_dict` and
 # http://stackoverflow.com/q/1958219/108197.
 def to_dict(instance, deep=None, exclude=None, include=None,
@@ -310,87 +939,19 @@ def to_dict(instance, deep=None, exclude=None, include=None,
     `include_methods` is a list mapping strings to method names which will
     be called and their return values added to the returned dictionary.
 
+    This function uses the cached :class:`SerializationPlan` for the type of
+    `instance` and the specified arguments (see :func:`serialization_plan`).
+    Code which serializes many instances with the same arguments should get
+    the plan once and call it directly.
+
     """
-    if (exclude is not None or exclude_relations is not None) and \
-            (include is not None or include_relations is not None):
-        raise ValueError('Cannot specify both include and exclude.')
-    # create a list of names of columns, including hybrid properties
-    instance_type = type(instance)
-    columns = []
     try:
-        inspected_instance = sqlalchemy_inspect(instance_type)
-        column_attrs = inspected_instance.column_attrs.keys()
-        descriptors = inspected_instance.all_orm_descriptors.items()
-        hybrid_columns = [k for k, d in descriptors
-                          if d.extension_type == hybrid.HYBRID_PROPERTY
-                          and not (deep and k in deep)]
-        columns = column_attrs + hybrid_columns
+        plan = serialization_plan(type(instance), deep, exclude, include,
+                                  exclude_relations, include_relations,
+                                  include_methods)
     except NoInspectionAvailable:
         return instance
-    # filter the columns based on exclude and include values
-    if exclude is not None:
-        columns = (c for c in columns if c not in exclude)
-    elif include is not None:
-        columns = (c for c in columns if c in include)
-    # create a dictionary mapping column name to value
-    result = dict((col, getattr(instance, col)) for col in columns
-                  if not (col.startswith('__') or col in COLUMN_BLACKLIST))
-    # add any included methods
-    if include_methods is not None:
-        for method in include_methods:
-            if '.' not in method:
-                value = getattr(instance, method)
-                # Allow properties and static attributes in include_methods
-                if callable(value):
-                    value = value()
-                result[method] = value
-    # Check for objects in the dictionary that may not be serializable by
-    # default. Convert datetime objects to ISO 8601 format, convert UUID
-    # objects to hexadecimal strings, etc.
-    for key, value in result.items():
-        if isinstance(value, (datetime.date, datetime.time)):
-            result[key] = value.isoformat()
-        elif isinstance(value, uuid.UUID):
-            result[key] = str(value)
-        elif key not in column_attrs and is_mapped_class(type(value)):
-            result[key] = to_dict(value)
-    # recursively call _to_dict on each of the `deep` relations
-    deep = deep or {}
-    for relation, rdeep in deep.items():
-        # Get the related value so we can see if it is None, a list, a query
-        # (as specified by a dynamic relationship loader), or an actual
-        # instance of a model.
-        relatedvalue = getattr(instance, relation)
-        if relatedvalue is None:
-            result[relation] = None
-            continue
-        # Determine the included and excluded fields for the related model.
-        newexclude = None
-        newinclude = None
-        if exclude_relations is not None and relation in exclude_relations:
-            newexclude = exclude_relations[relation]
-        elif (include_relations is not None and
-              relation in include_relations):
-            newinclude = include_relations[relation]
-        # Determine the included methods for the related model.
-        newmethods = None
-        if include_methods is not None:
-            newmethods = [method.split('.', 1)[1] for method in include_methods
-                          if method.split('.', 1)[0] == relation]
-        if is_like_list(instance, relation):
-            result[relation] = [to_dict(inst, rdeep, exclude=newexclude,
-                                        include=newinclude,
-                                        include_methods=newmethods)
-                                for inst in relatedvalue]
-            continue
-        # If the related value is dynamically loaded, resolve the query to get
-        # the single instance.
-        if isinstance(relatedvalue, Query):
-            relatedvalue = relatedvalue.one()
-        result[relation] = to_dict(relatedvalue, rdeep, exclude=newexclude,
-                                   include=newinclude,
-                                   include_methods=newmethods)
-    return result
+    return plan(instance)
 
 
 def evaluate_functions(session, model, functions):
@@ -482,20 +1043,488 @@ def query_by_primary_key(session, model, primary_key_value, primary_key=None):
     return query.filter(getattr(model, pk_name) == primary_key_value)
 
 
-def get_by(session, model, primary_key_value, primary_key=None):
+def get_by(session, model, primary_key_value, primary_key=None,
+           options=None):
     """Returns the first instance of `model` whose primary key has the value
     `primary_key_value`, or ``None`` if no such instance exists.
 
     If `primary_key` is specified, the column specified by that string is used
     as the primary key column. Otherwise, the column named ``id`` is used.
 
+    `options` is a list of query options, like those returned by
+    :func:`loader_options`, to apply to the query.
+
     """
     result = query_by_primary_key(session, model, primary_key_value,
                                   primary_key)
+    if options:
+        result = result.options(*options)
     return result.first()
 
 
-def get_or_create(session, model, attrs):
+def _default_loading_strategy(prop):
+    """Returns the name of the loading strategy to use for the relationship
+    specified by the :class:`~sqlalchemy.orm.RelationshipProperty` `prop`
+    when no strategy has been specified by the user.
+
+    Scalar relations (many-to-one and one-to-one) are loaded in the same
+    query via a join, since the join adds at most one row per instance.
+    Collections are loaded in a single additional query per relation, which
+    does not multiply the number of rows in the main query.
+
+    """
+    return 'selectin' if prop.uselist else 'joined'
+
+
+def _hybrid_dependencies(mapper, name):
+    """Returns the set of names of the column attributes of the model of
+    `mapper` which are used by the hybrid property called `name`, or ``None``
+    if they cannot be determined.
+
+    The dependencies are determined from the SQL expression of the hybrid
+    property at the class level, so they are correct as long as the Python
+    implementation of the property uses the same columns as its SQL
+    expression.
+
+    """
+    try:
+        expression = getattr(mapper.class_, name)
+    except Exception:
+        return None
+    if not isinstance(expression, ClauseElement):
+        # The hybrid property evaluates to a constant at the class level.
+        return set()
+    keys = set()
+    # Visit only the columns which appear in the expression, not every column
+    # of the tables from which it selects.
+    options = {'column_collections': False}
+    for element in visitors.iterate(expression, options):
+        if isinstance(element, Column):
+            try:
+                keys.add(mapper.get_property_by_column(element).key)
+            except UnmappedColumnError:
+                # The column belongs to some other table.
+                pass
+    return keys
+
+
+def projected_columns(model, deep=None, exclude=None, include=None,
+                      include_methods=None):
+    """Returns the list of names of the column attributes of `model` which
+    must be loaded from the database in order to serialize instances of
+    `model` with :func:`to_dict` using the specified arguments, or ``None`` if
+    all columns must be loaded.
+
+    Besides the columns which appear in the dictionary representation, the
+    primary key, the foreign keys of relationships, the polymorphic
+    discriminator, the version counter, and the columns used by the hybrid
+    properties which appear in the dictionary representation are always
+    loaded. Since included methods are arbitrary Python code, all columns are
+    loaded if there are any included methods.
+
+    The arguments are the same as the keyword arguments of :func:`to_dict`.
+
+    """
+    if exclude is None and include is None:
+        return None
+    if any('.' not in method for method in include_methods or ()):
+        return None
+    mapper = sqlalchemy_inspect(model)
+    deep = deep or {}
+
+    def wanted(name):
+        if exclude is not None:
+            return name not in exclude
+        return name in include
+
+    keys = [prop.key for prop in mapper.column_attrs]
+    needed = set(key for key in keys if wanted(key))
+    required = set(mapper.primary_key)
+    for column in mapper.polymorphic_on, mapper.version_id_col:
+        if column is not None:
+            required.add(column)
+    for relationship in mapper.relationships:
+        required.update(relationship.local_columns)
+    for column in required:
+        try:
+            needed.add(mapper.get_property_by_column(column).key)
+        except UnmappedColumnError:
+            pass
+    for name, descriptor in mapper.all_orm_descriptors.items():
+        if descriptor.extension_type == hybrid.HYBRID_PROPERTY \
+                and name not in deep and wanted(name):
+            dependencies = _hybrid_dependencies(mapper, name)
+            if dependencies is None:
+                return None
+            needed |= dependencies
+    if needed.issuperset(keys):
+        return None
+    return [key for key in keys if key in needed]
+
+
+def loader_options(model, deep, strategies=None, exclude=None, include=None,
+                   exclude_relations=None, include_relations=None,
+                   include_methods=None, _parent=None, _path=''):
+    """Returns a list of SQLAlchemy loader options which eagerly load each of
+    the relations of `model` that will be serialized by :func:`to_dict`, and
+    which load only the columns that will be serialized.
+
+    `deep` has the same form as the `deep` argument to :func:`to_dict`; each
+    relation named as a key is loaded eagerly, and each nested dictionary
+    describes the relations to load on the related model.
+
+    `strategies` is a dictionary mapping a relation name to the name of the
+    strategy to use when loading it, one of the keys of
+    :data:`LOADING_STRATEGIES`. Relations of related models are named by
+    joining the relation names with a dot, as in ``'computers.owner'``. By
+    default, collections are loaded with ``'selectin'`` and scalar relations
+    with ``'joined'``.
+
+    The remaining arguments are the same as the keyword arguments of
+    :func:`to_dict`. Columns of `model` and of related models which will not
+    be serialized are not loaded at all, as determined by
+    :func:`projected_columns`.
+
+    Dynamic relationships (``lazy='dynamic'``) cannot be loaded eagerly, so
+    they are ignored. Association proxies cause the underlying relationships
+    to be loaded.
+
+    """
+    strategies = strategies or {}
+    options = []
+    columns = projected_columns(model, deep, exclude, include,
+                                include_methods)
+    if columns is not None:
+        if _parent is None:
+            options.append(orm.load_only(*columns))
+        else:
+            options.append(_parent.load_only(*columns))
+    for relation, rdeep in (deep or {}).items():
+        attr = getattr(model, relation, None)
+        remote_attr = None
+        if isinstance(attr, AssociationProxy):
+            attr, remote_attr = attr.local_attr, attr.remote_attr
+        if not isinstance(getattr(attr, 'property', None), RelProperty):
+            continue
+        prop = attr.property
+        if prop.lazy == 'dynamic':
+            continue
+        path = _path + relation
+        strategy = strategies.get(path, _default_loading_strategy(prop))
+        loadername = LOADING_STRATEGIES[strategy]
+        if _parent is None:
+            option = getattr(orm, loadername)(attr)
+        else:
+            option = getattr(_parent, loadername)(attr)
+        if remote_attr is not None:
+            # The fields of the instances at the end of an association proxy
+            # are not restricted to the columns of the underlying relation.
+            remote_prop = getattr(remote_attr, 'property', None)
+            if isinstance(remote_prop, RelProperty) \
+                    and remote_prop.lazy != 'dynamic':
+                remote_strategy = _default_loading_strategy(remote_prop)
+                loadername = LOADING_STRATEGIES[remote_strategy]
+                option = getattr(option, loadername)(remote_attr)
+            options.append(option)
+            continue
+        options.append(option)
+        # Determine the included and excluded fields for the related model,
+        # in the same way as :class:`SerializationPlan`.
+        newexclude = None
+        newinclude = None
+        if exclude_relations is not None and relation in exclude_relations:
+            newexclude = exclude_relations[relation]
+        elif include_relations is not None and relation in include_relations:
+            newinclude = include_relations[relation]
+        newmethods = None
+        if include_methods is not None:
+            newmethods = [method.split('.', 1)[1]
+                          for method in include_methods
+                          if method.split('.', 1)[0] == relation]
+        options.extend(loader_options(prop.mapper.class_, rdeep, strategies,
+                                      newexclude, newinclude, None, None,
+                                      newmethods, option, path + '.'))
+    return options
+
+
+def _bulk_columns(model, events):
+    """Returns the set of names of the columns of `model`, or ``None`` if the
+    model has validators or listeners for any of the mapper events named in
+    `events`, which bulk operations would bypass.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    if mapper.validators:
+        return None
+    if any(getattr(mapper.dispatch, event_name) for event_name in events):
+        return None
+    return frozenset(prop.key for prop in mapper.column_attrs)
+
+
+@model_metadata
+def bulk_insert_columns(model):
+    """Returns the set of names of the columns of `model` which may be given
+    to :meth:`sqlalchemy.orm.session.Session.bulk_insert_mappings`, or
+    ``None`` if instances of `model` must be created through the ORM.
+
+    Bulk inserts bypass the constructor of the model, its validators, and its
+    insert events, so they are only possible if the model uses the default
+    declarative constructor and has neither validators nor insert events.
+    Bulk inserts require SQLAlchemy 1.0 or later.
+
+    """
+    if not hasattr(orm.Session, 'bulk_insert_mappings'):
+        return None
+    mapper = sqlalchemy_inspect(model)
+    if mapper.class_manager.original_init is not _declarative_constructor:
+        return None
+    return _bulk_columns(model, ('before_insert', 'after_insert'))
+
+
+@model_metadata
+def bulk_update_columns(model):
+    """Returns the set of names of the columns of `model` which may be given
+    to :meth:`sqlalchemy.orm.query.Query.update`, or ``None`` if instances of
+    `model` must be updated through the ORM.
+
+    Bulk updates bypass the validators and the update events of the model, so
+    they are only possible if it has neither.
+
+    """
+    return _bulk_columns(model, ('before_update', 'after_update'))
+
+
+@model_metadata
+def bulk_delete_possible(model):
+    """Returns ``True`` if instances of `model` may be deleted by a single
+    ``DELETE`` statement issued through
+    :meth:`sqlalchemy.orm.query.Query.delete`, or ``False`` if they must be
+    deleted through the ORM.
+
+    Bulk deletes bypass the delete events of the model and every cascade the
+    ORM would otherwise perform, so they are only possible if the model is
+    mapped to a single table, has no delete events, and each of its
+    relationships either leaves the related rows untouched or delegates them
+    to the database with ``passive_deletes``.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    if len(mapper.tables) != 1:
+        return False
+    if mapper.dispatch.before_delete or mapper.dispatch.after_delete:
+        return False
+    for prop in mapper.relationships:
+        if prop.viewonly or prop.passive_deletes:
+            continue
+        if prop.direction is not MANYTOONE or prop.cascade.delete:
+            return False
+    return True
+
+
+#: The maximum number of keys in the ``IN`` clause of each statement issued
+#: by :func:`resolve_existing` and :class:`CollectionRows`, which keeps the
+#: number of bound parameters below the limits of databases like SQLite.
+KEY_CHUNK_SIZE = 500
+
+
+def chunks(keys):
+    """Yields the successive lists of at most :data:`KEY_CHUNK_SIZE` elements
+    of the iterable `keys`.
+
+    """
+    keys = list(keys)
+    for start in range(0, len(keys), KEY_CHUNK_SIZE):
+        yield keys[start:start + KEY_CHUNK_SIZE]
+
+
+def _keys_criterion(columns, keys):
+    """Returns the SQL expression which is true for the rows in which the
+    values of `columns` equal one of the tuples in the list `keys`.
+
+    """
+    if len(columns) == 1:
+        return columns[0].in_([key[0] for key in keys])
+    return or_(*[and_(*[column == value
+                        for column, value in zip(columns, key)])
+                 for key in keys])
+
+
+def _identity_key(model, attrs):
+    """Returns the tuple of the primary key values of `model` in the
+    dictionary `attrs`, or ``None`` if `attrs` does not contain all of them or
+    they are not hashable.
+
+    """
+    pk_names = primary_key_names(model)
+    if not all(k in attrs for k in pk_names):
+        return None
+    pk_values = strings_to_dates(model, dict((k, attrs[k]) for k in pk_names))
+    key = tuple(pk_values[k] for k in pk_names)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _collect_identity_keys(model, attrs, keys):
+    """Adds the primary key of the nested dictionary `attrs`, representing an
+    instance of `model`, and those of the dictionaries nested in its relations,
+    to the sets in the dictionary `keys`, keyed by model.
+
+    """
+    if not isinstance(attrs, dict):
+        return
+    for rel in get_relations(model):
+        if rel not in attrs:
+            continue
+        submodel = get_related_model(model, rel)
+        value = attrs[rel]
+        for subattrs in (value if isinstance(value, list) else [value]):
+            _collect_identity_keys(submodel, subattrs, keys)
+    key = _identity_key(model, attrs)
+    if key is not None:
+        keys[model].add(key)
+
+
+def _is_exact_key(model, key):
+    """Returns ``True`` if and only if each value in the tuple `key` of
+    primary key values of `model` is a number for a numeric column.
+
+    The database compares such values exactly, so if no row has the primary
+    key `key`, a query for it would find none either. Other values, like
+    strings, may match a row whose primary key differs, for example by
+    letter case under some collations, or by type.
+
+    """
+    for name, value in zip(primary_key_names(model), key):
+        if not isinstance(get_field_type(model, name), _NUMERIC_COLUMN_TYPES):
+            return False
+        if isinstance(value, bool) or \
+                not isinstance(value, numbers.Number):
+            return False
+    return True
+
+
+def resolve_existing(session, model, payloads):
+    """Returns a dictionary mapping pairs of a model and the tuple of the
+    values of its primary key to the existing instance with that primary key,
+    for each dictionary which specifies a primary key in the list `payloads`
+    of dictionaries representing instances of `model`, including the
+    dictionaries nested in their relations.
+
+    The instances of each model are loaded by a single query (per
+    :data:`KEY_CHUNK_SIZE` primary keys), so the returned dictionary may
+    be given to :func:`get_or_create` to build a graph of related instances
+    without querying the database for each of them. Primary keys which
+    were looked up but certainly do not exist are mapped to ``None``, so that
+    :func:`get_or_create` creates their instances without querying for them
+    again.
+
+    """
+    keys = defaultdict(set)
+    for attrs in payloads:
+        _collect_identity_keys(model, attrs, keys)
+    identity = {}
+    for submodel, pks in keys.items():
+        pk_names = primary_key_names(submodel)
+        instances = get_all_by(session, submodel, pk_names, pks)
+        for key, instance in instances.items():
+            identity[submodel, key] = instance
+        for key in pks:
+            if key not in instances and _is_exact_key(submodel, key):
+                identity[submodel, key] = None
+    return identity
+
+
+def get_all_by(session, model, names, keys):
+    """Returns a dictionary mapping each tuple in `keys` to the instance of
+    `model` whose attributes named in `names` have the values in that tuple,
+    for each such instance which exists.
+
+    The instances are loaded by a single query per :data:`KEY_CHUNK_SIZE`
+    keys.
+
+    """
+    columns = [getattr(model, name) for name in names]
+    result = {}
+    for chunk in chunks(keys):
+        criterion = _keys_criterion(columns, chunk)
+        for instance in session_query(session, model).filter(criterion):
+            key = tuple(getattr(instance, name) for name in names)
+            result[key] = instance
+    return result
+
+
+def bulk_upsert(session, model, mappings, keys):
+    """Inserts a row into the table of `model` for each dictionary in the
+    list `mappings`, which maps names of columns of `model` to values, or
+    updates the columns of the existing row which has the same values of the
+    columns named in `keys`, using a single statement per
+    :data:`KEY_CHUNK_SIZE` values.
+
+    The statement is ``INSERT ... ON CONFLICT DO UPDATE`` on PostgreSQL and
+    SQLite (3.24 or later), and ``INSERT ... ON DUPLICATE KEY UPDATE`` on
+    MySQL, where it updates the row which conflicts on any unique key. The
+    columns named in `keys` must have a unique constraint. These statements
+    require SQLAlchemy 1.1, 1.2, and 1.4 or later, respectively.
+
+    Returns ``False``, without executing any statement, if the database, the
+    version of SQLAlchemy, or `model`, which must be mapped to a single
+    table, does not allow this; otherwise returns ``True``.
+
+    This function does not commit the changes made to the session; the
+    calling function has that responsibility.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    if len(mapper.tables) != 1:
+        return False
+    dialect = session.get_bind(mapper).dialect
+    if dialect.name == 'sqlite' and sqlite_insert is not None:
+        if (dialect.server_version_info or ()) < (3, 24):
+            return False
+        insert = sqlite_insert
+    elif dialect.name == 'postgresql' and postgresql_insert is not None:
+        insert = postgresql_insert
+    elif dialect.name == 'mysql' and mysql_insert is not None:
+        insert = mysql_insert
+    else:
+        return False
+    columns = dict((prop.key, prop.columns[0]) for prop in mapper.column_attrs)
+    index = [columns[name] for name in keys]
+    # A single statement inserts rows which all have the same columns.
+    groups = defaultdict(list)
+    for mapping in mappings:
+        groups[frozenset(mapping)].append(mapping)
+    for names, group in groups.items():
+        update = [columns[name].key for name in names if name not in keys]
+        size = max(1, KEY_CHUNK_SIZE // len(names))
+        for start in range(0, len(group), size):
+            values = [dict((columns[name].key, value)
+                           for name, value in mapping.items())
+                      for mapping in group[start:start + size]]
+            statement = insert(mapper.local_table).values(values)
+            if insert is mysql_insert:
+                # Update a column to its own value if there is nothing else
+                # to update, so that the statement ignores the conflict.
+                update = update or [index[0].key]
+                statement = statement.on_duplicate_key_update(
+                    **dict((name, statement.inserted[name])
+                           for name in update))
+            elif update:
+                statement = statement.on_conflict_do_update(
+                    index_elements=index,
+                    set_=dict((name, statement.excluded[name])
+                              for name in update))
+            else:
+                statement = statement.on_conflict_do_nothing(
+                    index_elements=index)
+            session.execute(statement, mapper=mapper)
+    return True
+
+
+def get_or_create(session, model, attrs, identity=None):
     """Returns the single instance of `model` whose primary key has the
     value found in `attrs`, or initializes a new instance if no primary key
     is specified.
@@ -503,6 +1532,11 @@ def get_or_create(session, model, attrs):
     Before returning the new or existing instance, its attributes are
     assigned to the values supplied in the `attrs` dictionary.
 
+    `identity` is a dictionary of existing instances as returned by
+    :func:`resolve_existing`. If it is not specified, the existing instances
+    referenced by `attrs` and the dictionaries nested in its relations are
+    resolved first, with one query per model.
+
     This method does not commit the changes made to the session; the
     calling function has that responsibility.
 
@@ -511,29 +1545,38 @@ def get_or_create(session, model, attrs):
     # attribute on the remote model.
     if not isinstance(attrs, dict):
         return attrs
+    if identity is None:
+        identity = resolve_existing(session, model, [attrs])
     # Recurse into nested relationships
     for rel in get_relations(model):
         if rel not in attrs:
             continue
+        submodel = get_related_model(model, rel)
         if isinstance(attrs[rel], list):
-            attrs[rel] = [get_or_create(session, get_related_model(model, rel),
-                                        r) for r in attrs[rel]]
+            attrs[rel] = [get_or_create(session, submodel, r, identity)
+                          for r in attrs[rel]]
         else:
-            attrs[rel] = get_or_create(session, get_related_model(model, rel),
-                                       attrs[rel])
+            attrs[rel] = get_or_create(session, submodel, attrs[rel],
+                                       identity)
     # Find private key names
     pk_names = primary_key_names(model)
+    key = _identity_key(model, attrs)
     attrs = strings_to_dates(model, attrs)
     # If all of the primary keys were included in `attrs`, try to update
     # an existing row.
     if all(k in attrs for k in pk_names):
-        # Determine the sub-dictionary of `attrs` which contains the mappings
-        # for the primary keys.
-        pk_values = dict((k, v) for (k, v) in attrs.items()
-                         if k in pk_names)
-        # query for an existing row which matches all the specified
-        # primary key values.
-        instance = session_query(session, model).filter_by(**pk_values).first()
+        instance = identity.get((model, key))
+        # The primary key may not have been resolved if, for example, its
+        # value has a different type than the column; query for it directly.
+        if instance is None and (model, key) not in identity:
+            # Determine the sub-dictionary of `attrs` which contains the
+            # mappings for the primary keys.
+            pk_values = dict((k, v) for (k, v) in attrs.items()
+                             if k in pk_names)
+            # query for an existing row which matches all the specified
+            # primary key values.
+            query = session_query(session, model).filter_by(**pk_values)
+            instance = query.first()
         if instance is not None:
             assign_attributes(instance, **attrs)
             return instance
@@ -542,6 +1585,235 @@ def get_or_create(session, model, attrs):
     return model(**attrs)
 
 
+class CollectionRows(object):
+    """Reads and writes the rows which associate instances of a model with
+    the instances in one of its collections, without loading the collection.
+
+    `mapper` is the mapper of the model. `table` contains the rows: it is the
+    association table of a many-to-many relation, or the table of the related
+    model of a one-to-many relation. `parent_pairs` and `child_pairs` are
+    lists of pairs of the name of an attribute of an instance of the model or
+    of the related model, respectively, and the column of `table` which refers
+    to the value of that attribute.
+
+    If `secondary` is ``True``, rows are inserted into or deleted from the
+    association table. Otherwise, the columns in `child_pairs` are the primary
+    key of the related model, and the foreign key columns in `parent_pairs`
+    are updated instead; `foreign_names` is then the list of the names of the
+    attributes of the related model mapped to those foreign key columns.
+
+    Instances of this class are created by :func:`collection_rows`.
+
+    """
+
+    def __init__(self, mapper, table, parent_pairs, child_pairs, secondary,
+                 foreign_names=None):
+        self.mapper = mapper
+        self.table = table
+        self.parent_pairs = parent_pairs
+        self.child_pairs = child_pairs
+        self.secondary = secondary
+        self.foreign_names = foreign_names
+        self.parent_columns = [column for name, column in parent_pairs]
+        self.child_columns = [column for name, column in child_pairs]
+
+    def parent_key(self, instance):
+        """Returns the tuple of values which identifies `instance`, an
+        instance of the model, in the rows.
+
+        """
+        return tuple(getattr(instance, name) for name, column
+                     in self.parent_pairs)
+
+    def child_key(self, instance):
+        """Returns the tuple of values which identifies `instance`, an
+        instance of the related model, in the rows.
+
+        """
+        return tuple(getattr(instance, name) for name, column
+                     in self.child_pairs)
+
+    def adopt(self, parent, children):
+        """Sets the foreign keys of each of `children`, instances of the
+        related model which are not yet in the database, to refer to the key
+        `parent`, as computed by :meth:`parent_key`.
+
+        The rows of new related instances of a one-to-many relation are
+        thereby inserted already associated with `parent`, so that foreign
+        keys which are not nullable need not be updated after the insert.
+        For many-to-many relations, this does nothing.
+
+        """
+        if self.secondary:
+            return
+        for instance in children:
+            if sqlalchemy_inspect(instance).key is None:
+                for name, value in zip(self.foreign_names, parent):
+                    setattr(instance, name, value)
+
+    def _execute(self, session, statement, params=None):
+        return session.execute(statement, params, mapper=self.mapper)
+
+    def associated(self, session, parents, children=None):
+        """Returns the set of pairs of a key in `parents` and a key in
+        `children` which are associated, as computed by :meth:`parent_key`
+        and :meth:`child_key`.
+
+        If `children` is ``None``, all the related instances of `parents` are
+        included.
+
+        """
+        result = set()
+        columns = self.parent_columns + self.child_columns
+        split = len(self.parent_columns)
+        for parent_chunk in chunks(parents):
+            criterion = _keys_criterion(self.parent_columns, parent_chunk)
+            child_chunks = [None] if children is None else chunks(children)
+            for child_chunk in child_chunks:
+                where = criterion
+                if child_chunk is not None:
+                    where = and_(where, _keys_criterion(self.child_columns,
+                                                        child_chunk))
+                rows = self._execute(session, select(columns).where(where))
+                result.update((tuple(row[:split]), tuple(row[split:]))
+                              for row in rows)
+        return result
+
+    def associate(self, session, parents, children, associated=None):
+        """Associates each key in `children` with each key in `parents`,
+        unless they are already associated.
+
+        `associated` is the set of associated pairs as returned by
+        :meth:`associated`; it is queried if not specified.
+
+        """
+        if not parents or not children:
+            return
+        if associated is None:
+            associated = self.associated(session, parents, children)
+        missing = [(parent, child) for parent in parents for child in children
+                   if (parent, child) not in associated]
+        if not missing:
+            return
+        if self.secondary:
+            names = [column.key for column
+                     in self.parent_columns + self.child_columns]
+            values = [dict(zip(names, parent + child))
+                      for parent, child in missing]
+            self._execute(session, self.table.insert(), values)
+            return
+        for parent in parents:
+            keys = [child for key, child in missing if key == parent]
+            values = dict(zip(self.parent_columns, parent))
+            for chunk in chunks(keys):
+                where = _keys_criterion(self.child_columns, chunk)
+                statement = self.table.update().where(where).values(values)
+                self._execute(session, statement)
+
+    def dissociate(self, session, parents, children):
+        """Removes the associations of the keys in `children` with the keys
+        in `parents`.
+
+        """
+        for parent_chunk in chunks(parents):
+            criterion = _keys_criterion(self.parent_columns, parent_chunk)
+            for child_chunk in chunks(children):
+                where = and_(criterion, _keys_criterion(self.child_columns,
+                                                        child_chunk))
+                if self.secondary:
+                    statement = self.table.delete().where(where)
+                else:
+                    values = dict((column, None)
+                                  for column in self.parent_columns)
+                    statement = self.table.update().where(where).values(values)
+                self._execute(session, statement)
+
+    def replace(self, session, parents, children):
+        """Associates each of `parents` with exactly the keys in `children`,
+        writing only the associations which change.
+
+        """
+        associated = self.associated(session, parents)
+        children = list(children)
+        keep = frozenset(children)
+        for parent in parents:
+            stale = [child for key, child in associated
+                     if key == parent and child not in keep]
+            if stale:
+                self.dissociate(session, [parent], stale)
+        self.associate(session, parents, children, associated)
+
+
+def _is_simple_join(join, pairs):
+    """Returns ``True`` if and only if the join condition `join` of a relation
+    consists only of the equalities between the columns in `pairs`, the
+    synchronized pairs of columns of the relation.
+
+    """
+    clauses = getattr(join, 'clauses', None) or [join]
+    return len(clauses) == len(pairs) and \
+        all(getattr(clause, 'operator', None) is eq for clause in clauses)
+
+
+@model_metadata
+def collection_rows(model, relationname):
+    """Returns the :class:`CollectionRows` which modifies the collection named
+    `relationname` of instances of `model` directly in the database, or
+    ``None`` if the collection must be modified through the ORM.
+
+    This is possible for many-to-many relations through an association table,
+    and for one-to-many relations whose related model has neither validators
+    nor update events, if the relation is a plain, writable collection without
+    validators whose join condition consists only of foreign key equalities.
+    One-to-many relations which delete orphans must be modified through the
+    ORM.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    # The relation may be an association proxy instead.
+    if relationname not in mapper.relationships:
+        return None
+    prop = mapper.relationships[relationname]
+    if not prop.uselist or prop.viewonly or prop.lazy == 'dynamic' \
+       or relationname in mapper.validators:
+        return None
+    target = prop.mapper
+    try:
+        parent_pairs = [(mapper.get_property_by_column(local).key, remote)
+                        for local, remote in prop.synchronize_pairs]
+        if prop.secondary is not None:
+            if not isinstance(prop.secondary, Table) \
+               or not _is_simple_join(prop.secondaryjoin,
+                                      prop.secondary_synchronize_pairs):
+                return None
+            child_pairs = [(target.get_property_by_column(local).key, remote)
+                           for local, remote
+                           in prop.secondary_synchronize_pairs]
+            table = prop.secondary
+        else:
+            if prop.direction is not ONETOMANY or prop.cascade.delete_orphan:
+                return None
+            if bulk_update_columns(target.class_) is None:
+                return None
+            tables = set(remote.table for name, remote in parent_pairs)
+            table = tables.pop()
+            if tables or any(column.table is not table
+                             for column in target.primary_key):
+                return None
+            child_pairs = [(target.get_property_by_column(column).key, column)
+                           for column in target.primary_key]
+            foreign_names = [target.get_property_by_column(remote).key
+                             for name, remote in parent_pairs]
+    except UnmappedColumnError:
+        return None
+    if not _is_simple_join(prop.primaryjoin, prop.synchronize_pairs):
+        return None
+    if prop.secondary is not None:
+        return CollectionRows(mapper, table, parent_pairs, child_pairs, True)
+    return CollectionRows(mapper, table, parent_pairs, child_pairs, False,
+                          foreign_names)
+
+
 def strings_to_dates(model, dictionary):
     """Returns a new dictionary with all the mappings of `dictionary` but
     with date strings and intervals mapped to :class:`datetime.datetime` or
@@ -582,21 +1854,392 @@ def strings_to_dates(model, dictionary):
     return result
 
 
+def strings_to_numbers(model, dictionary):
+    """Returns a new dictionary with all the mappings of `dictionary` but
+    with the strings which are values of numeric columns of `model`, like
+    :class:`sqlalchemy.types.Integer` columns, converted to the Python type
+    of that column.
+
+    Raises :exc:`ValueError` if such a string does not represent a number.
+
+    This function outputs a new dictionary; it does not modify the argument.
+
+    """
+    result = dict(dictionary)
+    for fieldname, value in dictionary.items():
+        if not isinstance(value, type(u'')):
+            continue
+        fieldtype = get_field_type(model, fieldname)
+        if not isinstance(fieldtype, _NUMERIC_COLUMN_TYPES):
+            continue
+        try:
+            result[fieldname] = fieldtype.python_type(value.strip())
+        except decimal.InvalidOperation:
+            raise ValueError('{0!r} is not a number'.format(value))
+    return result
+
+
+def update_expressions(model, data):
+    """Removes from the dictionary `data` each mapping from the name of a
+    column of `model` to an operator object, like ``{"inc": 1}``, and returns
+    a dictionary mapping the names of those columns to the SQL expressions of
+    their new values.
+
+    The expressions are computed by the database, so they may be given to
+    :meth:`sqlalchemy.orm.query.Query.update` or set on instances of `model`
+    without loading the current values first. The names of the operators are
+    the keys of :data:`UPDATE_OPERATORS`.
+
+    Operators are only recognized on numeric columns. On columns whose values
+    may be objects, like JSON or pickled columns, an operator object is left in
+    `data` as the value to set.
+
+    Raises :exc:`ValueError` if the operand of an operator is not a number, or
+    if an operator is given for a column which is neither numeric nor able to
+    hold objects.
+
+    """
+    columns = dict((prop.key, prop.columns[0].type) for prop in
+                   sqlalchemy_inspect(model).column_attrs)
+    expressions = {}
+    for field, value in list(data.items()):
+        if field not in columns or not isinstance(value, dict) \
+           or len(value) != 1:
+            continue
+        (operator, operand), = value.items()
+        if operator not in UPDATE_OPERATORS:
+            continue
+        columntype = columns[field]
+        if not isinstance(columntype, _NUMERIC_COLUMN_TYPES):
+            if not isinstance(columntype, _SCALAR_COLUMN_TYPES):
+                continue
+            msg = 'Operator "{0}" requires field "{1}" to be numeric'
+            raise ValueError(msg.format(operator, field))
+        if isinstance(operand, bool) \
+           or not isinstance(operand, numbers.Number):
+            msg = 'Operand of operator "{0}" on field "{1}" must be a number'
+            raise ValueError(msg.format(operator, field))
+        column = getattr(model, field)
+        expressions[field] = UPDATE_OPERATORS[operator](column, operand)
+        del data[field]
+    return expressions
+
+
+#: The names of the strategies for counting the results of a query, as
+#: accepted by the ``count_strategy`` keyword argument to
+#: :meth:`APIManager.create_api`.
+COUNT_STRATEGIES = ('exact', 'none', 'estimated', 'cached', 'window')
+
+#: The minimum server version of each dialect which supports window functions,
+#: like ``COUNT(*) OVER ()``.
+WINDOW_FUNCTION_VERSIONS = {
+    'postgresql': (8, 4),
+    'sqlite': (3, 25),
+    'mysql': (8, 0),
+    'mssql': (9, 0),
+    'oracle': (8, 1),
+}
+
+
 def count(session, query):
     """Returns the count of the specified `query`.
 
     This function employs an optimization that bypasses the
     :meth:`sqlalchemy.orm.Query.count` method, which can be very slow for large
-    queries.
+    queries. If `query` has a limit or an offset, the count is computed from
+    the count of the unlimited query instead of falling back to that method.
 
     """
-    counts = query.selectable.with_only_columns([func.count()])
+    limit, offset = query._limit, query._offset
+    unlimited = query.limit(None).offset(None)
+    counts = unlimited.selectable.with_only_columns([func.count()])
     num_results = session.execute(counts.order_by(None)).scalar()
-    if num_results is None or query._limit:
+    if num_results is None:
         return query.count()
+    if offset:
+        num_results = max(num_results - offset, 0)
+    if limit is not None:
+        num_results = min(num_results, limit)
     return num_results
 
 
+def supports_window_functions(session, query):
+    """Returns ``True`` if and only if the database on which `query` will be
+    executed supports window functions, according to
+    :data:`WINDOW_FUNCTION_VERSIONS`.
+
+    """
+    bind = session.get_bind(mapper=query._mapper_zero())
+    dialect = bind.dialect
+    minimum = WINDOW_FUNCTION_VERSIONS.get(dialect.name)
+    if minimum is None:
+        return False
+    # The server version is only known once a connection has been made.
+    if dialect.server_version_info is None:
+        bind.connect().close()
+    version = dialect.server_version_info or ()
+    # MariaDB reports its own version numbers, and supports window functions
+    # since version 10.2.
+    if 'MariaDB' in version:
+        minimum = (10, 2)
+    return tuple(version[:len(minimum)]) >= minimum
+
+
+def estimate_count(session, query):
+    """Returns an estimate of the count of the specified `query`, or ``None``
+    if no estimate is available.
+
+    On PostgreSQL, the estimate is the number of rows the query planner
+    expects the query to return, as reported by ``EXPLAIN``; this does not
+    execute the query, but may be far from the true count if the statistics
+    of the table are out of date. No estimate is available on other dialects.
+
+    This is the default estimator used by the ``'estimated'`` count strategy;
+    see :ref:`counting`.
+
+    """
+    bind = session.get_bind(mapper=query._mapper_zero())
+    if bind.dialect.name != 'postgresql':
+        return None
+    compiled = query.order_by(None).statement.compile(dialect=bind.dialect)
+    statement = 'EXPLAIN (FORMAT JSON) {0}'.format(compiled)
+    plan = session.connection().execute(statement, compiled.params).scalar()
+    # Some drivers do not decode JSON values.
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_cache_key(session, query):
+    """Returns a key identifying the rows matched by `query`, suitable for
+    caching its count, or ``None`` if no such key can be computed.
+
+    The key is built from the engine to which `session` binds the query, the
+    SQL of the query, and the values of its bound parameters, so requests
+    which specify the same filters in a different way (for example, with keys
+    in a different order) share the same key, but queries on different
+    databases do not.
+
+    """
+    statement = query.order_by(None).statement
+    bind = session.get_bind(clause=statement)
+    engine = getattr(bind, 'engine', bind)
+    compiled = statement.compile()
+    try:
+        params = tuple(sorted(compiled.params.items()))
+        hash(params)
+    except TypeError:
+        return None
+    return (id(engine), str(compiled), params)
+
+
+class TTLCache(object):
+    """A thread-safe mapping whose entries expire after a fixed number of
+    seconds, holding at most a fixed number of entries.
+
+    `maxsize` is the maximum number of entries in the cache; when a new entry
+    would exceed it, the least recently used entry is discarded.
+
+    `ttl` is the number of seconds after which an entry expires, or ``None``
+    if entries should not expire.
+
+    The :attr:`hits` and :attr:`misses` attributes count the number of calls
+    to :meth:`get` which found and did not find an entry, respectively.
+
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Maps each key to a triple (expiration time, last use, value).
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._uses = itertools.count()
+
+    def get(self, key, default=None):
+        """Returns the value for `key`, or `default` if there is no such
+        entry or the entry has expired.
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None \
+                    and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries[key] = (entry[0], next(self._uses), entry[2])
+            return entry[2]
+
+    def set(self, key, value, ttl=None):
+        """Stores `value` for `key`, expiring after `ttl` seconds, or after the
+        default number of seconds given in the constructor if `ttl` is
+        ``None``.
+
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            if key not in self._entries \
+                    and len(self._entries) >= self.maxsize:
+                oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+            self._entries[key] = (expires, next(self._uses), value)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _PendingWrite(object):
+    """A write submitted to a :class:`GroupCommitter`, on whose outcome the
+    thread which submitted it waits.
+
+    """
+
+    def __init__(self, write):
+        self.write = write
+        self.result = None
+        self.exception = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        """Whether the outcome of the write is known."""
+        return self._done.is_set()
+
+    def finish(self, result=None, exception=None):
+        """Records the result of the write, or the exception raised while
+        performing or committing it, and wakes the waiting thread.
+
+        """
+        self.result = result
+        self.exception = exception
+        self._done.set()
+
+    def wait(self):
+        """Waits until the write has been committed or has failed, then
+        returns its result or raises its exception.
+
+        """
+        self._done.wait()
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+class GroupCommitter(object):
+    """Performs the writes submitted by many threads in a dedicated thread,
+    committing the writes which arrive within a short window of each other in
+    a single transaction.
+
+    `session` must be a :class:`~sqlalchemy.orm.scoping.scoped_session`, so
+    that the committer thread has a session of its own.
+
+    `max_delay` is the number of seconds to wait for more writes after the
+    first write of a group arrives, and `max_size` is the maximum number of
+    writes in a group.
+
+    If a write or the commit of a group fails, the group is rolled back and
+    each of its writes is performed again and committed by itself, so that
+    one failed write does not cause the others in its group to fail.
+
+    The :attr:`commits` attribute counts the transactions committed.
+
+    """
+
+    def __init__(self, session, max_delay=0.002, max_size=64):
+        self.session = session
+        self.max_delay = max_delay
+        self.max_size = max_size
+        self.commits = 0
+        self._queue = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, app, write):
+        """Performs `write` in the committer thread and returns its result
+        once it has been committed, or raises the exception raised while
+        performing or committing it.
+
+        `write` is a function of no arguments which makes its changes in the
+        session and returns the result. It is called within an application
+        context of the Flask application `app`, but not within a request
+        context, and it may be called again if its group fails.
+
+        """
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    thread = threading.Thread(target=self._run,
+                                              name='GroupCommitter')
+                    thread.daemon = True
+                    thread.start()
+                    self._thread = thread
+        pending = _PendingWrite(write)
+        self._queue.put((app, pending))
+        return pending.wait()
+
+    def _run(self):
+        """Collects the submitted writes into groups and commits them, for as
+        long as the process runs.
+
+        """
+        while True:
+            group = [self._queue.get()]
+            deadline = time.time() + self.max_delay
+            while len(group) < self.max_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    group.append(self._queue.get(timeout=timeout))
+                except Empty:
+                    break
+            for app, pairs in itertools.groupby(group, key=itemgetter(0)):
+                writes = [pending for app_, pending in pairs]
+                with app.app_context():
+                    try:
+                        self._commit_group(writes)
+                    except Exception as exception:
+                        # Never leave a thread waiting, even if rolling back
+                        # fails.
+                        for pending in writes:
+                            if not pending.done:
+                                pending.finish(exception=exception)
+                    finally:
+                        self.session.remove()
+
+    def _commit_group(self, writes):
+        """Performs all of `writes` and commits them in a single transaction,
+        or, if that fails, performs and commits each of them by itself.
+
+        """
+        try:
+            results = [pending.write() for pending in writes]
+            self.session.commit()
+        except Exception as exception:
+            self.session.rollback()
+            if len(writes) == 1:
+                writes[0].finish(exception=exception)
+            else:
+                for pending in writes:
+                    self._commit_group([pending])
+            return
+        self.commits += 1
+        for pending, result in zip(writes, results):
+            pending.finish(result)
+
+
 # This code comes from <http://stackoverflow.com/a/6798042/108197>, which is
 # licensed under the Creative Commons Attribution-ShareAlike License version
 # 3.0 Unported.
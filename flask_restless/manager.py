@@ -17,25 +17,32 @@ from collections import namedtuple
 
 import flask
 from flask import Blueprint
+from sqlalchemy.orm import scoped_session
 
+from .helpers import COUNT_STRATEGIES
+from .helpers import get_columns
+from .helpers import LOADING_STRATEGIES
 from .helpers import primary_key_name
 from .helpers import url_for
 from .views import API
+from .views import BatchAPI
 from .views import FunctionAPI
 
 #: The set of methods which are allowed by default when creating an API
 READONLY_METHODS = frozenset(('GET', ))
 
 
-#: A triple that stores the SQLAlchemy session and the universal pre- and post-
+#: A tuple that stores the SQLAlchemy session, the universal pre- and post-
 #: processors to be applied to any API created for a particular Flask
-#: application.
+#: application, and the :class:`~flask.ext.restless.JSONBackend` used by
+#: those APIs (``None`` for the default JSON encoder of Flask).
 #:
 #: These tuples are used by :class:`APIManager` to store information about
 #: Flask applications registered using :meth:`APIManager.init_app`.
 RestlessInfo = namedtuple('RestlessInfo', ['session',
                                            'universal_preprocessors',
-                                           'universal_postprocessors'])
+                                           'universal_postprocessors',
+                                           'json_backend'])
 
 #: A global list of created :class:`APIManager` objects.
 created_managers = []
@@ -77,6 +84,11 @@ class APIManager(object):
 
     If `flask_sqlalchemy_db` is not ``None``, `session` will be ignored.
 
+    `json_backend` is the :class:`~flask.ext.restless.JSONBackend` which
+    encodes responses and decodes requests. If it is not specified, the JSON
+    encoder and decoder of the Flask application are used. For more
+    information, see :ref:`jsonbackend`.
+
     For example, to use this class with models defined in pure SQLAlchemy::
 
         from flask import Flask
@@ -137,6 +149,7 @@ class APIManager(object):
 
         self.flask_sqlalchemy_db = kw.pop('flask_sqlalchemy_db', None)
         self.session = kw.pop('session', None)
+        self.json_backend = kw.pop('json_backend', None)
         if self.app is not None:
             self.init_app(self.app, **kw)
 
@@ -223,7 +236,7 @@ class APIManager(object):
         return flask.url_for(joined, **kw)
 
     def init_app(self, app, session=None, flask_sqlalchemy_db=None,
-                 preprocessors=None, postprocessors=None):
+                 preprocessors=None, postprocessors=None, json_backend=None):
         """Stores the specified :class:`flask.Flask` application object on
         which API endpoints will be registered and the
         :class:`sqlalchemy.orm.session.Session` object in which all database
@@ -284,6 +297,13 @@ class APIManager(object):
         :meth:`create_api_blueprint` method). For more information on using
         preprocessors and postprocessors, see :ref:`processors`.
 
+        `json_backend` is the :class:`~flask.ext.restless.JSONBackend` which
+        encodes responses and decodes requests for all APIs created using this
+        APIManager object. For more information, see :ref:`jsonbackend`.
+
+        .. versionadded:: 0.17.1
+           Added the `json_backend` keyword argument.
+
         .. versionadded:: 0.13.0
            Added the `preprocessors` and `postprocessors` keyword arguments.
 
@@ -295,6 +315,9 @@ class APIManager(object):
         if session is None:
             session = self.session
         session = session or getattr(flask_sqlalchemy_db, 'session', None)
+        # If the JSON backend was provided in the constructor, use that.
+        if json_backend is None:
+            json_backend = self.json_backend
         # Use the `extensions` dictionary on the provided Flask object to store
         # extension-specific information.
         if not hasattr(app, 'extensions'):
@@ -304,7 +327,8 @@ class APIManager(object):
                              ' this application: {0}'.format(app))
         app.extensions['restless'] = RestlessInfo(session,
                                                   preprocessors or {},
-                                                  postprocessors or {})
+                                                  postprocessors or {},
+                                                  json_backend)
         # Now that this application has been initialized, create blueprints for
         # which API creation was deferred in :meth:`create_api`. This includes
         # all (args, kw) pairs for the key in :attr:`apis_to_create`
@@ -329,7 +353,16 @@ class APIManager(object):
                              max_results_per_page=100,
                              post_form_preprocessor=None, preprocessors=None,
                              postprocessors=None, primary_key=None,
-                             serializer=None, deserializer=None):
+                             serializer=None, deserializer=None,
+                             loading_strategies=None, pagination='page',
+                             count_strategy='exact', count_estimator=None,
+                             count_cache_timeout=60, streaming=False,
+                             fast_read=False, max_bulk_size=1000,
+                             orm_updates=False, allow_upsert=False,
+                             upsert_keys=None, group_commit=False,
+                             group_commit_delay=0.002,
+                             group_commit_size=64, etags=False,
+                             version_column=None, cache_control=None):
         """Creates and returns a ReSTful API interface as a blueprint, but does
         not register it on any :class:`flask.Flask` application.
 
@@ -490,6 +523,120 @@ class APIManager(object):
         and must return an instance of `model` that has those attributes. For
         more information, see :ref:`serialization`.
 
+        `loading_strategies` is a dictionary mapping names of relations of
+        `model` to the strategy used to load them when responding to
+        :http:method:`get` requests, one of ``'joined'``, ``'selectin'``,
+        ``'subquery'``, or ``'select'``. By default, the relations included in
+        responses are loaded eagerly, so that the number of queries per request
+        does not depend on the number of instances in the response. For more
+        information, see :ref:`eagerloading`.
+
+        `pagination` is either ``'page'`` or ``'keyset'``. By default,
+        responses to :http:method:`get` requests on the collection are
+        paginated by page number, which requires the database to skip the
+        instances on all previous pages. If `pagination` is ``'keyset'``,
+        responses instead include signed cursors identifying the first and last
+        instance of the page, and the next page is found by seeking past the
+        last instance, so requesting a page takes the same time regardless of
+        its position in the collection. For more information, see
+        :ref:`serverpagination`.
+
+        `count_strategy` determines how the total number of results is computed
+        when responding to :http:method:`get` requests on the collection:
+
+        ``'exact'``
+          counts the results with a separate query (the default),
+        ``'none'``
+          does not count the results, and instead indicates whether there is a
+          next page in the ``"has_more"`` key of the response,
+        ``'estimated'``
+          uses the estimate returned by `count_estimator`, a function which
+          takes the session and the query as arguments and returns an integer,
+          or ``None`` if no estimate is available, in which case the results
+          are counted exactly. By default, the estimate of the PostgreSQL query
+          planner is used; see
+          :func:`~flask.ext.restless.helpers.estimate_count`,
+        ``'cached'``
+          reuses the count computed for the same filters within the last
+          `count_cache_timeout` seconds,
+        ``'window'``
+          counts the results in the same query which fetches the page, using
+          ``COUNT(*) OVER ()``, on databases which support window functions
+          (PostgreSQL, SQLite 3.25, MySQL 8, and others), and counts them
+          exactly on other databases.
+
+        Clients can override the strategy for a single request with the
+        ``count`` query parameter. For more information, see :ref:`counting`.
+
+        If `streaming` is ``True``, responses to :http:method:`get` requests on
+        the collection are streamed to the client, so that each instance is
+        encoded as soon as it is serialized instead of building the entire
+        response in memory first. Responses are not streamed if the client
+        requests JSONP or if there are ``GET_MANY`` postprocessors, since these
+        need the complete response. For more information, see
+        :ref:`streaming`.
+
+        If `fast_read` is ``True``, :http:method:`get` requests on the
+        collection select only the columns which will be serialized and
+        convert the resulting rows to dictionaries directly, skipping the
+        construction of instances of `model` and their registration in the
+        session. This only happens when the response includes only columns of
+        the model (no related instances, hybrid properties, or
+        `include_methods`), the model has no polymorphic subclasses, and the
+        search neither groups results nor orders them by fields of related
+        models; otherwise instances are loaded as usual. For more information,
+        see :ref:`fastread`.
+
+        `max_bulk_size` is the maximum number of instances which a client may
+        create with a single :http:method:`post` request by sending a JSON
+        array of objects instead of a single object. All of them are created
+        in a single transaction. If `max_bulk_size` is ``0`` or ``None``,
+        clients must create instances one at a time. For more information,
+        see :ref:`bulkpost`.
+
+        If `orm_updates` is ``True``, :http:method:`patch` requests on the
+        collection (see `allow_patch_many`) load each matching instance and
+        update it through the ORM, so that validators and events defined on
+        `model` run. Otherwise, if the request changes only columns of
+        `model`, all matching rows are updated with a single ``UPDATE``
+        statement. For more information, see :ref:`bulkpatch`.
+
+        If `allow_upsert` is ``True``, clients may add the ``upsert=true``
+        query parameter to :http:method:`post` requests to update the existing
+        instance which has the same values of the columns named in the list
+        `upsert_keys` instead of creating a new one. If `upsert_keys` is not
+        specified, instances are matched by primary key; otherwise, the
+        columns must have a unique constraint. For more information, see
+        :ref:`upsert`.
+
+        If `group_commit` is ``True``, :http:method:`post` requests creating a
+        single instance and :http:method:`delete` requests on a single
+        instance are committed by a dedicated thread, which commits the writes
+        arriving within `group_commit_delay` seconds of each other, up to
+        `group_commit_size` writes, in a single transaction. This requires the
+        session to be a :class:`~sqlalchemy.orm.scoping.scoped_session`, and
+        cannot be combined with a custom `serializer` or `deserializer`. For
+        more information, see :ref:`groupcommit`.
+
+        If `etags` is ``True``, responses to :http:method:`get` requests have
+        an :http:header:`ETag` header, and conditional requests for a
+        representation the client already has receive a
+        :http:statuscode:`304` response. If `version_column` is the name of a
+        column of `model` which changes whenever an instance changes (by
+        default, ``updated_at``, if `model` has such a column), the ETags are
+        computed from it without serializing instances; otherwise they are
+        computed from the body of the response. `cache_control` is the value
+        of the :http:header:`Cache-Control` header of responses to
+        :http:method:`get` requests, like ``'public, max-age=5'``. For more
+        information, see :ref:`conditionalget`.
+
+        .. versionadded:: 0.17.1
+           Added the `loading_strategies`, `pagination`, `count_strategy`,
+           `count_estimator`, `count_cache_timeout`, `streaming`, `fast_read`,
+           `max_bulk_size`, `orm_updates`, `allow_upsert`, `upsert_keys`,
+           `group_commit`, `group_commit_delay`, `group_commit_size`,
+           `etags`, `version_column`, and `cache_control` keyword arguments.
+
         .. versionadded:: 0.17.0
            Added the `serializer` and `deserializer` keyword arguments.
 
@@ -542,11 +689,36 @@ class APIManager(object):
             msg = ('Cannot simultaneously specify both include columns and'
                    ' exclude columns.')
             raise IllegalArgumentError(msg)
+        for relation, strategy in (loading_strategies or {}).items():
+            if strategy not in LOADING_STRATEGIES:
+                msg = ('Unknown loading strategy "{0}" for relation'
+                       ' "{1}"').format(strategy, relation)
+                raise IllegalArgumentError(msg)
+        if pagination not in ('page', 'keyset'):
+            msg = 'Unknown pagination "{0}"'.format(pagination)
+            raise IllegalArgumentError(msg)
+        if count_strategy not in COUNT_STRATEGIES:
+            msg = 'Unknown count strategy "{0}"'.format(count_strategy)
+            raise IllegalArgumentError(msg)
+        if version_column is not None \
+                and version_column not in get_columns(model):
+            msg = 'Unknown version column "{0}"'.format(version_column)
+            raise IllegalArgumentError(msg)
         # If no Flask application is specified, use the one (we assume) was
         # specified in the constructor.
         if app is None:
             app = self.app
         restlessinfo = app.extensions['restless']
+        if group_commit and not isinstance(restlessinfo.session,
+                                           scoped_session):
+            msg = 'Group commit requires a scoped session'
+            raise IllegalArgumentError(msg)
+        if group_commit and (serializer is not None
+                             or deserializer is not None):
+            msg = ('Group commit cannot be used with a custom serializer or'
+                   ' deserializer, which would be called outside of the'
+                   ' request context')
+            raise IllegalArgumentError(msg)
         if collection_name is None:
             collection_name = model.__tablename__
         # convert all method names to upper case
@@ -590,7 +762,23 @@ class APIManager(object):
                                results_per_page, max_results_per_page,
                                post_form_preprocessor, preprocessors_,
                                postprocessors_, primary_key, serializer,
-                               deserializer)
+                               deserializer,
+                               loading_strategies=loading_strategies,
+                               pagination=pagination,
+                               count_strategy=count_strategy,
+                               count_estimator=count_estimator,
+                               count_cache_timeout=count_cache_timeout,
+                               streaming=streaming, fast_read=fast_read,
+                               json_backend=restlessinfo.json_backend,
+                               max_bulk_size=max_bulk_size,
+                               orm_updates=orm_updates,
+                               allow_upsert=allow_upsert,
+                               upsert_keys=upsert_keys,
+                               group_commit=group_commit,
+                               group_commit_delay=group_commit_delay,
+                               group_commit_size=group_commit_size,
+                               etags=etags, version_column=version_column,
+                               cache_control=cache_control)
         # suffix an integer to apiname according to already existing blueprints
         blueprintname = APIManager._next_blueprint_name(app.blueprints,
                                                         apiname)
@@ -702,3 +890,53 @@ class APIManager(object):
             # initalization.
             else:
                 self.apis_to_create[None].append((args, kw))
+
+    def create_batch_api(self, app=None, url_prefix='/api',
+                         max_operations=200):
+        """Creates and registers an endpoint at ``/_batch``, relative to
+        `url_prefix`, which performs a list of operations on the APIs created
+        by this object in a single request and a single database transaction.
+
+        `app` is the :class:`flask.Flask` application on which to register the
+        endpoint; if it is ``None``, the application specified in the
+        constructor of this class is used. Flask-Restless must already have
+        been initialized on the application, as by :meth:`init_app`.
+
+        `max_operations` is the maximum number of operations allowed in a
+        single request; the endpoint responds with
+        :http:statuscode:`413` to requests containing more operations.
+
+        For more information, see :ref:`batch`.
+
+        .. versionadded:: 0.17.1
+
+        """
+        if app is None:
+            app = self.app
+        if app is None or 'restless' not in app.extensions:
+            msg = ('Flask-Restless must be initialized on the application'
+                   ' before creating the batch API')
+            raise IllegalArgumentError(msg)
+
+        def endpoint_for(collection_name):
+            for info in self.created_apis_for.values():
+                if info.collection_name != collection_name:
+                    continue
+                # The same APIManager may have created APIs on other
+                # applications as well.
+                if info.blueprint_name not in flask.current_app.blueprints:
+                    continue
+                apiname = APIManager.api_name(collection_name)
+                return '.'.join([info.blueprint_name, apiname])
+            return None
+
+        session = app.extensions['restless'].session
+        batch_view = BatchAPI.as_view('batchapi', session, endpoint_for,
+                                      max_operations)
+        blueprintname = APIManager._next_blueprint_name(app.blueprints,
+                                                        'batchapi')
+        blueprint = Blueprint(blueprintname, __name__, url_prefix=url_prefix)
+        blueprint.add_url_rule('/_batch', methods=['POST'],
+                               view_func=batch_view)
+        app.register_blueprint(blueprint)
+        return blueprint
@@ -14,16 +14,47 @@
     :license: GNU AGPLv3+ or BSD
 
 """
+import datetime
+from decimal import Decimal
 import inspect
+import uuid
 
+from dateutil.parser import parse as parse_datetime
 from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import event
 from sqlalchemy import or_
+from sqlalchemy import tuple_
 from sqlalchemy.ext.associationproxy import AssociationProxy
+from sqlalchemy.orm import Mapper
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
 from .helpers import session_query
+from .helpers import _to_serializable
 from .helpers import get_related_association_proxy_model
 from .helpers import primary_key_names
+from .helpers import TTLCache
+
+# In Python 3.0 or later, `inspect.getargspec` is deprecated in favor of
+# `inspect.getfullargspec`.
+_getargspec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+
+#: The cache of searches built by :func:`create_query`, keyed by the model and
+#: the shape of the search parameters, as computed by :func:`search_shape`.
+#:
+#: The cache holds the SQLAlchemy expressions of the filters, ordering, and
+#: grouping, not compiled SQL statements: the statement of each query is still
+#: compiled when the query is executed (on SQLAlchemy 1.4 and later, from its
+#: own cache of compiled statements).
+#:
+#: Its :attr:`~flask.ext.restless.helpers.TTLCache.hits` and
+#: :attr:`~flask.ext.restless.helpers.TTLCache.misses` attributes count the
+#: searches which did and did not reuse a previously built search.
+search_cache = TTLCache(maxsize=512)
+
+#: Maps each function in :data:`OPERATORS` to the number of arguments it
+#: accepts, so that the function need not be inspected for each filter.
+_operator_arity = {}
 
 
 def _sub_operator(model, argument, fieldname):
@@ -339,6 +370,68 @@ class SearchParameters(object):
                                 order_by=order_by, group_by=group_by)
 
 
+class CompiledSearch(object):
+    """The filters, ordering, and grouping of a search, built once by
+    :meth:`QueryBuilder.build` and applied to any number of queries.
+
+    When built from a template produced by :func:`search_shape`, the filters
+    contain bound parameters in place of the values given by the client, so
+    the same object serves every search of the same shape. The values of the
+    parameters are given to :meth:`apply`.
+
+    """
+
+    def __init__(self, filters, order_by, group_by):
+        """Instantiates this object with the specified attributes.
+
+        `filters` is a list of SQLAlchemy filter criteria.
+
+        `order_by` is a list of pairs ``(relation_model, clause)``, where
+        `clause` is the ordering clause and `relation_model` is the model to
+        join before ordering, or ``None`` if no join is necessary.
+
+        `group_by` is a list of the columns by which to group the results.
+
+        """
+        self.filters = filters
+        self.order_by = order_by
+        self.group_by = group_by
+
+    def apply(self, query, limit=None, offset=None, options=None,
+              params=None):
+        """Returns `query` filtered, ordered, and grouped by this search.
+
+        `limit` and `offset`, if not ``None``, are applied to the returned
+        query. `options` is a list of query options, which are applied unless
+        the query is grouped, as described in
+        :meth:`QueryBuilder.create_query`.
+
+        `params` is a dictionary giving the values of the bound parameters in
+        the filters of this search.
+
+        """
+        # Multiple filter criteria at the top level of the provided search
+        # parameters are interpreted as a conjunction (AND).
+        query = query.filter(*self.filters)
+        for relation_model, clause in self.order_by:
+            if relation_model is not None:
+                query = query.join(relation_model)
+            query = query.order_by(clause)
+        # Group the query.
+        if self.group_by:
+            query = query.group_by(*self.group_by)
+        elif options:
+            query = query.options(*options)
+        # Apply limit and offset to the query.
+        if limit:
+            query = query.limit(limit)
+        if offset:
+            query = query.offset(offset)
+        if params:
+            query = query.params(**params)
+        return query
+
+
 class QueryBuilder(object):
     """Provides a static function for building a SQLAlchemy query object based
     on a :class:`SearchParameters` instance.
@@ -393,9 +486,10 @@ class QueryBuilder(object):
         """
         # raises KeyError if operator not in OPERATORS
         opfunc = OPERATORS[operator]
-        # In Python 3.0 or later, this should be `inspect.getfullargspec`
-        # because `inspect.getargspec` is deprecated.
-        numargs = len(inspect.getargspec(opfunc).args)
+        numargs = _operator_arity.get(opfunc)
+        if numargs is None:
+            numargs = len(_getargspec(opfunc).args)
+            _operator_arity[opfunc] = numargs
         # raises AttributeError if `fieldname` or `relation` does not exist
         field = getattr(model, relation or fieldname)
         # each of these will raise a TypeError if the wrong number of argments
@@ -444,46 +538,31 @@ class QueryBuilder(object):
         return or_(create_filt(model, f) for f in filt)
 
     @staticmethod
-    def create_query(session, model, search_params, _ignore_order_by=False):
-        """Builds an SQLAlchemy query instance based on the search parameters
-        present in ``search_params``, an instance of :class:`SearchParameters`.
-
-        This method returns a SQLAlchemy query in which all matched instances
-        meet the requirements specified in ``search_params``.
-
-        `model` is SQLAlchemy declarative model on which to create a query.
+    def build(model, search_params, _ignore_order_by=False):
+        """Returns a :class:`CompiledSearch` containing the filters, ordering,
+        and grouping on `model` specified by ``search_params``, an instance of
+        :class:`SearchParameters`.
 
-        `search_params` is an instance of :class:`SearchParameters` which
-        specify the filters, order, limit, offset, etc. of the query.
+        The limit and offset given in ``search_params`` are not part of the
+        returned object; they are given to :meth:`CompiledSearch.apply`
+        instead.
 
-        If `_ignore_order_by` is ``True``, no ``order_by`` method will be
-        called on the query, regardless of whether the search parameters
-        indicate that there should be an ``order_by``. (This is used internally
-        by Flask-Restless to work around a limitation in SQLAlchemy.)
-
-        Building the query proceeds in this order:
-        1. filtering
-        2. ordering
-        3. grouping
-        3. limiting
-        4. offsetting
+        If `_ignore_order_by` is ``True``, the returned object does not order
+        the query, as described in :meth:`create_query`.
 
         Raises one of :exc:`AttributeError`, :exc:`KeyError`, or
         :exc:`TypeError` if there is a problem creating the query. See the
         documentation for :func:`_create_operation` for more information.
 
         """
-        query = session_query(session, model)
         # For the sake of brevity, rename this method.
         create_filt = QueryBuilder._create_filter
         # This function call may raise an exception.
         filters = [create_filt(model, filt) for filt in search_params.filters]
-        # Multiple filter criteria at the top level of the provided search
-        # parameters are interpreted as a conjunction (AND).
-        query = query.filter(*filters)
 
         # Order the search. If no order field is specified in the search
         # parameters, order by primary key.
+        order_by = []
         if not _ignore_order_by:
             if search_params.order_by:
                 for val in search_params.order_by:
@@ -495,33 +574,224 @@ class QueryBuilder(object):
                         relation_model = relation.mapper.class_
                         field = getattr(relation_model, field_name_in_relation)
                         direction = getattr(field, val.direction)
-                        query = query.join(relation_model)
-                        query = query.order_by(direction())
+                        order_by.append((relation_model, direction()))
                     else:
                         field = getattr(model, val.field)
                         direction = getattr(field, val.direction)
-                        query = query.order_by(direction())
+                        order_by.append((None, direction()))
             else:
                 pks = primary_key_names(model)
-                pk_order = (getattr(model, field).asc() for field in pks)
-                query = query.order_by(*pk_order)
+                order_by.extend((None, getattr(model, field).asc())
+                                for field in pks)
 
-        # Group the query.
-        if search_params.group_by:
-            for groupby in search_params.group_by:
-                field = getattr(model, groupby.field)
-                query = query.group_by(field)
+        group_by = [getattr(model, groupby.field)
+                    for groupby in search_params.group_by]
+        return CompiledSearch(filters, order_by, group_by)
 
-        # Apply limit and offset to the query.
-        if search_params.limit:
-            query = query.limit(search_params.limit)
-        if search_params.offset:
-            query = query.offset(search_params.offset)
+    @staticmethod
+    def create_query(session, model, search_params, _ignore_order_by=False,
+                     options=None, query=None):
+        """Builds an SQLAlchemy query instance based on the search parameters
+        present in ``search_params``, an instance of :class:`SearchParameters`.
 
-        return query
+        This method returns a SQLAlchemy query in which all matched instances
+        meet the requirements specified in ``search_params``.
+
+        `model` is SQLAlchemy declarative model on which to create a query.
+
+        `search_params` is an instance of :class:`SearchParameters` which
+        specify the filters, order, limit, offset, etc. of the query.
+
+        If `_ignore_order_by` is ``True``, no ``order_by`` method will be
+        called on the query, regardless of whether the search parameters
+        indicate that there should be an ``order_by``. (This is used internally
+        by Flask-Restless to work around a limitation in SQLAlchemy.)
 
+        `options` is a list of query options, like the loader options returned
+        by :func:`flask.ext.restless.helpers.loader_options`, to apply to the
+        query. Options are not applied to grouped queries, since eagerly
+        loaded relations would add columns to the ``SELECT`` clause that do
+        not appear in the ``GROUP BY`` clause.
 
-def create_query(session, model, searchparams, _ignore_order_by=False):
+        `query` is the query on `model` to which the search parameters are
+        applied. If it is ``None``, the search parameters are applied to the
+        query of all instances of `model`.
+
+        Building the query proceeds in this order:
+        1. filtering
+        2. ordering
+        3. grouping
+        3. limiting
+        4. offsetting
+
+        Raises one of :exc:`AttributeError`, :exc:`KeyError`, or
+        :exc:`TypeError` if there is a problem creating the query. See the
+        documentation for :func:`_create_operation` for more information.
+
+        """
+        if query is None:
+            query = session_query(session, model)
+        built = QueryBuilder.build(model, search_params, _ignore_order_by)
+        return built.apply(query, search_params.limit, search_params.offset,
+                           options)
+
+
+#: The operators whose argument is a collection of values.
+_COLLECTION_OPERATORS = frozenset(('in', 'not_in'))
+
+
+def _items(dictionary):
+    """Returns the items of `dictionary`, sorted by key, as a tuple.
+
+    Raises :exc:`TypeError` if `dictionary` is not a dictionary.
+
+    """
+    if not isinstance(dictionary, dict):
+        raise TypeError('{0!r} is not a dictionary'.format(dictionary))
+    return tuple(sorted(dictionary.items()))
+
+
+def _value_shape(value, params):
+    """Returns a pair ``(shape, template)`` for `value`, the value of a filter,
+    in which each value is replaced by a bound parameter.
+
+    The value of each parameter is added to the dictionary `params`, keyed by
+    the name of the parameter. ``None`` is not replaced, since it changes the
+    meaning of a filter, and dictionaries, as used by the ``has`` and ``any``
+    operators, are replaced recursively, as are the elements of lists.
+
+    """
+    if value is None:
+        return None, None
+    if isinstance(value, dict):
+        shape, template = _filter_shape(value, params)
+        return ('filter', shape), template
+    if isinstance(value, (list, tuple)):
+        pairs = [_value_shape(element, params) for element in value]
+        shape = ('list', ) + tuple(shape for shape, template in pairs)
+        return shape, [template for shape, template in pairs]
+    name = 'restless_param_{0}'.format(len(params))
+    params[name] = value
+    return (name, type(value)), bindparam(name)
+
+
+def _filter_shape(dictionary, params):
+    """Returns a pair ``(shape, template)`` for `dictionary`, a filter in
+    dictionary form as accepted by :meth:`Filter.from_dictionary`, in which
+    each value is replaced by a bound parameter, as described in
+    :func:`_value_shape`.
+
+    """
+    if not isinstance(dictionary, dict):
+        raise TypeError('{0!r} is not a dictionary'.format(dictionary))
+    if 'or' in dictionary or 'and' in dictionary:
+        junction = 'or' if 'or' in dictionary else 'and'
+        pairs = [_filter_shape(f, params) for f in dictionary[junction]]
+        shape = (junction, ) + tuple(shape for shape, template in pairs)
+        return shape, {junction: [template for shape, template in pairs]}
+    template = dict(dictionary)
+    template.pop('val', None)
+    shape = _items(template)
+    # The value is ignored if the filter compares two fields.
+    if 'val' in dictionary and not dictionary.get('field'):
+        value = dictionary['val']
+        if dictionary.get('op') in _COLLECTION_OPERATORS \
+           and not isinstance(value, (list, tuple)):
+            # The operator iterates over the value itself, like the characters
+            # of a string, so the value cannot be a single bound parameter.
+            template['val'] = value
+            shape += (('val', ('value', type(value), value)), )
+        else:
+            value_shape, template['val'] = _value_shape(value, params)
+            shape += (('val', value_shape), )
+    return shape, template
+
+
+def search_shape(dictionary):
+    """Returns a triple ``(shape, template, params)`` describing the search
+    parameters in `dictionary`, as accepted by
+    :meth:`SearchParameters.from_dictionary`.
+
+    `shape` is a hashable object which is equal for any two searches that
+    differ only in their limit and offset and in the values to which their
+    filters compare fields, provided that those values have the same types
+    and that lists of values have the same lengths. `template` is a
+    dictionary of search parameters in which these values are replaced by
+    bound parameters, whose values are given by the dictionary `params`. The
+    value of an ``in`` or ``not_in`` filter which is not a list, like a
+    string, is not replaced, since the operator iterates over it; it is part
+    of the shape instead. For example, the search parameters::
+
+        {'filters': [{'name': 'age', 'op': 'lt', 'val': 20}], 'limit': 10}
+
+    have the template::
+
+        {'filters': [{'name': 'age', 'op': 'lt',
+                      'val': bindparam('restless_param_0')}],
+         'order_by': [], 'group_by': []}
+
+    and the parameters ``{'restless_param_0': 20}``.
+
+    Raises :exc:`TypeError` if `dictionary` is not of the form accepted by
+    :meth:`SearchParameters.from_dictionary` or its shape is not hashable.
+
+    """
+    params = {}
+    pairs = [_filter_shape(f, params) for f in dictionary.get('filters', [])]
+    order_by = dictionary.get('order_by', [])
+    group_by = dictionary.get('group_by', [])
+    shape = (tuple(shape for shape, template in pairs),
+             tuple(_items(o) for o in order_by),
+             tuple(_items(g) for g in group_by))
+    # Raises TypeError if a field name or an operator is not hashable.
+    hash(shape)
+    template = dict(filters=[template for shape, template in pairs],
+                    order_by=order_by, group_by=group_by)
+    return shape, template, params
+
+
+def compile_search(model, dictionary, _ignore_order_by=False):
+    """Returns a pair ``(compiled, params)``, where `compiled` is the
+    :class:`CompiledSearch` for the search parameters in `dictionary` on
+    `model` and `params` is the dictionary of values of its bound parameters.
+
+    The search is built once for each shape of search parameters, as computed
+    by :func:`search_shape`, and stored in :data:`search_cache`. Searches whose
+    shape cannot be computed are built without using the cache.
+
+    Raises one of :exc:`AttributeError`, :exc:`KeyError`, or :exc:`TypeError`
+    if there is a problem creating the query, as described in
+    :meth:`QueryBuilder._create_operation`.
+
+    """
+    try:
+        shape, template, params = search_shape(dictionary)
+    except TypeError:
+        searchparams = SearchParameters.from_dictionary(dictionary)
+        compiled = QueryBuilder.build(model, searchparams, _ignore_order_by)
+        return compiled, None
+    key = (model, shape, _ignore_order_by)
+    compiled = search_cache.get(key)
+    if compiled is None:
+        searchparams = SearchParameters.from_dictionary(template)
+        compiled = QueryBuilder.build(model, searchparams, _ignore_order_by)
+        search_cache.set(key, compiled)
+    return compiled, params
+
+
+@event.listens_for(Mapper, 'after_configured')
+def clear_search_cache():
+    """Clears :data:`search_cache`, since the searches it contains may refer to
+    attributes of models which have since been reconfigured.
+
+    This function is called automatically after SQLAlchemy configures mappers.
+
+    """
+    search_cache.clear()
+
+
+def create_query(session, model, searchparams, _ignore_order_by=False,
+                 options=None, query=None):
     """Returns a SQLAlchemy query object on the given `model` where the search
     for the query is defined by `searchparams`.
 
@@ -542,14 +812,27 @@ def create_query(session, model, searchparams, _ignore_order_by=False):
     should be an ``order_by``. (This is used internally by Flask-Restless to
     work around a limitation in SQLAlchemy.)
 
+    `options` is a list of query options to apply to the query and `query` is
+    the query to which the search parameters are applied, as described in
+    :meth:`QueryBuilder.create_query`.
+
+    If `searchparams` is a dictionary, the filters, ordering, and grouping of
+    the query are built only once for all searches of the same shape, as
+    described in :func:`compile_search`.
+
     """
-    if isinstance(searchparams, dict):
-        searchparams = SearchParameters.from_dictionary(searchparams)
-    return QueryBuilder.create_query(session, model, searchparams,
-                                     _ignore_order_by)
+    if not isinstance(searchparams, dict):
+        return QueryBuilder.create_query(session, model, searchparams,
+                                         _ignore_order_by, options, query)
+    compiled, params = compile_search(model, searchparams, _ignore_order_by)
+    if query is None:
+        query = session_query(session, model)
+    return compiled.apply(query, searchparams.get('limit'),
+                          searchparams.get('offset'), options, params)
 
 
-def search(session, model, search_params, _ignore_order_by=False):
+def search(session, model, search_params, _ignore_order_by=False,
+           options=None, query=None):
     """Performs the search specified by the given parameters on the model
     specified in the constructor of this class.
 
@@ -579,13 +862,199 @@ def search(session, model, search_params, _ignore_order_by=False):
     should be an ``order_by``. (This is used internally by Flask-Restless to
     work around a limitation in SQLAlchemy.)
 
+    `options` is a list of query options to apply to the query and `query` is
+    the query to which the search parameters are applied, as described in
+    :meth:`QueryBuilder.create_query`.
+
     """
     # `is_single` is True when 'single' is a key in ``search_params`` and its
     # corresponding value is anything except those values which evaluate to
     # False (False, 0, the empty string, the empty list, etc.).
     is_single = search_params.get('single')
-    query = create_query(session, model, search_params, _ignore_order_by)
+    query = create_query(session, model, search_params, _ignore_order_by,
+                         options, query)
     if is_single:
         # may raise NoResultFound or MultipleResultsFound
         return query.one()
     return query
+
+
+def keyset_order(model, searchparams):
+    """Returns the ordering of the query created by :func:`create_query` for
+    `searchparams`, extended by the primary key of `model` so that no two
+    instances compare equal, as required for keyset pagination.
+
+    `searchparams` is either a dictionary or a :class:`SearchParameters`
+    instance, as in :func:`create_query`.
+
+    The returned list contains triples of the form ``(field, column,
+    direction)``, where `field` is the name of the field as given in the search
+    parameters, `column` is the SQLAlchemy expression by which the query is
+    ordered, and `direction` is either ``'asc'`` or ``'desc'``.
+
+    """
+    if isinstance(searchparams, dict):
+        searchparams = SearchParameters.from_dictionary(searchparams)
+    ordering = []
+    for val in searchparams.order_by:
+        if '__' in val.field:
+            field_name, field_name_in_relation = val.field.split('__')
+            relation_model = getattr(model, field_name).mapper.class_
+            column = getattr(relation_model, field_name_in_relation)
+        else:
+            column = getattr(model, val.field)
+        ordering.append((val.field, column, val.direction))
+    # Order the primary key in the same direction as the last column, so that
+    # the ordering can be compared as a single row value if possible.
+    tiebreak = ordering[-1][2] if ordering else 'asc'
+    fields = [field for field, column, direction in ordering]
+    ordering.extend((pk, getattr(model, pk), tiebreak)
+                    for pk in primary_key_names(model) if pk not in fields)
+    return ordering
+
+
+def _is_nullable(column):
+    """Returns ``False`` if `column`, an attribute of a model used for
+    ordering, maps only to table columns which cannot be ``NULL``, and
+    ``True`` otherwise.
+
+    """
+    try:
+        return any(c.nullable for c in column.property.columns)
+    except AttributeError:
+        return True
+
+
+def keyset_order_by(ordering, reverse=False):
+    """Returns the list of ``ORDER BY`` clauses for `ordering`, a list of
+    triples as returned by :func:`keyset_order`, or for the opposite ordering
+    if `reverse` is ``True``.
+
+    Databases disagree on where ``NULL`` values are sorted, so each nullable
+    column is preceded by a clause which explicitly sorts ``NULL`` after every
+    other value, in the ascending direction. :func:`keyset_filter` relies on
+    this ordering.
+
+    """
+    clauses = []
+    for field, column, direction in ordering:
+        ascending = (direction == 'asc') != reverse
+        if _is_nullable(column):
+            isnull = column.is_(None)
+            clauses.append(isnull.asc() if ascending else isnull.desc())
+        clauses.append(column.asc() if ascending else column.desc())
+    return clauses
+
+
+def _seek(column, value, ascending):
+    """Returns the criterion matching the rows whose value of `column` comes
+    strictly after `value` in the direction given by `ascending`, where
+    ``NULL`` comes after every other value in the ascending direction, or
+    ``None`` if no row can match.
+
+    """
+    if ascending:
+        if value is None:
+            return None
+        if _is_nullable(column):
+            return or_(column > value, column.is_(None))
+        return column > value
+    if value is None:
+        return column.isnot(None)
+    return column < value
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """Returns a filter criterion matching the rows which come strictly after
+    the row whose values for the columns in `ordering` are `values`, in the
+    ordering given by :func:`keyset_order_by`.
+
+    `ordering` is a list of triples as returned by :func:`keyset_order` and
+    `values` is a list of values of the same length.
+
+    If `reverse` is ``True``, the criterion matches the rows which come
+    strictly *before* that row instead.
+
+    If all columns are ordered in the same direction and none of them is
+    nullable, the criterion is a single row-value comparison, like ``(age,
+    id) > (24, 3)``, which the database can satisfy by seeking in an index on
+    those columns. Otherwise, the comparison is expanded into the equivalent
+    disjunction, which handles ``NULL`` values explicitly.
+
+    """
+    columns = [column for field, column, direction in ordering]
+    directions = set(direction for field, column, direction in ordering)
+    if len(directions) == 1 and not any(_is_nullable(c) for c in columns):
+        ascending = (directions.pop() == 'asc') != reverse
+        if ascending:
+            return tuple_(*columns) > tuple_(*values)
+        return tuple_(*columns) < tuple_(*values)
+    clauses = []
+    for i, (field, column, direction) in enumerate(ordering):
+        ascending = (direction == 'asc') != reverse
+        seek = _seek(column, values[i], ascending)
+        if seek is None:
+            continue
+        equal = [c.is_(None) if v is None else c == v
+                 for c, v in zip(columns[:i], values[:i])]
+        clauses.append(and_(*(equal + [seek])))
+    return or_(*clauses)
+
+
+#: Functions which convert the values in cursors created by
+#: :func:`keyset_values` back to the Python type of their column.
+_KEYSET_PARSERS = {
+    datetime.date: lambda value: parse_datetime(value).date(),
+    datetime.datetime: parse_datetime,
+    datetime.time: lambda value: parse_datetime(value).time(),
+    datetime.timedelta: lambda value: datetime.timedelta(seconds=value),
+    Decimal: Decimal,
+    uuid.UUID: uuid.UUID,
+}
+
+
+def keyset_values(ordering, instance):
+    """Returns the list of the values of the fields in `ordering`, a list of
+    triples as returned by :func:`keyset_order`, for `instance`, converted to
+    values which can be serialized to JSON.
+
+    Dates, times, and UUIDs are converted to strings as by
+    :func:`~flask.ext.restless.helpers.to_dict`, intervals to numbers of
+    seconds, and decimals to strings, so that :func:`parse_keyset_values` can
+    convert them back without loss.
+
+    """
+    values = []
+    for field, column, direction in ordering:
+        value = instance
+        for name in field.split('__'):
+            value = getattr(value, name, None)
+        if isinstance(value, datetime.timedelta):
+            value = value.total_seconds()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        else:
+            value = _to_serializable(value)
+        values.append(value)
+    return values
+
+
+def parse_keyset_values(ordering, values):
+    """Returns the list of values returned by :func:`keyset_values`, converted
+    back to the Python types of the columns in `ordering`.
+
+    Raises :exc:`ValueError` or :exc:`TypeError` if a value cannot be
+    converted.
+
+    """
+    result = []
+    for (field, column, direction), value in zip(ordering, values):
+        if value is not None:
+            try:
+                parse = _KEYSET_PARSERS.get(column.type.python_type)
+            except (AttributeError, NotImplementedError):
+                parse = None
+            if parse is not None:
+                value = parse(value)
+        result.append(value)
+    return result
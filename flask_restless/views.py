@@ -25,54 +25,107 @@
 from __future__ import division
 
 from collections import defaultdict
+from functools import partial
 from functools import wraps
+import datetime
+import hashlib
 import math
+import threading
 import warnings
 
 from flask import current_app
 from flask import json
 from flask import jsonify as _jsonify
 from flask import request
+from flask import stream_with_context
+from flask import url_for as flask_url_for
 from flask.views import MethodView
+from itsdangerous import BadData
+from itsdangerous import URLSafeSerializer
 from mimerender import FlaskMimeRender
 from sqlalchemy import Column
+from sqlalchemy import func
 from sqlalchemy.exc import DataError
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.ext.associationproxy import AssociationProxy
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+from sqlalchemy.orm import configure_mappers
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm.exc import MultipleResultsFound
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.query import Query
+from sqlalchemy.sql.expression import ClauseElement
 from werkzeug.exceptions import BadRequest
 from werkzeug.exceptions import HTTPException
+from werkzeug.http import http_date
+from werkzeug.http import parse_date
+from werkzeug.routing import BuildError
+from werkzeug.test import EnvironBuilder
 from werkzeug.urls import url_quote_plus
 
+from .helpers import bulk_delete_possible
+from .helpers import bulk_insert_columns
+from .helpers import bulk_update_columns
+from .helpers import bulk_upsert
+from .helpers import chunks
+from .helpers import collection_rows
 from .helpers import count
+from .helpers import count_cache_key
+from .helpers import COUNT_STRATEGIES
+from .helpers import encode_native_types
+from .helpers import estimate_count
 from .helpers import evaluate_functions
+from .helpers import get_all_by
 from .helpers import get_by
 from .helpers import get_columns
 from .helpers import get_or_create
 from .helpers import get_related_model
+from .helpers import GroupCommitter
 from .helpers import get_relations
 from .helpers import has_field
 from .helpers import is_like_list
+from .helpers import loader_options
 from .helpers import partition
-from .helpers import primary_key_name
 from .helpers import query_by_primary_key
+from .helpers import primary_key_name
+from .helpers import primary_key_names
+from .helpers import resolve_existing
+from .helpers import serialization_plan
 from .helpers import session_query
 from .helpers import strings_to_dates
+from .helpers import strings_to_numbers
+from .helpers import supports_window_functions
+from .helpers import TTLCache
 from .helpers import to_dict
+from .helpers import update_expressions
 from .helpers import upper_keys
 from .helpers import get_related_association_proxy_model
 from .search import create_query
+from .search import keyset_filter
+from .search import keyset_order
+from .search import keyset_order_by
+from .search import keyset_values
+from .search import parse_keyset_values
 from .search import search
 
 
 #: Format string for creating Link headers in paginated responses.
 LINKTEMPLATE = '<{0}?page={1}&results_per_page={2}>; rel="{3}"'
 
+#: Format string for creating Link headers in responses paginated by keyset.
+CURSORLINKTEMPLATE = '<{0}?cursor={1}&results_per_page={2}{3}>; rel="{4}"'
+
+#: Salt used when signing the cursors of responses paginated by keyset, so
+#: that they cannot be mistaken for other values signed with the secret key of
+#: the application.
+CURSOR_SALT = 'flask-restless-keyset-cursor'
+
+#: Cache of the counts of queries for APIs which use the ``'cached'`` count
+#: strategy, shared by all APIs and keyed by the SQL of the query.
+_count_cache = TTLCache(maxsize=1024)
+
 #: String used internally as a dictionary key for passing header information
 #: from view functions to the :func:`jsonpify` function.
 _HEADERS = '__restless_headers'
@@ -81,6 +134,14 @@ _HEADERS = '__restless_headers'
 #: information from view functions to the :func:`jsonpify` function.
 _STATUS = '__restless_status_code'
 
+#: String used internally as a dictionary key for indicating to the
+#: :func:`jsonpify` function that the response should be streamed.
+_STREAM = '__restless_stream'
+
+#: The approximate number of characters of JSON to encode before sending them
+#: to the client in a streamed response.
+STREAM_CHUNK_SIZE = 16384
+
 
 class ProcessingException(HTTPException):
     """Raised when a preprocessor or postprocessor encounters a problem.
@@ -129,13 +190,56 @@ def _is_msie8or9():
             and (8, 0) <= version(request.user_agent) < (10, 0))
 
 
-def create_link_string(page, last_page, per_page):
+def _prefers_minimal():
+    """Returns ``True`` if and only if the client making the request prefers
+    a minimal response to a write, as indicated by ``return=minimal`` in the
+    :http:header:`Prefer` header of the request (see :rfc:`7240`).
+
+    """
+    for value in request.headers.getlist('Prefer'):
+        for preference in value.split(','):
+            # Ignore the parameters of the preference, if any.
+            token = preference.split(';')[0]
+            name, _, setting = token.partition('=')
+            if name.strip().lower() == 'return' \
+                    and setting.strip().strip('"').lower() == 'minimal':
+                return True
+    return False
+
+
+def create_link_string(page, last_page, per_page, next_cursor=None,
+                       prev_cursor=None, has_more=False):
     """Returns a string representing the value of the ``Link`` header.
 
     `page` is the number of the current page, `last_page` is the last page in
     the pagination, and `per_page` is the number of results per page.
 
+    If `last_page` is ``None``, the number of pages is unknown, so no link to
+    the last page is included, and a link to the next page is included only if
+    `has_more` is ``True``.
+
+    If `page` is ``None``, the response is paginated by keyset instead, and
+    the links point to the pages following `next_cursor` and preceding
+    `prev_cursor`, either of which may be ``None`` if there is no such page.
+    Since cursors are only meaningful for the search which produced them, the
+    search query of the current request is included in these links.
+
     """
+    if page is None:
+        links = []
+        query = request.args.get('q')
+        query = '&q=' + url_quote_plus(query) if query else ''
+        for cursor, rel in (next_cursor, 'next'), (prev_cursor, 'prev'):
+            if cursor is not None:
+                links.append(CURSORLINKTEMPLATE.format(request.base_url,
+                                                       cursor, per_page,
+                                                       query, rel))
+        return ', '.join(links)
+    if last_page is None:
+        if not has_more:
+            return ''
+        return LINKTEMPLATE.format(request.base_url, page + 1, per_page,
+                                   'next')
     linkstring = ''
     if page < last_page:
         next_page = page + 1
@@ -208,6 +312,59 @@ def set_headers(response, headers):
         response.headers[key] = value
 
 
+def _json_backend():
+    """Returns the :class:`~flask.ext.restless.JSONBackend` used by
+    Flask-Restless on the current application, or ``None`` if it uses the JSON
+    encoder and decoder of Flask.
+
+    """
+    info = current_app.extensions.get('restless')
+    return getattr(info, 'json_backend', None)
+
+
+def _dumps(obj):
+    """Returns the JSON string representing `obj`, as encoded by the JSON
+    backend of the current application.
+
+    """
+    backend = _json_backend()
+    if backend is None:
+        return json.dumps(obj)
+    return backend.dumps(obj)
+
+
+def _canonical_dumps(obj):
+    """Returns a canonical JSON string representing `obj`, in which the keys
+    of each object are sorted, so that equal objects have the same
+    representation in every process regardless of the order of iteration of
+    dictionaries.
+
+    Values of types which JSON encoders do not know how to encode are
+    converted as by :func:`~flask.ext.restless.helpers.encode_native_types` or,
+    failing that, by :func:`repr`, since the string is only used to compute
+    digests.
+
+    """
+    def default(value):
+        try:
+            return encode_native_types(value)
+        except TypeError:
+            return repr(value)
+
+    return json.dumps(obj, sort_keys=True, default=default)
+
+
+def _loads(data):
+    """Returns the object represented by the JSON string or bytes `data`, as
+    decoded by the JSON backend of the current application.
+
+    """
+    backend = _json_backend()
+    if backend is None:
+        return json.loads(data)
+    return backend.loads(data)
+
+
 def jsonify(*args, **kw):
     """Same as :func:`flask.jsonify`, but sets response headers.
 
@@ -215,8 +372,18 @@ def jsonify(*args, **kw):
     response via :func:`flask.jsonify`, then set the specified ``headers`` on
     the response. ``headers`` must be a dictionary mapping strings to strings.
 
+    If a :class:`~flask.ext.restless.JSONBackend` was specified for the
+    current application, the response is encoded by that backend instead of
+    :func:`flask.jsonify`.
+
     """
-    response = _jsonify(*args, **kw)
+    backend = _json_backend()
+    if backend is None:
+        response = _jsonify(*args, **kw)
+    else:
+        content = backend.encode(dict(*args, **kw))
+        response = current_app.response_class(content,
+                                              mimetype='application/json')
     if 'headers' in kw:
         set_headers(response, kw['headers'])
     return response
@@ -277,6 +444,43 @@ def _headers_to_json(headers):
     return result
 
 
+def _serialize_all(instances, serialize, stream=False):
+    """Returns the list of dictionary representations of `instances`, as
+    computed by the function `serialize`.
+
+    If `stream` is ``True``, returns a generator of these dictionaries
+    instead, so that each instance is serialized only when it is needed.
+
+    """
+    if stream:
+        return (serialize(instance) for instance in instances)
+    return [serialize(instance) for instance in instances]
+
+
+def _stream_json(data):
+    """Yields the JSON representation of the dictionary `data` in chunks.
+
+    The value of the ``'objects'`` key of `data` may be a generator; each of
+    its elements is encoded as soon as it is produced, so neither the list of
+    serialized instances nor the complete JSON string is ever held in memory.
+
+    """
+    objects = data.pop('objects')
+    head = _dumps(data)
+    chunk = [head[:-1], ', ' if data else '', '"objects": [']
+    size = 0
+    for i, obj in enumerate(objects):
+        encoded = _dumps(obj)
+        chunk.append(', ' + encoded if i else encoded)
+        size += len(encoded)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    chunk.append(']}')
+    yield ''.join(chunk)
+
+
 def jsonpify(*args, **kw):
     """Passes the specified arguments directly to :func:`jsonify` with a status
     code of 200, then wraps the response with the name of a JSON-P callback
@@ -292,6 +496,10 @@ def jsonpify(*args, **kw):
     its value must be an integer representing the status code of the response.
     Otherwise, the status code of the response will be :http:status:`200`.
 
+    If the keyword arguments include the string specified by :data:`_STREAM`
+    with a true value, the response is streamed to the client as it is encoded
+    by :func:`_stream_json`, unless a JSONP callback is requested.
+
     """
     # HACK In order to make the headers and status code available in the
     # content of the response, we need to send it from the view function to
@@ -300,12 +508,20 @@ def jsonpify(*args, **kw):
     # code known to the rendering functions.
     headers = kw.pop(_HEADERS, {})
     status_code = kw.pop(_STATUS, 200)
-    response = jsonify(*args, **kw)
+    stream = kw.pop(_STREAM, False)
     callback = request.args.get('callback', False)
+    if stream and not callback:
+        chunks = stream_with_context(_stream_json(kw))
+        response = current_app.response_class(chunks,
+                                              mimetype='application/json')
+    else:
+        if stream:
+            kw['objects'] = list(kw['objects'])
+        response = jsonify(*args, **kw)
     if callback:
         # Reload the data from the constructed JSON string so we can wrap it in
         # a JSONP function.
-        data = json.loads(response.data)
+        data = _loads(response.data)
         # Force the 'Content-Type' header to be 'application/javascript'.
         #
         # Note that this is different from the mimetype used in Flask for JSON
@@ -316,7 +532,7 @@ def jsonpify(*args, **kw):
         # Add the headers and status code as metadata to the JSONP response.
         meta = _headers_to_json(headers) if headers is not None else {}
         meta['status'] = status_code
-        inner = json.dumps(dict(meta=meta, data=data))
+        inner = _dumps(dict(meta=meta, data=data))
         content = '{0}({1})'.format(callback, inner)
         # Note that this is different from the mimetype used in Flask for JSON
         # responses; Flask uses 'application/json'. We use
@@ -430,6 +646,20 @@ def extract_error_messages(exception):
 mimerender = FlaskMimeRender()(default='json', json=jsonpify)
 
 
+class _Processors(dict):
+    """A dictionary mapping a method name, like ``'GET_SINGLE'``, to the list
+    of processors for that method, which returns an empty tuple for methods
+    without processors.
+
+    Unlike :class:`collections.defaultdict`, looking up a missing method does
+    not insert it into the dictionary.
+
+    """
+
+    def __missing__(self, key):
+        return ()
+
+
 class ModelView(MethodView):
     """Base class for :class:`flask.MethodView` classes which represent a view
     of a SQLAlchemy model.
@@ -449,6 +679,46 @@ class ModelView(MethodView):
     #: List of decorators applied to every method of this class.
     decorators = [mimerender]
 
+    @classmethod
+    def as_view(cls, name, *class_args, **class_kwargs):
+        """Converts this class into a view function, as
+        :meth:`flask.views.View.as_view` does, but instantiates it only once.
+
+        Flask would instantiate the class on each request, repeating all of
+        the configuration done by its constructor. Instead, the class is
+        instantiated on the first request and the instance is shared by all
+        later requests, so instances of this class must not store any state
+        specific to a request. The mappers of all models are configured before
+        the class is instantiated, so that relations defined by backrefs on
+        other models are known to the constructor.
+
+        The arguments passed to this method are forwarded to the constructor
+        of the class.
+
+        """
+        instances = []
+        lock = threading.Lock()
+
+        def view(*args, **kwargs):
+            if not instances:
+                with lock:
+                    if not instances:
+                        configure_mappers()
+                        instances.append(cls(*class_args, **class_kwargs))
+            return instances[0].dispatch_request(*args, **kwargs)
+
+        if cls.decorators:
+            view.__name__ = name
+            view.__module__ = cls.__module__
+            for decorator in cls.decorators:
+                view = decorator(view)
+        view.view_class = cls
+        view.__name__ = name
+        view.__doc__ = cls.__doc__
+        view.__module__ = cls.__module__
+        view.methods = cls.methods
+        return view
+
     def __init__(self, session, model, *args, **kw):
         """Calls the constructor of the superclass and specifies the model for
         which this class provides a ReSTful API.
@@ -494,7 +764,7 @@ class FunctionAPI(ModelView):
             return dict(message='Empty query parameter'), 400
         # if parsing JSON fails, return a 400 error in JSON format
         try:
-            data = json.loads(str(request.args.get('q'))) or {}
+            data = _loads(str(request.args.get('q'))) or {}
         except (TypeError, ValueError, OverflowError) as exception:
             current_app.logger.exception(str(exception))
             return dict(message='Unable to decode data'), 400
@@ -530,7 +800,14 @@ class API(ModelView):
                  validation_exceptions=None, results_per_page=10,
                  max_results_per_page=100, post_form_preprocessor=None,
                  preprocessors=None, postprocessors=None, primary_key=None,
-                 serializer=None, deserializer=None, *args, **kw):
+                 serializer=None, deserializer=None, loading_strategies=None,
+                 pagination='page', count_strategy='exact',
+                 count_estimator=None, count_cache_timeout=60,
+                 streaming=False, fast_read=False, json_backend=None,
+                 max_bulk_size=1000, orm_updates=False, allow_upsert=False,
+                 upsert_keys=None, group_commit=False,
+                 group_commit_delay=0.002, group_commit_size=64, etags=False,
+                 version_column=None, cache_control=None, *args, **kw):
         """Instantiates this view with the specified attributes.
 
         `session` is the SQLAlchemy session in which all database transactions
@@ -624,6 +901,88 @@ class API(ModelView):
         and must return an instance of `model` that has those attributes. For
         more information, see :ref:`serialization`.
 
+        `loading_strategies` is a dictionary mapping names of relations of
+        `model` to the name of the strategy used to load them when responding
+        to :http:method:`get` requests, overriding the strategy chosen
+        automatically. For more information, see :ref:`eagerloading`.
+
+        `pagination` is either ``'page'``, to paginate responses to
+        :http:method:`get` requests by page number, or ``'keyset'``, to
+        paginate them using opaque cursors which identify the last instance of
+        the previous page. For more information, see :ref:`serverpagination`.
+
+        `count_strategy` is the name of the strategy used to count the total
+        number of results when responding to :http:method:`get` requests on
+        the collection, one of ``'exact'``, ``'none'``, ``'estimated'``,
+        ``'cached'``, or ``'window'``. `count_estimator` is the function which
+        estimates the number of results of a query for the ``'estimated'``
+        strategy, and `count_cache_timeout` is the number of seconds for which
+        counts are cached by the ``'cached'`` strategy. For more information,
+        see :ref:`counting`.
+
+        If `streaming` is ``True``, responses to :http:method:`get` requests on
+        the collection are streamed to the client, encoding each instance as
+        soon as it is serialized, unless the client requests a JSONP response
+        or there are postprocessors for such requests. For more information,
+        see :ref:`streaming`.
+
+        If `fast_read` is ``True``, :http:method:`get` requests on the
+        collection select only the columns to be serialized and serialize the
+        resulting rows directly, without constructing instances of the model,
+        whenever the response includes only columns of the model. For more
+        information, see :ref:`fastread`.
+
+        `json_backend` is the :class:`~flask.ext.restless.JSONBackend` of the
+        application on which this view is registered, if any. If its encoder
+        handles dates, times, and UUIDs itself, instances are serialized
+        without converting these values first. For more information, see
+        :ref:`jsonbackend`.
+
+        `max_bulk_size` is the maximum number of instances which may be
+        created by a single :http:method:`post` request whose body is a JSON
+        array. If it is ``0`` or ``None``, such requests are not allowed. For
+        more information, see :ref:`bulkpost`.
+
+        If `orm_updates` is ``True``, :http:method:`patch` requests on the
+        collection always load and update each matching instance through the
+        ORM, instead of issuing a single ``UPDATE`` statement when the request
+        changes only columns of the model. For more information, see
+        :ref:`bulkpatch`.
+
+        If `allow_upsert` is ``True``, :http:method:`post` requests with the
+        ``upsert`` query parameter set to ``true`` update the existing
+        instances which have the same values of the columns named in the list
+        `upsert_keys` (by default, the primary key) instead of creating new
+        ones. For more information, see :ref:`upsert`.
+
+        If `group_commit` is ``True``, :http:method:`post` requests creating a
+        single instance and :http:method:`delete` requests on a single
+        instance are performed by a
+        :class:`~flask.ext.restless.helpers.GroupCommitter`, which commits the
+        writes arriving within `group_commit_delay` seconds of each other, up
+        to `group_commit_size` writes, in a single transaction. `session` must
+        then be a :class:`~sqlalchemy.orm.scoping.scoped_session`. For more
+        information, see :ref:`groupcommit`.
+
+        If `etags` is ``True``, responses to :http:method:`get` requests have
+        an :http:header:`ETag` header, and conditional requests whose
+        :http:header:`If-None-Match` or :http:header:`If-Modified-Since`
+        header matches the current representation receive a
+        :http:statuscode:`304` response. The ETags are computed from the
+        column named `version_column` (by default, ``updated_at`` if the
+        model has such a column), or otherwise from the encoded body of the
+        response. `cache_control` is the value of the
+        :http:header:`Cache-Control` header of responses to :http:method:`get`
+        requests. For more information, see :ref:`conditionalget`.
+
+        .. versionadded:: 0.17.1
+           Added the `loading_strategies`, `pagination`, `count_strategy`,
+           `count_estimator`, `count_cache_timeout`, `streaming`, `fast_read`,
+           `json_backend`, `max_bulk_size`, `orm_updates`, `allow_upsert`,
+           `upsert_keys`, `group_commit`, `group_commit_delay`,
+           `group_commit_size`, `etags`, `version_column`, and `cache_control`
+           keyword arguments.
+
         .. versionadded:: 0.17.0
            Added the `serializer` and `deserializer` keyword arguments.
 
@@ -675,6 +1034,27 @@ class API(ModelView):
         self.include_methods = include_methods
         self.validation_exceptions = tuple(validation_exceptions or ())
         self.results_per_page = results_per_page
+        self.pagination = pagination
+        self.count_strategy = count_strategy
+        self.count_estimator = count_estimator or estimate_count
+        self.count_cache_timeout = count_cache_timeout
+        self.streaming = streaming
+        self.fast_read = fast_read
+        self.max_bulk_size = max_bulk_size
+        self.orm_updates = orm_updates
+        self.allow_upsert = allow_upsert
+        self.upsert_keys = upsert_keys
+        if group_commit:
+            self.group_committer = GroupCommitter(session, group_commit_delay,
+                                                  group_commit_size)
+        else:
+            self.group_committer = None
+        self.etags = etags
+        if version_column is None and 'updated_at' in get_columns(model):
+            version_column = 'updated_at'
+        self.version_column = version_column
+        self.cache_control = cache_control
+        self.native_types = getattr(json_backend, 'native_types', False)
         self.max_results_per_page = max_results_per_page
         self.primary_key = primary_key
         # Use our default serializer and deserializer if none are specified.
@@ -710,6 +1090,10 @@ class API(ModelView):
             self.postprocessors['PATCH_MANY'].append(postprocessor)
         for preprocessor in self.preprocessors['PUT_MANY']:
             self.preprocessors['PATCH_MANY'].append(preprocessor)
+        # This instance is shared by all requests (see :meth:`as_view`), so
+        # looking up the processors for a method must not modify them.
+        self.postprocessors = _Processors(self.postprocessors)
+        self.preprocessors = _Processors(self.preprocessors)
 
         # HACK: We would like to use the :attr:`API.decorators` class attribute
         # in order to decorate each view method with a decorator that catches
@@ -720,6 +1104,30 @@ class API(ModelView):
         for method in ['get', 'post', 'patch', 'put', 'delete']:
             decorate(method, catch_integrity_errors(self.session))
 
+        # Compute the relations to follow when serializing instances of the
+        # model and the plan used to serialize them. Serialization plans are
+        # cached, so the mapper of the model is inspected only once.
+        relations = frozenset(get_relations(self.model))
+        # do not follow relations that will not be included in the response
+        if self.include_columns is not None:
+            cols = frozenset(self.include_columns)
+            rels = frozenset(self.include_relations)
+            relations &= (cols | rels)
+        elif self.exclude_columns is not None:
+            relations -= frozenset(self.exclude_columns)
+        self._deep = dict((r, {}) for r in relations)
+        self._serialization_plan = self._plan_for(self.model, self._deep)
+        # Eagerly load the relations which will be serialized, so that
+        # serializing a page of instances does not issue one query per
+        # relation per instance, and load only the columns which will be
+        # serialized.
+        self._loader_options = loader_options(
+            self.model, self._deep, loading_strategies,
+            exclude=self.exclude_columns, include=self.include_columns,
+            exclude_relations=self.exclude_relations,
+            include_relations=self.include_relations,
+            include_methods=self.include_methods)
+
     def _get_column_name(self, column):
         """Retrieve a column name from a column attribute of SQLAlchemy
         model class, or a string.
@@ -747,6 +1155,41 @@ class API(ModelView):
 
         return column
 
+    def _plan_for(self, model, deep):
+        """Returns the :class:`~flask.ext.restless.helpers.SerializationPlan`
+        for instances of `model`, following the relations in `deep` and
+        respecting the include and exclude columns specified in the
+        constructor of this class.
+
+        """
+        return serialization_plan(model, deep, exclude=self.exclude_columns,
+                                  exclude_relations=self.exclude_relations,
+                                  include=self.include_columns,
+                                  include_relations=self.include_relations,
+                                  include_methods=self.include_methods,
+                                  native_types=self.native_types)
+
+    def _fast_read_columns(self, search_params):
+        """Returns the list of columns to select in order to respond to a
+        search with the specified search parameters without constructing
+        instances of the model, or ``None`` if the instances are required.
+
+        This is only possible if `fast_read` was specified in the constructor
+        of this class, if the serialization plan for the model can be computed
+        entirely in SQL, and if the search neither groups the results nor
+        orders them by the fields of related models. Keyset pagination always
+        requires instances.
+
+        """
+        if not self.fast_read or self.pagination == 'keyset':
+            return None
+        if search_params.get('group_by'):
+            return None
+        if any('__' in order.get('field', '')
+               for order in search_params.get('order_by') or ()):
+            return None
+        return self._serialization_plan.sql_columns()
+
     def _add_to_relation(self, query, relationname, toadd=None):
         """Adds a new or existing related model to each model specified by
         `query`.
@@ -754,9 +1197,9 @@ class API(ModelView):
         This function does not commit the changes made to the database. The
         calling function has that responsibility.
 
-        `query` is a SQLAlchemy query instance that evaluates to all instances
-        of the model specified in the constructor of this class that should be
-        updated.
+        `query` is an iterable, like a SQLAlchemy query or a list, of all
+        instances of the model specified in the constructor of this class that
+        should be updated.
 
         `relationname` is the name of a one-to-many relationship which exists
         on each model specified in `query`.
@@ -767,14 +1210,29 @@ class API(ModelView):
         added. Otherwise, the :func:`helpers.get_or_create` class method will
         be used to get or create a model to add.
 
+        If possible, the related models are associated with each instance
+        directly in the database, without loading the collection (see
+        :meth:`_collection_rows`).
+
         """
         submodel = get_related_model(self.model, relationname)
         if isinstance(toadd, dict):
             toadd = [toadd]
-        for dictionary in toadd or []:
-            subinst = get_or_create(self.session, submodel, dictionary)
+        identity = resolve_existing(self.session, submodel, toadd or [])
+        subinsts = [get_or_create(self.session, submodel, dictionary, identity)
+                    for dictionary in toadd or []]
+        instances = list(query)
+        rows = self._collection_rows(instances, relationname)
+        if rows is not None:
+            parents = [rows.parent_key(instance) for instance in instances]
+            if parents:
+                rows.adopt(parents[-1], subinsts)
+            children = self._flushed_keys(rows, subinsts)
+            rows.associate(self.session, parents, children)
+            return
+        for subinst in subinsts:
             try:
-                for instance in query:
+                for instance in instances:
                     getattr(instance, relationname).append(subinst)
             except AttributeError as exception:
                 current_app.logger.exception(str(exception))
@@ -786,9 +1244,9 @@ class API(ModelView):
         This function does not commit the changes made to the database. The
         calling function has that responsibility.
 
-        `query` is a SQLAlchemy query instance that evaluates to all instances
-        of the model specified in the constructor of this class that should be
-        updated.
+        `query` is an iterable, like a SQLAlchemy query or a list, of all
+        instances of the model specified in the constructor of this class that
+        should be updated.
 
         `relationname` is the name of a one-to-many relationship which exists
         on each model specified in `query`.
@@ -805,18 +1263,36 @@ class API(ModelView):
         ``True``, then the removed object will be deleted after being removed
         from each instance of the model in the specified query.
 
+        If possible, the related models are dissociated from each instance
+        directly in the database, without loading the collection (see
+        :meth:`_collection_rows`).
+
         """
         submodel = get_related_model(self.model, relationname)
+        instances = list(query)
+        rows = self._collection_rows(instances, relationname)
+        subinsts = []
+        todelete = []
         for dictionary in toremove or []:
             remove = dictionary.pop('__delete__', False)
             if 'id' in dictionary:
                 subinst = get_by(self.session, submodel, dictionary['id'])
             else:
                 subinst = self.query(submodel).filter_by(**dictionary).first()
-            for instance in query:
-                getattr(instance, relationname).remove(subinst)
+            if rows is None:
+                for instance in instances:
+                    getattr(instance, relationname).remove(subinst)
+            elif subinst is not None:
+                subinsts.append(subinst)
             if remove:
-                self.session.delete(subinst)
+                todelete.append(subinst)
+        if subinsts:
+            children = self._flushed_keys(rows, subinsts)
+            rows.dissociate(self.session, [rows.parent_key(instance)
+                                           for instance in instances],
+                            children)
+        for subinst in todelete:
+            self.session.delete(subinst)
 
     def _set_on_relation(self, query, relationname, toset=None):
         """Sets the value of the relation specified by `relationname` on each
@@ -826,9 +1302,9 @@ class API(ModelView):
         This function does not commit the changes made to the database. The
         calling function has that responsibility.
 
-        `query` is a SQLAlchemy query instance that evaluates to all instances
-        of the model specified in the constructor of this class that should be
-        updated.
+        `query` is an iterable, like a SQLAlchemy query or a list, of all
+        instances of the model specified in the constructor of this class that
+        should be updated.
 
         `relationname` is the name of a one-to-many relationship which exists
         on each model specified in `query`.
@@ -840,15 +1316,67 @@ class API(ModelView):
         :func:`helpers.get_or_create` method will be used to get or create a
         model to set.
 
+        If `toset` is a list and it is possible, only the associations which
+        change are written directly in the database, without loading the
+        collection (see :meth:`_collection_rows`).
+
         """
         submodel = get_related_model(self.model, relationname)
+        instances = list(query)
         if isinstance(toset, list):
-            value = [get_or_create(self.session, submodel, d) for d in toset]
+            identity = resolve_existing(self.session, submodel, toset)
+            value = [get_or_create(self.session, submodel, d, identity)
+                     for d in toset]
+            rows = self._collection_rows(instances, relationname)
+            if rows is not None:
+                parents = [rows.parent_key(instance) for instance in instances]
+                if parents:
+                    rows.adopt(parents[-1], value)
+                children = self._flushed_keys(rows, value)
+                rows.replace(self.session, parents, children)
+                return
         else:
             value = get_or_create(self.session, submodel, toset)
-        for instance in query:
+        for instance in instances:
             setattr(instance, relationname, value)
 
+    def _collection_rows(self, instances, relationname):
+        """Returns the :class:`~flask.ext.restless.helpers.CollectionRows`
+        with which to modify the collection named `relationname` of each of
+        `instances` directly in the database, or ``None`` if the collection
+        must be modified through the ORM.
+
+        The latter is the case if the relation does not allow it (see
+        :func:`~flask.ext.restless.helpers.collection_rows`), or if the
+        collection of any of `instances` is already loaded, in which case
+        modifying it through the ORM requires no further queries and keeps it
+        up to date.
+
+        """
+        rows = collection_rows(self.model, relationname)
+        if rows is None:
+            return None
+        for instance in instances:
+            state = sqlalchemy_inspect(instance)
+            if state.key is None or relationname not in state.unloaded:
+                return None
+        return rows
+
+    def _flushed_keys(self, rows, subinsts):
+        """Flushes the related instances `subinsts`, some of which may be new,
+        and returns the list of the keys by which `rows` refers to them.
+
+        Since their associations are modified directly in the database, the
+        instances are expired, so that they are loaded again when accessed.
+
+        """
+        self.session.add_all(subinsts)
+        self.session.flush()
+        keys = [rows.child_key(subinst) for subinst in subinsts]
+        for subinst in subinsts:
+            self.session.expire(subinst)
+        return keys
+
     # TODO change this to have more sensible arguments
     def _update_relations(self, query, params):
         """Adds, removes, or sets models which are related to the model
@@ -860,9 +1388,9 @@ class API(ModelView):
         This method returns a :class:`frozenset` of strings representing the
         names of relations which were modified.
 
-        `query` is a SQLAlchemy query instance that evaluates to all instances
-        of the model specified in the constructor of this class that should be
-        updated.
+        `query` is an iterable, like a SQLAlchemy query or a list, of all
+        instances of the model specified in the constructor of this class that
+        should be updated.
 
         `params` is a dictionary containing a mapping from name of the relation
         to modify (as a string) to either a list or another dictionary. In the
@@ -933,17 +1461,46 @@ class API(ModelView):
             results_per_page = self.results_per_page
         return min(results_per_page, self.max_results_per_page)
 
-    # TODO it is ugly to have `deep` as an arg here; can we remove it?
-    def _paginated(self, instances, deep):
+    def _count(self, query, strategy):
+        """Returns the number of results of `query`, computed using the count
+        strategy named `strategy`.
+
+        The ``'estimated'`` strategy uses :attr:`count_estimator`, and the
+        ``'cached'`` strategy reuses a count computed within the last
+        :attr:`count_cache_timeout` seconds for the same filters. If neither
+        an estimate nor a cache key is available, the exact count is computed.
+
+        """
+        if strategy == 'estimated':
+            estimate = self.count_estimator(self.session, query)
+            if estimate is not None:
+                return estimate
+        elif strategy == 'cached':
+            key = count_cache_key(self.session, query)
+            if key is not None:
+                num_results = _count_cache.get(key)
+                if num_results is None:
+                    num_results = count(self.session, query)
+                    _count_cache.set(key, num_results,
+                                     self.count_cache_timeout)
+                return num_results
+        return count(self.session, query)
+
+    def _paginated(self, instances, serialize, strategy='exact',
+                   stream=False):
         """Returns a paginated JSONified response from the specified list of
         model instances.
 
         `instances` is either a Python list of model instances or a
         :class:`~sqlalchemy.orm.Query`.
 
-        `deep` is the dictionary which defines the depth of submodels to output
-        in the JSON format of the model instances in `instances`; it is passed
-        directly to :func:`helpers.to_dict`.
+        `serialize` is the function which converts each of the model instances
+        in `instances` to a dictionary, usually a
+        :class:`~flask.ext.restless.helpers.SerializationPlan` as returned by
+        :meth:`_plan_for`.
+
+        `strategy` is the name of the strategy used to count the total number
+        of results of a query, as described in :meth:`_count`.
 
         The response data is JSON of the form:
 
@@ -956,32 +1513,202 @@ class API(ModelView):
              "objects": [{"id": 1, "name": "Jeffrey", "age": 24}, ...]
            }
 
+        If `strategy` is ``'none'``, the results are not counted. Instead, one
+        instance more than fits on the page is fetched, and the response data
+        has a ``"has_more"`` key indicating whether there is a next page
+        instead of the ``"total_pages"`` and ``"num_results"`` keys.
+
+        If `strategy` is ``'window'`` and the database supports window
+        functions, the results are counted by the same query which fetches the
+        page, using ``COUNT(*) OVER ()``. The results are counted separately
+        only if the page is empty.
+
+        If `stream` is ``True``, the value of the ``"objects"`` key is a
+        generator which serializes each instance as it is consumed, for use
+        in a streamed response.
+
         """
-        if isinstance(instances, list):
-            num_results = len(instances)
-        else:
-            num_results = count(self.session, instances)
         results_per_page = self._compute_results_per_page()
         if results_per_page > 0:
             # get the page number (first page is page 1)
             page_num = int(request.args.get('page', 1))
             start = (page_num - 1) * results_per_page
-            end = min(num_results, start + results_per_page)
-            total_pages = int(math.ceil(num_results / results_per_page))
+            end = start + results_per_page
         else:
             page_num = 1
             start = 0
-            end = num_results
+            end = None
+        # Slicing a query replaces any limit specified in the search
+        # parameters, so stop the slice at that limit.
+        limit = getattr(instances, '_limit', None)
+
+        def stop(index):
+            if limit is None:
+                return index
+            if index is None:
+                return limit
+            return max(start, min(index, limit))
+
+        # Counting a list is free.
+        if isinstance(instances, list):
+            strategy = 'exact'
+        if strategy == 'none':
+            has_more = False
+            if end is not None:
+                # Fetch one extra instance to learn whether there is another
+                # page.
+                instances = instances[start:stop(end + 1)]
+                has_more = len(instances) > results_per_page
+                instances = instances[:results_per_page]
+            else:
+                instances = instances[start:stop(end)]
+            objects = _serialize_all(instances, serialize, stream)
+            return dict(page=page_num, objects=objects, has_more=has_more)
+        if strategy == 'window' and \
+                not supports_window_functions(self.session, instances):
+            strategy = 'exact'
+        if strategy == 'window':
+            total = func.count().over().label('__restless_num_results')
+            rows = instances.add_columns(total)[start:stop(end)]
+            # Rows of plain columns are serialized as they are; the
+            # serializer ignores the trailing count.
+            description = instances.column_descriptions[0]
+            if description['expr'] is description['entity']:
+                page = [row[0] for row in rows]
+            else:
+                page = rows
+            if rows:
+                # The window function counts the rows before any limit or
+                # offset from the search parameters is applied.
+                num_results = max(rows[0][-1] - (instances._offset or 0), 0)
+                if limit is not None:
+                    num_results = min(num_results, limit)
+            elif start > 0:
+                # The requested page is past the end of the results.
+                num_results = self._count(instances, 'exact')
+            else:
+                num_results = 0
+        else:
+            if isinstance(instances, list):
+                num_results = len(instances)
+            else:
+                num_results = self._count(instances, strategy)
+            page = instances[start:stop(end)]
+        if results_per_page > 0:
+            total_pages = int(math.ceil(num_results / results_per_page))
+        else:
             total_pages = 1
-        objects = [to_dict(x, deep, exclude=self.exclude_columns,
-                           exclude_relations=self.exclude_relations,
-                           include=self.include_columns,
-                           include_relations=self.include_relations,
-                           include_methods=self.include_methods)
-                   for x in instances[start:end]]
+        objects = _serialize_all(page, serialize, stream)
         return dict(page=page_num, objects=objects, total_pages=total_pages,
                     num_results=num_results)
 
+    def _cursor_serializer(self):
+        """Returns the serializer which signs the cursors of responses
+        paginated by keyset using the secret key of the current application.
+
+        """
+        return URLSafeSerializer(current_app.secret_key, salt=CURSOR_SALT)
+
+    def _encode_cursor(self, ordering, instance, backward=False):
+        """Returns the cursor identifying the position of `instance` in a
+        query ordered by `ordering`, a list as returned by
+        :func:`~flask.ext.restless.search.keyset_order`.
+
+        If `backward` is ``True``, the cursor requests the page of instances
+        preceding `instance` instead of the page following it.
+
+        """
+        fields = [field for field, column, direction in ordering]
+        values = keyset_values(ordering, instance)
+        return self._cursor_serializer().dumps([fields, values, backward])
+
+    def _decode_cursor(self, cursor, ordering):
+        """Returns the pair ``(values, backward)`` encoded in `cursor` by
+        :meth:`_encode_cursor`.
+
+        Raises :exc:`ValueError` if `cursor` has been tampered with or if it
+        was created for a query with a different ordering.
+
+        """
+        serializer = self._cursor_serializer()
+        try:
+            fields, values, backward = serializer.loads(cursor)
+        except (BadData, TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        if fields != [field for field, column, direction in ordering]:
+            raise ValueError('Cursor does not match the search query')
+        try:
+            values = parse_keyset_values(ordering, values)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError('Invalid cursor')
+        return values, backward
+
+    def _keyset_paginated(self, query, search_params, serialize,
+                          stream=False):
+        """Returns a JSONified response containing the page of instances from
+        `query` identified by the ``cursor`` query parameter of the request.
+
+        Instead of skipping the instances on previous pages with an
+        ``OFFSET`` clause, the query is restricted to the instances which come
+        after (or before) the instance encoded in the cursor in the ordering
+        of the query, so the cost of fetching a page does not depend on its
+        position in the collection.
+
+        `search_params` is the dictionary of search parameters from which
+        `query` was created; `serialize` and `stream` are as in
+        :meth:`_paginated`.
+
+        The response data is JSON of the form:
+
+        .. sourcecode:: javascript
+
+           {
+             "next_cursor": "WyJpZCJdLFsxMF0sZmFsc2Vd.ZkT5l1...",
+             "prev_cursor": null,
+             "objects": [{"id": 1, "name": "Jeffrey", "age": 24}, ...]
+           }
+
+        Raises :exc:`ValueError` if the cursor is invalid, and
+        :exc:`RuntimeError` if the application has no secret key, since
+        cursors signed with an empty key could be forged by any client.
+
+        """
+        if not current_app.secret_key:
+            raise RuntimeError('Pagination by keyset requires the secret key'
+                               ' of the application to be set')
+        ordering = keyset_order(self.model, search_params)
+        cursor = request.args.get('cursor')
+        backward = False
+        if cursor:
+            values, backward = self._decode_cursor(cursor, ordering)
+            query = query.filter(keyset_filter(ordering, values, backward))
+        # Replace the requested ordering by the equivalent ordering which
+        # breaks ties using the primary key and places NULL values
+        # consistently, as the filter above requires.
+        query = query.order_by(None)
+        query = query.order_by(*keyset_order_by(ordering, backward))
+        results_per_page = self._compute_results_per_page()
+        if results_per_page > 0:
+            # Fetch one extra instance to learn whether there is another page.
+            instances = query.limit(results_per_page + 1).all()
+            has_more = len(instances) > results_per_page
+            instances = instances[:results_per_page]
+        else:
+            instances = query.all()
+            has_more = False
+        if backward:
+            instances.reverse()
+        next_cursor = prev_cursor = None
+        if instances:
+            if has_more or backward:
+                next_cursor = self._encode_cursor(ordering, instances[-1])
+            if has_more if backward else cursor:
+                prev_cursor = self._encode_cursor(ordering, instances[0],
+                                                  backward=True)
+        objects = _serialize_all(instances, serialize, stream)
+        return dict(objects=objects, next_cursor=next_cursor,
+                    prev_cursor=prev_cursor)
+
     def _inst_to_dict(self, inst):
         """Returns the dictionary representation of the specified instance.
 
@@ -989,24 +1716,27 @@ class API(ModelView):
         constructor of this class.
 
         """
-        # create a placeholder for the relations of the returned models
-        relations = frozenset(get_relations(self.model))
-        # do not follow relations that will not be included in the response
-        if self.include_columns is not None:
-            cols = frozenset(self.include_columns)
-            rels = frozenset(self.include_relations)
-            relations &= (cols | rels)
-        elif self.exclude_columns is not None:
-            relations -= frozenset(self.exclude_columns)
-        deep = dict((r, {}) for r in relations)
-        return to_dict(inst, deep, exclude=self.exclude_columns,
-                       exclude_relations=self.exclude_relations,
-                       include=self.include_columns,
-                       include_relations=self.include_relations,
-                       include_methods=self.include_methods)
-
-    def _dict_to_inst(self, data):
-        """Returns an instance of the model with the specified attributes."""
+        return self._serialization_plan(inst)
+
+    def _related_identity(self, items):
+        """Returns the existing related instances referenced by the relations
+        in each dictionary in `items`, as computed by
+        :func:`~flask.ext.restless.helpers.resolve_existing`.
+
+        """
+        relations = get_relations(self.model)
+        payloads = [dict((k, v) for k, v in data.items() if k in relations)
+                    for data in items if isinstance(data, dict)]
+        return resolve_existing(self.session, self.model, payloads)
+
+    def _dict_to_inst(self, data, identity=None):
+        """Returns an instance of the model with the specified attributes.
+
+        `identity` is a dictionary of the existing related instances
+        referenced by `data`, as returned by :meth:`_related_identity`. If it
+        is not specified, it is computed from `data`.
+
+        """
         # Check for any request parameter naming a column which does not exist
         # on the current model.
         for field in data:
@@ -1031,6 +1761,10 @@ class API(ModelView):
         modelargs = dict([(i, data[i]) for i in props])
         instance = self.model(**modelargs)
 
+        # Load the existing related instances with one query per model.
+        if identity is None:
+            identity = self._related_identity([data])
+
         # Handling relations, a single level is allowed
         for col in set(relations).intersection(paramkeys):
             submodel = get_related_model(self.model, col)
@@ -1039,7 +1773,7 @@ class API(ModelView):
                 # model has several related objects
                 for subparams in data[col]:
                     subinst = get_or_create(self.session, submodel,
-                                            subparams)
+                                            subparams, identity)
                     try:
                         getattr(instance, col).append(subinst)
                     except AttributeError:
@@ -1048,23 +1782,131 @@ class API(ModelView):
             else:
                 # model has single related object
                 subinst = get_or_create(self.session, submodel,
-                                        data[col])
+                                        data[col], identity)
                 setattr(instance, col, subinst)
 
         return instance
 
-    def _instid_to_dict(self, instid):
-        """Returns the dictionary representation of the instance specified by
-        `instid`.
+    def _resolve_dates(self, model, search_params):
+        """Replaces the date strings in the values of the filters in
+        `search_params` with the corresponding date objects, as required by
+        the fields of `model` on which they filter.
 
-        If no such instance of the model exists, this method aborts with a
-        :http:statuscode:`404`.
+        Raises :exc:`ValueError` if a date string cannot be parsed.
 
         """
-        inst = get_by(self.session, self.model, instid, self.primary_key)
-        if inst is None:
-            return {_STATUS: 404}, 404
-        return self._inst_to_dict(inst)
+        for param in search_params.get('filters', list()):
+            if 'name' in param and 'val' in param:
+                query_model = model
+                query_field = param['name']
+                if '__' in param['name']:
+                    fieldname, relation = param['name'].split('__')
+                    submodel = getattr(model, fieldname)
+                    if isinstance(submodel, InstrumentedAttribute):
+                        query_model = submodel.property.mapper.class_
+                        query_field = relation
+                    elif isinstance(submodel, AssociationProxy):
+                        # For the sake of brevity, rename this function.
+                        get_assoc = get_related_association_proxy_model
+                        query_model = get_assoc(submodel)
+                        query_field = relation
+                to_convert = {query_field: param['val']}
+                result = strings_to_dates(query_model, to_convert)
+                param['val'] = result.get(query_field)
+
+    def _cache_headers(self):
+        """Returns the dictionary of caching headers configured for responses
+        to :http:method:`get` requests.
+
+        """
+        if self.cache_control is None:
+            return {}
+        return {'Cache-Control': self.cache_control}
+
+    def _validators(self, version, last_modified=None):
+        """Returns a dictionary containing a strong :http:header:`ETag` header
+        identifying the representation of the requested resource whose
+        version is `version`, and a :http:header:`Last-Modified` header if
+        `last_modified` is a :class:`datetime.datetime`.
+
+        The ETag also depends on the path and query string of the request, so
+        that different resources and different pages of a collection do not
+        share ETags.
+
+        """
+        key = repr((request.full_path, version)).encode('utf-8')
+        headers = dict(ETag='"{0}"'.format(hashlib.sha1(key).hexdigest()))
+        if isinstance(last_modified, datetime.datetime):
+            headers['Last-Modified'] = http_date(last_modified)
+        return headers
+
+    def _body_validators(self, result):
+        """Returns the validators, as computed by :meth:`_validators`, for the
+        encoded body of the response whose content is the dictionary
+        `result`.
+
+        """
+        return self._validators(_canonical_dumps(result))
+
+    def _version_validators(self, instid):
+        """Returns the validators, as computed by :meth:`_validators`, for the
+        instance of the model whose primary key is `instid`, computed from the
+        value of its version column alone, or ``None`` if there is no such
+        instance.
+
+        """
+        column = getattr(self.model, self.version_column)
+        query = query_by_primary_key(self.session, self.model, instid,
+                                     self.primary_key)
+        row = query.with_entities(column).first()
+        if row is None:
+            return None
+        return self._validators(row[0], row[0])
+
+    def _collection_validators(self, search_params):
+        """Returns the validators, as computed by :meth:`_validators`, for the
+        collection of instances matching `search_params`, computed from the
+        greatest value of the version column among them and their number in
+        a single aggregate query.
+
+        """
+        column = getattr(self.model, self.version_column)
+        # Start from the query for the model, which may be a custom query
+        # that hides some instances, as described in "Custom queries".
+        query = session_query(self.session, self.model)
+        query = query.with_entities(column.label('version'))
+        versions = search(self.session, self.model, search_params,
+                          query=query)
+        versions = versions.subquery()
+        query = self.session.query(func.max(versions.c.version), func.count())
+        latest, count = query.one()
+        return self._validators((latest, count), latest)
+
+    def _not_modified(self, validators):
+        """Returns ``True`` if the conditional headers of the request show that
+        the client already has the representation identified by the headers
+        in `validators`, as computed by :meth:`_validators`.
+
+        As specified by :rfc:`7232`, the :http:header:`If-Modified-Since`
+        header is ignored if the request has an :http:header:`If-None-Match`
+        header.
+
+        """
+        if request.if_none_match:
+            return request.if_none_match.contains(validators['ETag'][1:-1])
+        if request.if_modified_since and 'Last-Modified' in validators:
+            last_modified = parse_date(validators['Last-Modified'])
+            return last_modified <= request.if_modified_since
+        return False
+
+    def _not_modified_response(self, validators):
+        """Returns a :http:statuscode:`304` response with the headers in
+        `validators` and the configured caching headers.
+
+        """
+        headers = dict(validators)
+        headers.update(self._cache_headers())
+        return {_HEADERS: headers, _STATUS: 304}, 304, headers
 
     def _search(self):
         """Defines a generic search function for the database model.
@@ -1135,7 +1977,7 @@ class API(ModelView):
         """
         # try to get search query from the request query parameters
         try:
-            search_params = json.loads(request.args.get('q', '{}'))
+            search_params = _loads(request.args.get('q', '{}'))
         except (TypeError, ValueError, OverflowError) as exception:
             current_app.logger.exception(str(exception))
             return dict(message='Unable to decode data'), 400
@@ -1144,32 +1986,29 @@ class API(ModelView):
             preprocessor(search_params=search_params)
 
         # resolve date-strings as required by the model
-        for param in search_params.get('filters', list()):
-            if 'name' in param and 'val' in param:
-                query_model = self.model
-                query_field = param['name']
-                if '__' in param['name']:
-                    fieldname, relation = param['name'].split('__')
-                    submodel = getattr(self.model, fieldname)
-                    if isinstance(submodel, InstrumentedAttribute):
-                        query_model = submodel.property.mapper.class_
-                        query_field = relation
-                    elif isinstance(submodel, AssociationProxy):
-                        # For the sake of brevity, rename this function.
-                        get_assoc = get_related_association_proxy_model
-                        query_model = get_assoc(submodel)
-                        query_field = relation
-                to_convert = {query_field: param['val']}
-                try:
-                    result = strings_to_dates(query_model, to_convert)
-                except ValueError as exception:
-                    current_app.logger.exception(str(exception))
-                    return dict(message='Unable to construct query'), 400
-                param['val'] = result.get(query_field)
+        try:
+            self._resolve_dates(self.model, search_params)
+        except ValueError as exception:
+            current_app.logger.exception(str(exception))
+            return dict(message='Unable to construct query'), 400
+
+        # Serialize rows of plain columns instead of instances of the model,
+        # if possible.
+        columns = self._fast_read_columns(search_params)
+        if columns is None:
+            serialize = self._serialization_plan
+            query, options = None, self._loader_options
+        else:
+            serialize = self._serialization_plan.serialize_row
+            # Start from the query for the model, which may be a custom query
+            # that hides some instances, as described in "Custom queries".
+            query = session_query(self.session, self.model)
+            query, options = query.with_entities(*columns), None
 
         # perform a filtered search
         try:
-            result = search(self.session, self.model, search_params)
+            result = search(self.session, self.model, search_params,
+                            options=options, query=query)
         except NoResultFound:
             return dict(message='No result found'), 404
         except MultipleResultsFound:
@@ -1178,35 +2017,61 @@ class API(ModelView):
             current_app.logger.exception(str(exception))
             return dict(message='Unable to construct query'), 400
 
-        # create a placeholder for the relations of the returned models
-        relations = frozenset(get_relations(self.model))
-        # do not follow relations that will not be included in the response
-        if self.include_columns is not None:
-            cols = frozenset(self.include_columns)
-            rels = frozenset(self.include_relations)
-            relations &= (cols | rels)
-        elif self.exclude_columns is not None:
-            relations -= frozenset(self.exclude_columns)
-        deep = dict((r, {}) for r in relations)
+        strategy = request.args.get('count', self.count_strategy)
+        if isinstance(result, Query) and strategy not in COUNT_STRATEGIES:
+            msg = 'Unknown count strategy "{0}"'.format(strategy)
+            return dict(message=msg), 400
+        # Answer a conditional request from a single aggregate query over the
+        # version column, before fetching and serializing any instances.
+        validators = None
+        if self.etags and self.version_column is not None \
+                and isinstance(result, Query) \
+                and not search_params.get('group_by'):
+            validators = self._collection_validators(search_params)
+            if self._not_modified(validators):
+                return self._not_modified_response(validators)
+        count_only = request.args.get('count_only', '').lower() == 'true'
+        # Postprocessors and JSONP callbacks need the complete result.
+        stream = self.streaming and not self.postprocessors['GET_MANY'] \
+            and not request.args.get('callback')
 
         # for security purposes, don't transmit list as top-level JSON
-        if isinstance(result, Query):
-            result = self._paginated(result, deep)
+        if isinstance(result, Query) and count_only:
+            # Counting requires an actual count, even if the client would
+            # otherwise prefer not to count.
+            if strategy == 'none':
+                strategy = 'exact'
+            result = dict(num_results=self._count(result, strategy))
+            headers = {}
+        elif isinstance(result, Query) and self.pagination == 'keyset':
+            try:
+                result = self._keyset_paginated(result, search_params,
+                                                serialize, stream)
+            except ValueError as exception:
+                current_app.logger.exception(str(exception))
+                return dict(message=str(exception)), 400
+            except RuntimeError as exception:
+                current_app.logger.exception(str(exception))
+                return dict(message=str(exception)), 500
+            linkstring = create_link_string(None, None,
+                                            self._compute_results_per_page(),
+                                            result['next_cursor'],
+                                            result['prev_cursor'])
+            headers = dict(Link=linkstring)
+        elif isinstance(result, Query):
+            result = self._paginated(result, serialize, strategy, stream)
             # Create the Link header.
             #
             # TODO We are already calling self._compute_results_per_page() once
             # in _paginated(); don't compute it again here.
-            page, last_page = result['page'], result['total_pages']
+            page, last_page = result['page'], result.get('total_pages')
             linkstring = create_link_string(page, last_page,
-                                            self._compute_results_per_page())
+                                            self._compute_results_per_page(),
+                                            has_more=result.get('has_more'))
             headers = dict(Link=linkstring)
         else:
-            primary_key = self.primary_key or primary_key_name(result)
-            result = to_dict(result, deep, exclude=self.exclude_columns,
-                             exclude_relations=self.exclude_relations,
-                             include=self.include_columns,
-                             include_relations=self.include_relations,
-                             include_methods=self.include_methods)
+            primary_key = self.primary_key or primary_key_name(self.model)
+            result = serialize(result)
             # The URL at which a client can access the instance matching this
             # search query.
             url = '{0}/{1}'.format(request.base_url, result[primary_key])
@@ -1215,10 +2080,22 @@ class API(ModelView):
         for postprocessor in self.postprocessors['GET_MANY']:
             postprocessor(result=result, search_params=search_params)
 
+        # Streamed responses are not encoded until they are sent, so their
+        # ETag cannot be computed from their body.
+        if self.etags and validators is None \
+                and not (stream and 'objects' in result):
+            validators = self._body_validators(result)
+            if self._not_modified(validators):
+                return self._not_modified_response(validators)
+        headers.update(validators or {})
+        headers.update(self._cache_headers())
+
         # HACK Provide the headers directly in the result dictionary, so that
         # the :func:`jsonpify` function has access to them. See the note there
         # for more information.
         result[_HEADERS] = headers
+        if stream and 'objects' in result:
+            result[_STREAM] = True
         return result, 200, headers
 
     def get(self, instid, relationname, relationinstid):
@@ -1248,8 +2125,20 @@ class API(ModelView):
             # instid.
             if temp_result is not None:
                 instid = temp_result
-        # get the instance of the "main" model whose ID is instid
-        instance = get_by(self.session, self.model, instid, self.primary_key)
+        # Answer a conditional request from the version column alone, before
+        # loading and serializing the instance.
+        use_version = self.etags and self.version_column is not None \
+            and relationname is None
+        if use_version and (request.if_none_match
+                            or request.if_modified_since):
+            validators = self._version_validators(instid)
+            if validators is not None and self._not_modified(validators):
+                return self._not_modified_response(validators)
+        # Get the instance of the "main" model whose ID is instid, eagerly
+        # loading its relations only if it will be serialized.
+        options = self._loader_options if relationname is None else None
+        instance = get_by(self.session, self.model, instid, self.primary_key,
+                          options)
         if instance is None:
             return {_STATUS: 404}, 404
         # If no relation is requested, just return the instance. Otherwise,
@@ -1257,7 +2146,6 @@ class API(ModelView):
         if relationname is None:
             result = self.serialize(instance)
         else:
-            related_value = getattr(instance, relationname)
             # create a placeholder for the relations of the returned models
             related_model = get_related_model(self.model, relationname)
             relations = frozenset(get_relations(related_model))
@@ -1271,14 +2159,89 @@ class API(ModelView):
             else:
                 # for security purposes, don't transmit list as top-level JSON
                 if is_like_list(instance, relationname):
-                    result = self._paginated(list(related_value), deep)
+                    attr = getattr(self.model, relationname)
+                    plan = self._plan_for(related_model, deep)
+                    if isinstance(attr, AssociationProxy):
+                        related_value = getattr(instance, relationname)
+                        result = self._paginated(list(related_value), plan)
+                    else:
+                        result = self._related_search(instance, relationname,
+                                                      related_model, deep,
+                                                      plan)
+                        # The result is an error response.
+                        if isinstance(result, tuple):
+                            return result
                 else:
-                    result = to_dict(related_value, deep)
+                    result = to_dict(getattr(instance, relationname), deep)
         if result is None:
             return {_STATUS: 404}, 404
         for postprocessor in self.postprocessors['GET_SINGLE']:
             postprocessor(result=result)
-        return result
+        headers = self._cache_headers()
+        if self.etags:
+            if use_version:
+                version = getattr(instance, self.version_column)
+                validators = self._validators(version, version)
+            else:
+                validators = self._body_validators(result)
+            if self._not_modified(validators):
+                return self._not_modified_response(validators)
+            headers.update(validators)
+        if headers:
+            result[_HEADERS] = headers
+        return result, 200, headers
+
+    def _related_search(self, instance, relationname, related_model, deep,
+                        serialize):
+        """Returns a paginated JSONified response containing the instances of
+        `related_model` related to `instance` by the relation named
+        `relationname`.
+
+        Instead of loading the entire related collection, this method queries
+        for the related instances matching the search parameters given in the
+        ``q`` query parameter of the request, so only the requested page of
+        related instances is fetched from the database.
+
+        `deep` is the dictionary of relations of `related_model` to include in
+        the response, and `serialize` is the function which converts each
+        related instance to a dictionary, as in :meth:`_paginated`.
+
+        If there is a problem with the search parameters, this method returns
+        a pair containing the error response and its status code.
+
+        """
+        try:
+            search_params = _loads(request.args.get('q', '{}'))
+        except (TypeError, ValueError, OverflowError) as exception:
+            current_app.logger.exception(str(exception))
+            return dict(message='Unable to decode data'), 400
+        strategy = request.args.get('count', self.count_strategy)
+        if strategy not in COUNT_STRATEGIES:
+            msg = 'Unknown count strategy "{0}"'.format(strategy)
+            return dict(message=msg), 400
+        query = session_query(self.session, related_model)
+        query = query.with_parent(instance, relationname)
+        prop = sqlalchemy_inspect(self.model).relationships[relationname]
+        options = loader_options(related_model, deep)
+        try:
+            # Unless the client requests an ordering, order the related
+            # instances as the relation itself does, breaking ties by primary
+            # key.
+            if prop.order_by and not search_params.get('order_by'):
+                query = query.order_by(*prop.order_by)
+            self._resolve_dates(related_model, search_params)
+            result = search(self.session, related_model, search_params,
+                            options=options, query=query)
+        except NoResultFound:
+            return dict(message='No result found'), 404
+        except MultipleResultsFound:
+            return dict(message='Multiple results found'), 400
+        except Exception as exception:
+            current_app.logger.exception(str(exception))
+            return dict(message='Unable to construct query'), 400
+        if isinstance(result, Query):
+            return self._paginated(result, serialize, strategy)
+        return serialize(result)
 
     def _delete_many(self):
         """Deletes multiple instances of the model.
@@ -1286,6 +2249,11 @@ class API(ModelView):
         If search parameters are provided via the ``q`` query parameter, only
         those instances matching the search parameters will be deleted.
 
+        If a list of primary keys is provided, either via the ``ids`` query
+        parameter or as the ``ids`` element of a JSON object in the body of
+        the request, only the instances with those primary keys will be
+        deleted, as described in :meth:`_delete_by_ids`.
+
         If no instances were deleted, this returns a
         :http:status:`404`. Otherwise, it returns a :http:status:`200` with the
         number of deleted instances in the body of the response.
@@ -1293,14 +2261,48 @@ class API(ModelView):
         """
         # try to get search query from the request query parameters
         try:
-            search_params = json.loads(request.args.get('q', '{}'))
+            search_params = _loads(request.args.get('q', '{}'))
         except (TypeError, ValueError, OverflowError) as exception:
             current_app.logger.exception(str(exception))
             return dict(message='Unable to decode search query'), 400
 
+        try:
+            ids = self._ids_to_delete()
+        except (TypeError, ValueError, OverflowError) as exception:
+            current_app.logger.exception(str(exception))
+            return dict(message='Unable to decode primary keys'), 400
+        id_filter = None
+        if ids is not None:
+            if 'q' in request.args:
+                msg = 'Cannot specify both primary keys and a search query'
+                return dict(message=msg), 400
+            if not isinstance(ids, list) \
+               or any(isinstance(key, (dict, list)) for key in ids):
+                msg = 'Primary keys must be given as a list of values'
+                return dict(message=msg), 400
+            pk_name = self.primary_key or primary_key_name(self.model)
+            id_filter = dict(name=pk_name, op='in', val=ids)
+            search_params = dict(filters=[id_filter])
+
         for preprocessor in self.preprocessors['DELETE_MANY']:
             preprocessor(search_params=search_params)
 
+        if id_filter is not None:
+            try:
+                queries = self._queries_by_ids(search_params, id_filter)
+            except Exception as exception:
+                current_app.logger.exception(str(exception))
+                return dict(message='Unable to construct query'), 400
+            # Errors raised while deleting, like integrity errors, are handled
+            # by the decorators of this view.
+            counts = self._delete_by_ids(queries)
+            self.session.commit()
+            num_deleted = sum(counts)
+            result = dict(num_deleted=num_deleted, chunks=counts)
+            for postprocessor in self.postprocessors['DELETE_MANY']:
+                postprocessor(result=result, search_params=search_params)
+            return result, 200 if num_deleted > 0 else 404
+
         # perform a filtered search
         try:
             # HACK We need to ignore any ``order_by`` request from the client,
@@ -1337,7 +2339,81 @@ class API(ModelView):
         result = dict(num_deleted=num_deleted)
         for postprocessor in self.postprocessors['DELETE_MANY']:
             postprocessor(result=result, search_params=search_params)
-        return (result, 200) if num_deleted > 0 else 404
+        return result, 200 if num_deleted > 0 else 404
+
+    def _ids_to_delete(self):
+        """Returns the list of primary keys of the instances to delete given
+        by the ``ids`` query parameter (a JSON list) or by the ``ids`` element
+        of the JSON object in the body of the request, or ``None`` if neither
+        is present.
+
+        The body of the request is read only if the request has no ``q`` query
+        parameter, since a search query is a request to delete the instances
+        it matches, whatever the body contains.
+
+        Raises :exc:`ValueError` if either cannot be decoded.
+
+        """
+        if 'ids' in request.args:
+            return _loads(request.args['ids'])
+        if 'q' in request.args:
+            return None
+        data = request.get_data()
+        if not data:
+            return None
+        data = _loads(data.decode('utf-8'))
+        if not isinstance(data, dict):
+            raise ValueError('Request body must be a JSON object')
+        return data.get('ids')
+
+    def _queries_by_ids(self, search_params, id_filter):
+        """Returns the list of queries selecting the instances of the model
+        matching `search_params`, whose filter `id_filter` restricts the
+        primary key to a list of values, one query for each chunk of at most
+        :data:`~flask_restless.helpers.KEY_CHUNK_SIZE` of those values.
+
+        This function only builds the queries; it raises an exception if the
+        search parameters are invalid, but does not touch the database.
+
+        """
+        ids = id_filter['val']
+        queries = []
+        try:
+            for chunk in chunks(ids):
+                id_filter['val'] = chunk
+                # See the note on ``order_by`` in :meth:`_delete_many`.
+                queries.append(search(self.session, self.model, search_params,
+                                      _ignore_order_by=True))
+        finally:
+            id_filter['val'] = ids
+        return queries
+
+    def _delete_by_ids(self, queries):
+        """Deletes the instances of the model selected by each of the queries
+        in the list `queries`, as returned by :meth:`_queries_by_ids`, and
+        returns the list of the numbers of instances deleted by each query.
+
+        If :func:`~flask_restless.helpers.bulk_delete_possible` holds for the
+        model, each query is executed as a single ``DELETE`` statement.
+        Otherwise the instances selected by each query are loaded and deleted
+        through the ORM, so that its cascades and delete events apply, and the
+        session is flushed after each query.
+
+        The session is not committed.
+
+        """
+        bulk = bulk_delete_possible(self.model)
+        counts = []
+        for query in queries:
+            if bulk:
+                counts.append(query.delete(synchronize_session=False))
+            else:
+                instances = query.all()
+                for instance in instances:
+                    self.session.delete(instance)
+                self.session.flush()
+                counts.append(len(instances))
+        return counts
 
     def delete(self, instid, relationname, relationinstid):
         """Removes the specified instance of the model with the specified name
@@ -1363,7 +2439,6 @@ class API(ModelView):
             # delete many instances of the model via a search with possible
             # filters.
             return self._delete_many()
-        was_deleted = False
         for preprocessor in self.preprocessors['DELETE_SINGLE']:
             temp_result = preprocessor(instance_id=instid,
                                        relation_name=relationname,
@@ -1371,29 +2446,344 @@ class API(ModelView):
             # See the note under the preprocessor in the get() method.
             if temp_result is not None:
                 instid = temp_result
-        inst = get_by(self.session, self.model, instid, self.primary_key)
-        if relationname:
-            # If the request is ``DELETE /api/person/1/computers``, error 400.
-            if not relationinstid:
-                msg = ('Cannot DELETE entire "{0}"'
-                       ' relation').format(relationname)
-                return dict(message=msg), 400
-            # Otherwise, get the related instance to delete.
-            relation = getattr(inst, relationname)
-            related_model = get_related_model(self.model, relationname)
-            relation_instance = get_by(self.session, related_model,
-                                       relationinstid)
-            # Removes an object from the relation list.
-            relation.remove(relation_instance)
-            was_deleted = len(self.session.dirty) > 0
-        elif inst is not None:
-            self.session.delete(inst)
-            was_deleted = len(self.session.deleted) > 0
-        self.session.commit()
+        # If the request is ``DELETE /api/person/1/computers``, error 400.
+        if relationname and not relationinstid:
+            msg = 'Cannot DELETE entire "{0}" relation'.format(relationname)
+            return dict(message=msg), 400
+
+        def write():
+            inst = get_by(self.session, self.model, instid, self.primary_key)
+            if relationname:
+                # Get the related instance to delete.
+                relation = getattr(inst, relationname)
+                related_model = get_related_model(self.model, relationname)
+                relation_instance = get_by(self.session, related_model,
+                                           relationinstid)
+                # Removes an object from the relation list.
+                relation.remove(relation_instance)
+                was_deleted = inst in self.session.dirty
+            elif inst is not None:
+                self.session.delete(inst)
+                was_deleted = inst in self.session.deleted
+            else:
+                was_deleted = False
+            # Flush the changes, so that they are not confused with those of
+            # other writes committed along with this one.
+            self.session.flush()
+            return was_deleted
+
+        was_deleted = self._commit_write(write)
         for postprocessor in self.postprocessors['DELETE_SINGLE']:
             postprocessor(was_deleted=was_deleted)
         return {}, 204 if was_deleted else 404
 
+    def _bulk_update_values(self, search_params, data, expressions):
+        """Returns the dictionary of values with which to update all instances
+        matching `search_params` in a single ``UPDATE`` statement, as
+        requested by a :http:method:`patch` request on the collection with
+        request data `data` and the SQL expressions `expressions` computed by
+        :func:`~flask.ext.restless.helpers.update_expressions`, or ``None`` if
+        the instances must be loaded and updated through the ORM instead.
+
+        This is the case if `orm_updates` or validation exceptions were
+        specified in the constructor of this class, if the model does not
+        allow bulk updates (see
+        :func:`~flask.ext.restless.helpers.bulk_update_columns`), if `data`
+        sets a field which is not a column of the model, like a relation, or
+        if the search parameters specify a limit, an offset, or a grouping.
+
+        """
+        if self.orm_updates:
+            return None
+        if set(self.validation_exceptions) - set([ValidationError]):
+            return None
+        columns = bulk_update_columns(self.model)
+        if columns is None or not columns.issuperset(data):
+            return None
+        if any(search_params.get(key)
+               for key in ('limit', 'offset', 'group_by')):
+            return None
+        values = strings_to_dates(self.model, data)
+        values.update(expressions)
+        return values
+
+    def _location(self, primary_key):
+        """Returns the URL at which a client can access the instance of the
+        model whose primary key is `primary_key`.
+
+        """
+        # URL-encode the primary key, in case it is a Unicode string.
+        try:
+            primary_key = str(primary_key)
+        except UnicodeEncodeError:
+            primary_key = url_quote_plus(primary_key.encode('utf-8'))
+        return '{0}/{1}'.format(request.base_url, primary_key)
+
+    def _commit_write(self, write):
+        """Calls `write`, a function of no arguments which makes changes in
+        the session, commits the session, and returns the result of `write`.
+
+        If group commit was enabled in the constructor of this class, `write`
+        is called and committed, along with concurrent writes, by the
+        :class:`~flask.ext.restless.helpers.GroupCommitter` of this API in a
+        thread of its own, and this method waits for the outcome. This is not
+        the case if a savepoint is open in the session, as it is for each
+        operation of a request to the :class:`BatchAPI`, since the write must
+        then be part of the enclosing transaction.
+
+        """
+        if self.group_committer is not None:
+            # Group commit requires a scoped session, so calling it returns
+            # the session of the current thread.
+            transaction = self.session().transaction
+            if transaction is None or not transaction.nested:
+                app = current_app._get_current_object()
+                return self.group_committer.submit(app, write)
+        result = write()
+        self.session.commit()
+        return result
+
+    def _bulk_mappings(self, items):
+        """Returns a list containing, for each dictionary in `items`, a
+        dictionary mapping column names to values suitable for
+        :meth:`sqlalchemy.orm.session.Session.bulk_insert_mappings`, or
+        ``None`` if the instances must be created through the ORM instead.
+
+        This is the case if a custom deserializer or validation exceptions were
+        specified in the constructor of this class, if the model does not
+        allow bulk inserts (see
+        :func:`~flask.ext.restless.helpers.bulk_insert_columns`), or if any
+        item sets a field which is not a column of the model, like a relation,
+        or sets a column to a SQL function, like ``CURRENT_TIMESTAMP``.
+
+        """
+        if self.deserialize != self._dict_to_inst \
+                or self.validation_exceptions != (ValidationError, ):
+            return None
+        columns = bulk_insert_columns(self.model)
+        if columns is None:
+            return None
+        mappings = []
+        for data in items:
+            if not columns.issuperset(data):
+                return None
+            mapping = strings_to_dates(self.model, data)
+            if any(isinstance(value, ClauseElement)
+                   for value in mapping.values()):
+                return None
+            mappings.append(mapping)
+        return mappings
+
+    def _upsert_key(self, data):
+        """Returns the tuple of the values of the upsert keys (see
+        :meth:`_upsert`) in the dictionary `data`, converted to the Python
+        types of their columns.
+
+        Raises :exc:`ValueError` if a value cannot be converted.
+
+        """
+        keys = self.upsert_keys or primary_key_names(self.model)
+        values = strings_to_dates(self.model, dict((k, data[k]) for k in keys))
+        values = strings_to_numbers(self.model, values)
+        return tuple(values[k] for k in keys)
+
+    def _upsert_errors(self, items):
+        """Returns a list of errors, each of which contains the ``"index"`` of
+        a dictionary in `items` which cannot be upserted by :meth:`_upsert`
+        because it names a field which does not exist on the model or does not
+        specify the values of the upsert keys.
+
+        """
+        keys = self.upsert_keys or primary_key_names(self.model)
+        errors = []
+        for index, data in enumerate(items):
+            if not isinstance(data, dict):
+                continue
+            unknown = [field for field in data
+                       if not has_field(self.model, field)]
+            if unknown:
+                msg = "Model does not have field '{0}'".format(unknown[0])
+            elif not all(key in data for key in keys):
+                msg = 'Object must specify {0}'.format(', '.join(keys))
+            else:
+                try:
+                    hash(self._upsert_key(data))
+                    continue
+                except (TypeError, ValueError):
+                    msg = 'Invalid value of {0}'.format(', '.join(keys))
+            errors.append(dict(index=index, message=msg))
+        return errors
+
+    def _upsert(self, items):
+        """Creates an instance of the model for each dictionary in `items`, or
+        updates the existing instance which has the same values of the upsert
+        keys, and returns the list of these instances.
+
+        The upsert keys are the attributes named in the `upsert_keys` argument
+        to the constructor of this class, or the primary key of the model.
+
+        If the model allows bulk inserts and updates (see
+        :meth:`_bulk_mappings`) and the database supports it, the rows are
+        written with a single statement (see
+        :func:`~flask.ext.restless.helpers.bulk_upsert`). Otherwise, the
+        existing instances are loaded with a single query and updated through
+        the ORM.
+
+        This function does not commit the changes made to the database. The
+        calling function has that responsibility.
+
+        """
+        keys = self.upsert_keys or primary_key_names(self.model)
+        # Set the upsert keys to values of the types of their columns, so that
+        # an existing instance is not updated with a value of another type.
+        converted = []
+        for data in items:
+            data = dict(data)
+            data.update(strings_to_numbers(self.model,
+                                           dict((k, data[k]) for k in keys)))
+            converted.append(data)
+        items = converted
+        identities = [self._upsert_key(data) for data in items]
+        # A row may not be affected twice by a single statement.
+        mappings = None
+        if len(set(identities)) == len(identities) \
+           and bulk_update_columns(self.model) is not None:
+            mappings = self._bulk_mappings(items)
+        if mappings is not None \
+           and bulk_upsert(self.session, self.model, mappings, keys):
+            instances = get_all_by(self.session, self.model, keys, identities)
+            return [instances[identity] for identity in identities]
+        instances = get_all_by(self.session, self.model, keys,
+                               set(identities))
+        result = []
+        for identity, data in zip(identities, items):
+            instance = instances.get(identity)
+            if instance is None:
+                instance = self.deserialize(data)
+                self.session.add(instance)
+                instances[identity] = instance
+            else:
+                relations = self._update_relations([instance], data)
+                values = dict((field, value) for field, value in data.items()
+                              if field not in relations)
+                for field, value in strings_to_dates(self.model,
+                                                     values).items():
+                    setattr(instance, field, value)
+            result.append(instance)
+        self.session.flush()
+        return result
+
+    def _post_many(self, items, upsert=False):
+        """Creates an instance of the model for each dictionary in `items`, as
+        parsed from the JSON array in the body of a :http:method:`post`
+        request, and commits them in a single transaction.
+
+        The ``POST`` preprocessors are applied to each item. If the model
+        allows it (see :meth:`_bulk_mappings`), the rows are inserted directly
+        with :meth:`sqlalchemy.orm.session.Session.bulk_insert_mappings`,
+        without constructing instances of the model. The rows are inserted in
+        a single batch if every item specifies its primary key; otherwise they
+        are inserted one at a time so that the generated primary keys can be
+        fetched.
+
+        The response data is JSON of the form:
+
+        .. sourcecode:: javascript
+
+           {
+             "num_created": 2,
+             "objects": [{"id": 1}, {"id": 2}]
+           }
+
+        where each element of ``"objects"`` contains the primary key of the
+        instance created from the corresponding item. If `upsert` is ``True``,
+        the instances are created or updated by :meth:`_upsert`, and the
+        response has :http:statuscode:`200` and contains ``"num_upserted"``
+        instead of ``"num_created"``. If the ``locations``
+        query parameter is ``true``, the response also includes the URL of
+        each instance in a ``"locations"`` list. The ``POST`` postprocessors
+        receive this dictionary.
+
+        If any item cannot be converted to an instance of the model, no
+        instances are created, and the response has :http:statuscode:`400`
+        and a list of errors, each of which contains the ``"index"`` of the
+        offending item.
+
+        """
+        if not self.max_bulk_size:
+            return dict(message='Request must contain a single object'), 400
+        if len(items) > self.max_bulk_size:
+            msg = 'Request must contain at most {0} objects'
+            return dict(message=msg.format(self.max_bulk_size)), 413
+        errors = []
+        for index, data in enumerate(items):
+            if not isinstance(data, dict):
+                errors.append(dict(index=index, message='Not an object'))
+                continue
+            for preprocessor in self.preprocessors['POST']:
+                preprocessor(data=data)
+        if upsert:
+            errors.extend(self._upsert_errors(items))
+            errors.sort(key=lambda error: error['index'])
+        if errors:
+            return dict(message='Unable to create objects', errors=errors), 400
+
+        pk_name = self.primary_key or primary_key_name(self.model)
+        mappings = None if upsert else self._bulk_mappings(items)
+        try:
+            if upsert:
+                instances = self._upsert(items)
+                keys = [getattr(instance, pk_name) for instance in instances]
+            elif mappings is not None:
+                names = set(primary_key_names(self.model)) | set([pk_name])
+                if all(mapping.get(name) is not None
+                       for mapping in mappings for name in names):
+                    # The client supplied the primary keys, so the rows can be
+                    # inserted by a single executemany() call.
+                    self.session.bulk_insert_mappings(self.model, mappings)
+                else:
+                    # Populates each mapping with its generated primary key,
+                    # which requires inserting the rows one at a time.
+                    self.session.bulk_insert_mappings(self.model, mappings,
+                                                      return_defaults=True)
+                keys = [mapping.get(pk_name) for mapping in mappings]
+            else:
+                deserialize = self.deserialize
+                # Resolve the related instances of all items at once.
+                if deserialize == self._dict_to_inst:
+                    identity = self._related_identity(items)
+                    deserialize = partial(self._dict_to_inst,
+                                          identity=identity)
+                instances = []
+                for index, data in enumerate(items):
+                    try:
+                        instances.append(deserialize(data))
+                    except self.validation_exceptions as exception:
+                        error = self._handle_validation_exception(exception)
+                        error = error[0]
+                        error['index'] = index
+                        errors.append(error)
+                if errors:
+                    self.session.rollback()
+                    return dict(message='Unable to create objects',
+                                errors=errors), 400
+                self.session.add_all(instances)
+                self.session.flush()
+                keys = [getattr(instance, pk_name) for instance in instances]
+            self.session.commit()
+        except self.validation_exceptions as exception:
+            return self._handle_validation_exception(exception)
+        objects = [{pk_name: key} for key in keys]
+        if upsert:
+            result, status = dict(num_upserted=len(keys), objects=objects), 200
+        else:
+            result, status = dict(num_created=len(keys), objects=objects), 201
+        if request.args.get('locations', '').lower() == 'true':
+            result['locations'] = [self._location(key) for key in keys]
+        for postprocessor in self.postprocessors['POST']:
+            postprocessor(result=result)
+        return result, status
+
     def post(self):
         """Creates a new instance of a given model based on request data.
 
@@ -1413,6 +2803,19 @@ class API(ModelView):
         Currently, this method can only handle instantiating a model with a
         single level of relationship data.
 
+        If the request data is a JSON array, one instance is created for each
+        object in the array, as described in :meth:`_post_many`.
+
+        If the ``upsert`` query parameter is ``true``, the existing instance
+        with the same values of the upsert keys is updated instead of a new
+        instance being created, if there is one (see :meth:`_upsert`), and the
+        response has :http:statuscode:`200`.
+
+        If the request prefers a minimal response (see
+        :func:`_prefers_minimal`), the created instance is not serialized and
+        the response contains an empty JSON object and only the
+        :http:header:`Location` header.
+
         """
         content_type = request.headers.get('Content-Type', None)
         content_is_json = content_type.startswith('application/json')
@@ -1428,47 +2831,65 @@ class API(ModelView):
         # try to read the parameters for the model from the body of the request
         try:
             # HACK Requests made from Internet Explorer 8 or 9 don't have the
-            # correct content type, so request.get_json() doesn't work.
-            if is_msie:
-                data = json.loads(request.get_data()) or {}
+            # correct content type, so request.get_json() doesn't work. A
+            # custom JSON backend decodes the body of the request itself.
+            if is_msie or _json_backend() is not None:
+                data = _loads(request.get_data())
             else:
-                data = request.get_json() or {}
+                data = request.get_json()
         except (BadRequest, TypeError, ValueError, OverflowError) as exception:
             current_app.logger.exception(str(exception))
             return dict(message='Unable to decode data'), 400
+        upsert = request.args.get('upsert', '').lower() == 'true'
+        if upsert and not self.allow_upsert:
+            return dict(message='Upserts are not allowed'), 400
+        if isinstance(data, list):
+            return self._post_many(data, upsert=upsert)
+        data = data or {}
 
         # apply any preprocessors to the POST arguments
         for preprocessor in self.preprocessors['POST']:
             preprocessor(data=data)
 
-        try:
-            # Convert the dictionary representation into an instance of the
-            # model.
-            instance = self.deserialize(data)
-            # Add the created model to the session.
-            self.session.add(instance)
-            self.session.commit()
+        if upsert:
+            errors = self._upsert_errors([data])
+            if errors:
+                return dict(message=errors[0]['message']), 400
+
+        minimal = _prefers_minimal()
+        pk_name = self.primary_key or primary_key_name(self.model)
+
+        def write():
+            if upsert:
+                instance, = self._upsert([data])
+            else:
+                # Convert the dictionary representation into an instance of
+                # the model.
+                instance = self.deserialize(data)
+                # Add the created model to the session.
+                self.session.add(instance)
             # Get the dictionary representation of the new instance as it
-            # appears in the database.
+            # appears in the database once it has been inserted, but before
+            # committing, which would expire the instance and force it to be
+            # loaded again.
+            self.session.flush()
+            if minimal:
+                return getattr(instance, pk_name), {}
             result = self.serialize(instance)
+            return result[pk_name], result
+
+        try:
+            primary_key, result = self._commit_write(write)
         except self.validation_exceptions as exception:
             return self._handle_validation_exception(exception)
-        # Determine the value of the primary key for this instance and
-        # encode URL-encode it (in case it is a Unicode string).
-        pk_name = self.primary_key or primary_key_name(instance)
-        primary_key = result[pk_name]
-        try:
-            primary_key = str(primary_key)
-        except UnicodeEncodeError:
-            primary_key = url_quote_plus(primary_key.encode('utf-8'))
-        # The URL at which a client can access the newly created instance
-        # of the model.
-        url = '{0}/{1}'.format(request.base_url, primary_key)
-        # Provide that URL in the Location header in the response.
-        headers = dict(Location=url)
+        # Provide the URL at which a client can access the newly created
+        # instance of the model in the Location header in the response.
+        headers = dict(Location=self._location(primary_key))
+        if minimal:
+            headers['Preference-Applied'] = 'return=minimal'
         for postprocessor in self.postprocessors['POST']:
             postprocessor(result=result)
-        return result, 201, headers
+        return result, 200 if upsert else 201, headers
 
     def patch(self, instid, relationname, relationinstid):
         """Updates the instance specified by ``instid`` of the named model, or
@@ -1476,7 +2897,10 @@ class API(ModelView):
 
         The :attr:`flask.request.data` attribute will be parsed as a JSON
         object containing the mapping from field name to value to which to
-        update the specified instance or instances.
+        update the specified instance or instances. A column may instead be
+        mapped to an operator object, like ``{"inc": 1}``, to update it
+        relative to its current value in the database (see
+        :func:`~flask.ext.restless.helpers.update_expressions`).
 
         If ``instid`` is ``None``, the query string will be used to search for
         instances (using the :func:`_search` method), and all matching
@@ -1485,6 +2909,11 @@ class API(ModelView):
         parameters for restricting the set of instances on which updates will
         be made in this case.
 
+        If the request prefers a minimal response (see
+        :func:`_prefers_minimal`), the updated instance is neither serialized
+        nor loaded along with its relations, and the response has
+        :http:statuscode:`204`.
+
         This function ignores the `relationname` and `relationinstid` keyword
         arguments.
 
@@ -1509,9 +2938,10 @@ class API(ModelView):
         # try to load the fields/values to update from the body of the request
         try:
             # HACK Requests made from Internet Explorer 8 or 9 don't have the
-            # correct content type, so request.get_json() doesn't work.
-            if is_msie:
-                data = json.loads(request.get_data()) or {}
+            # correct content type, so request.get_json() doesn't work. A
+            # custom JSON backend decodes the body of the request itself.
+            if is_msie or _json_backend() is not None:
+                data = _loads(request.get_data()) or {}
             else:
                 data = request.get_json() or {}
         except (BadRequest, TypeError, ValueError, OverflowError) as exception:
@@ -1542,23 +2972,60 @@ class API(ModelView):
                 msg = "Model does not have field '{0}'".format(field)
                 return dict(message=msg), 400
 
+        # Fields updated by an operator, like {"inc": 1}, are computed by the
+        # database instead of being set to a value.
+        try:
+            expressions = update_expressions(self.model, data)
+        except ValueError as exception:
+            current_app.logger.exception(str(exception))
+            return dict(message=str(exception)), 400
+
         if patchmany:
+            values = self._bulk_update_values(search_params, data,
+                                              expressions)
             try:
-                # create a SQLALchemy Query from the query parameter `q`
-                query = create_query(self.session, self.model, search_params)
+                # create a SQLALchemy Query from the query parameter `q`; a
+                # query which is updated in bulk must not be ordered.
+                query = create_query(self.session, self.model, search_params,
+                                     _ignore_order_by=values is not None)
             except Exception as exception:
                 current_app.logger.exception(str(exception))
                 return dict(message='Unable to construct query'), 400
         else:
-            # create a SQLAlchemy Query which has exactly the specified row
-            query = query_by_primary_key(self.session, self.model, instid,
-                                         self.primary_key)
-            if query.count() == 0:
+            values = None
+            # Fetch the instance once, along with the relations which will be
+            # serialized in the response, if any.
+            minimal = _prefers_minimal()
+            options = None if minimal else self._loader_options
+            instance = get_by(self.session, self.model, instid,
+                              self.primary_key, options)
+            if instance is None:
                 return {_STATUS: 404}, 404
-            assert query.count() == 1, 'Multiple rows with same ID'
 
+        # Update all matching rows in a single statement, if possible. Like
+        # the bulk delete in _delete_many(), this does not synchronize the
+        # session, which expires everything on commit anyway.
+        if values is not None:
+            num_modified = 0
+            if values:
+                num_modified = query.update(values, synchronize_session=False)
+            self.session.commit()
+            result = dict(num_modified=num_modified)
+            for postprocessor in self.postprocessors['PATCH_MANY']:
+                postprocessor(query=query, result=result,
+                              search_params=search_params)
+            return result
+
+        # Load the instances to update only once, for both the relations and
+        # the columns.
+        if not patchmany:
+            instances = [instance]
+        elif data or expressions:
+            instances = query.all()
+        else:
+            instances = []
         try:
-            relations = self._update_relations(query, data)
+            relations = self._update_relations(instances, data)
         except self.validation_exceptions as exception:
             current_app.logger.exception(str(exception))
             return self._handle_validation_exception(exception)
@@ -1568,15 +3035,23 @@ class API(ModelView):
         # Special case: if there are any dates, convert the string form of the
         # date into an instance of the Python ``datetime`` object.
         data = strings_to_dates(self.model, data)
+        # Setting an attribute to a SQL expression updates it in the flush,
+        # after which it is expired and loaded again when serialized.
+        data.update(expressions)
 
         try:
             # Let's update all instances present in the query
             num_modified = 0
             if data:
-                for item in query.all():
+                for item in instances:
                     for field, value in data.items():
                         setattr(item, field, value)
                     num_modified += 1
+            # Serialize the updated instance from the state of the session
+            # before committing, since committing expires it.
+            self.session.flush()
+            if not patchmany:
+                result = {} if minimal else self._inst_to_dict(instance)
             self.session.commit()
         except self.validation_exceptions as exception:
             current_app.logger.exception(str(exception))
@@ -1589,12 +3064,192 @@ class API(ModelView):
                 postprocessor(query=query, result=result,
                               search_params=search_params)
         else:
-            result = self._instid_to_dict(instid)
             for postprocessor in self.postprocessors['PATCH_SINGLE']:
                 postprocessor(result=result)
+            if minimal:
+                headers = {'Preference-Applied': 'return=minimal'}
+                return result, 204, headers
 
         return result
 
     def put(self, *args, **kw):
         """Alias for :meth:`patch`."""
         return self.patch(*args, **kw)
+
+
+class BatchAPI(MethodView):
+    """Provides a :http:method:`post` endpoint which performs a list of
+    operations on the APIs created by an
+    :class:`~flask.ext.restless.APIManager` in a single database transaction.
+
+    Each operation is dispatched to the view function of the API for its
+    collection, so the preprocessors and postprocessors of that API are
+    applied as for a request made directly on the API. Each operation is made
+    within a savepoint, so a failed operation is rolled back without affecting
+    the operations before it.
+
+    For a description of the request and response formats, see :ref:`batch`.
+
+    .. versionadded:: 0.17.1
+
+    """
+
+    #: List of decorators applied to every method of this class.
+    decorators = [mimerender]
+
+    #: The methods which operations may specify.
+    METHODS = frozenset(('GET', 'POST', 'PATCH', 'PUT', 'DELETE'))
+
+    #: Request headers which are not passed on to the individual operations.
+    EXCLUDED_HEADERS = frozenset(('content-type', 'content-length', 'host'))
+
+    #: Prefixes of the keys of the WSGI environment of the request which are
+    #: not passed on to the individual operations.
+    EXCLUDED_ENVIRON = ('HTTP_', 'CONTENT_', 'wsgi.', 'werkzeug.')
+
+    def __init__(self, session, endpoint_for, max_operations=200, *args,
+                 **kw):
+        """Calls the constructor of the superclass and specifies the session
+        and the APIs in which operations are performed.
+
+        `session` is the SQLAlchemy session in which all database transactions
+        will be performed; it must be the session used by the APIs.
+
+        `endpoint_for` is a function which, given the name of a collection,
+        returns the name of the endpoint of the API exposing that collection,
+        or ``None`` if there is no such API.
+
+        `max_operations` is the maximum number of operations allowed in a
+        single request.
+
+        """
+        super(BatchAPI, self).__init__(*args, **kw)
+        self.session = session
+        self.endpoint_for = endpoint_for
+        self.max_operations = max_operations
+
+    def _dispatch(self, operation):
+        """Performs the request described by the dictionary `operation` on the
+        API for its collection and returns the result of the operation.
+
+        The returned dictionary has the status code of the response as the
+        ``status`` element, its decoded JSON body (or ``None``) as the ``body``
+        element and its :http:header:`Location` header, if any, as the
+        ``location`` element.
+
+        """
+        if not isinstance(operation, dict):
+            return dict(status=400, body=dict(message='Invalid operation'))
+        method = str(operation.get('method', '')).upper()
+        if method not in BatchAPI.METHODS:
+            message = 'Unknown method "{0}"'.format(operation.get('method'))
+            return dict(status=400, body=dict(message=message))
+        collection = operation.get('collection')
+        endpoint = self.endpoint_for(collection)
+        if endpoint is None:
+            message = 'No such collection "{0}"'.format(collection)
+            return dict(status=404, body=dict(message=message))
+        values = dict(_method=method)
+        if operation.get('id') is not None:
+            values['instid'] = operation['id']
+        try:
+            url = flask_url_for(endpoint, **values)
+        except BuildError:
+            return dict(status=405, body=dict(message='Method not allowed'))
+        path = url[len(request.script_root):]
+        params = operation.get('params') or {}
+        params = dict((key, _dumps(value)
+                       if isinstance(value, (dict, list)) else value)
+                      for key, value in params.items())
+        headers = [(key, value) for key, value in request.headers
+                   if key.lower() not in BatchAPI.EXCLUDED_HEADERS]
+        body = operation.get('body')
+        data = None if body is None else _dumps(body)
+        # Keep the variables which the server or middleware added to the
+        # environment of the batch request, like ``REMOTE_USER``.
+        environ_base = dict((key, value)
+                            for key, value in request.environ.items()
+                            if not key.startswith(BatchAPI.EXCLUDED_ENVIRON))
+        builder = EnvironBuilder(path, base_url=request.url_root,
+                                 method=method, headers=headers, data=data,
+                                 content_type='application/json',
+                                 query_string=params,
+                                 environ_base=environ_base)
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+        context = current_app.request_context(environ)
+        # The context is popped explicitly, since Flask would otherwise
+        # preserve it when an exception is raised in debug mode.
+        context.push()
+        try:
+            # Run the request hooks of the application, like those which
+            # authenticate requests, as for a request made on the API itself.
+            response = current_app.preprocess_request()
+            if response is None:
+                response = current_app.dispatch_request()
+            response = current_app.make_response(response)
+            response = current_app.process_response(response)
+        except HTTPException as exception:
+            return dict(status=exception.code,
+                        body=dict(message=exception.description))
+        finally:
+            context.pop()
+        data = response.get_data()
+        result = dict(status=response.status_code,
+                      body=_loads(data) if data else None)
+        if 'Location' in response.headers:
+            result['location'] = response.headers['Location']
+        return result
+
+    def post(self):
+        """Performs each of the operations given in the body of the request,
+        in order, and returns the list of their results.
+
+        If the ``atomic`` element of the request is ``true`` (the default),
+        the first failed operation rolls back the whole transaction and no
+        further operations are performed. Otherwise, failed operations are
+        reported in the results and the remaining operations are committed.
+
+        """
+        try:
+            data = _loads(request.get_data()) or {}
+            operations = data['operations']
+            atomic = data.get('atomic', True)
+        except (KeyError, TypeError, ValueError, OverflowError,
+                AttributeError) as exception:
+            current_app.logger.exception(str(exception))
+            return dict(message='Unable to decode data'), 400
+        if not isinstance(operations, list):
+            return dict(message='Operations must be a list'), 400
+        if len(operations) > self.max_operations:
+            message = 'Cannot perform more than {0} operations'
+            return dict(message=message.format(self.max_operations)), 413
+        results = []
+        for operation in operations:
+            # The API commits or rolls back this savepoint itself when it
+            # writes to the database.
+            savepoint = self.session.begin_nested()
+            try:
+                result = self._dispatch(operation)
+            except Exception as exception:
+                current_app.logger.exception(str(exception))
+                result = dict(status=500,
+                              body=dict(message=type(exception).__name__))
+            if savepoint.is_active:
+                if result['status'] < 400:
+                    savepoint.commit()
+                else:
+                    savepoint.rollback()
+            results.append(result)
+            if atomic and result['status'] >= 400:
+                self.session.rollback()
+                return dict(results=results), result['status']
+        try:
+            self.session.commit()
+        except (DataError, IntegrityError, ProgrammingError) as exception:
+            self.session.rollback()
+            current_app.logger.exception(str(exception))
+            return dict(message=type(exception).__name__), 400
+        return dict(results=results)
@@ -153,9 +153,9 @@ class GUID(TypeDecorator):
         if dialect.name == 'postgresql':
             return str(value)
         if not isinstance(value, uuid.UUID):
-            return '{0:.32x}'.format(uuid.UUID(value))
+            return uuid.UUID(value).hex
         # hexstring
-        return '{0:.32x}'.format(value)
+        return value.hex
 
     def process_result_value(self, value, dialect):
         if value is None:
@@ -11,24 +11,37 @@
 """
 from datetime import date
 from datetime import datetime
+import json
 import uuid
 
 from nose.tools import assert_raises
 from sqlalchemy import Column
+from sqlalchemy import create_engine
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import configure_mappers
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm import sessionmaker
 
+import flask.ext.restless.helpers as helpers
+from flask.ext.restless.helpers import count
+from flask.ext.restless.helpers import count_cache_key
+from flask.ext.restless.helpers import encode_native_types
 from flask.ext.restless.helpers import evaluate_functions
 from flask.ext.restless.helpers import get_by
 from flask.ext.restless.helpers import get_columns
 from flask.ext.restless.helpers import get_related_model
 from flask.ext.restless.helpers import get_relations
 from flask.ext.restless.helpers import is_like_list
+from flask.ext.restless.helpers import JSONBackend
 from flask.ext.restless.helpers import partition
 from flask.ext.restless.helpers import primary_key_name
+from flask.ext.restless.helpers import primary_key_names
+from flask.ext.restless.helpers import projected_columns
+from flask.ext.restless.helpers import serialization_plan
 from flask.ext.restless.helpers import to_dict
+from flask.ext.restless.helpers import TTLCache
 from flask.ext.restless.helpers import upper_keys
 
 from .helpers import TestSupport
@@ -107,6 +120,46 @@ class TestHelpers(object):
             assert k.isupper()
             assert not v.isupper()
 
+    def test_ttl_cache(self):
+        """Test for the least recently used entry being evicted from a full
+        cache and for entries expiring.
+
+        """
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert (cache.hits, cache.misses) == (3, 1)
+        cache.set('d', 4, ttl=-1)
+        assert cache.get('d') is None
+        assert len(cache) == 1
+
+    def test_json_backend(self):
+        """Test for encoding and decoding JSON as both strings and bytes, and
+        for adapting an encoder to dates, times, and UUIDs.
+
+        """
+        def dumps_bytes(obj):
+            return json.dumps(obj).encode('utf-8')
+
+        for dumps in json.dumps, dumps_bytes:
+            backend = JSONBackend(dumps, json.loads)
+            assert not backend.native_types
+            assert backend.dumps([u'\u00e9']) == u'["\\u00e9"]'
+            assert backend.encode([1]) == b'[1]'
+            assert backend.loads(b'{"a": 1}') == backend.loads(u'{"a": 1}')
+        backend = JSONBackend(json.dumps, json.loads, adapt=True)
+        assert backend.native_types
+        value = uuid.uuid1()
+        data = [date(1990, 1, 2), datetime(1990, 1, 2, 3, 4, 5), value]
+        assert backend.loads(backend.dumps(data)) == \
+            ['1990-01-02', '1990-01-02T03:04:05', str(value)]
+        assert_raises(TypeError, encode_native_types, object())
+
 
 class TestModelHelpers(TestSupport):
     """Provides tests for helper functions which operate on pure SQLAlchemy
@@ -232,6 +285,52 @@ class TestModelHelpers(TestSupport):
         assert 'first_computer' in data
         assert 'foo' == data['first_computer']['name']
 
+    def test_serialization_plan(self):
+        """Tests that serialization plans are cached, inspect the mapper of
+        each model only once, and produce the expected dictionaries.
+
+        """
+        person = self.Person(name=u'Test', age=10,
+                             birth_date=date(1986, 9, 15))
+        person.computers.append(self.Computer(name=u'foo'))
+        self.session.add(person)
+        self.session.commit()
+        inspected = []
+        original_inspect = helpers.sqlalchemy_inspect
+
+        def recording_inspect(model):
+            inspected.append(model)
+            return original_inspect(model)
+
+        helpers.sqlalchemy_inspect = recording_inspect
+        try:
+            deep = {'computers': {}}
+            plan = serialization_plan(self.Person, deep, exclude=['other'])
+            assert plan is serialization_plan(self.Person, {'computers': {}},
+                                              exclude=['other'])
+            assert inspected == [self.Person]
+            # The plan for the related model is created, and its mapper
+            # inspected, when the first related instance is serialized.
+            result = plan(person)
+            assert plan(person) == result
+            assert inspected == [self.Person, self.Computer]
+            assert plan is not serialization_plan(self.Person, deep)
+        finally:
+            helpers.sqlalchemy_inspect = original_inspect
+        computer = dict(id=1, name=u'foo', vendor=None, buy_date=None,
+                        owner_id=1)
+        assert result == dict(id=1, name=u'Test', age=10,
+                              birth_date='1986-09-15', is_minor=True,
+                              is_above_21=False, computers=[computer])
+
+    def test_serialization_plan_include_exclude(self):
+        """Tests that a serialization plan cannot be created with both include
+        and exclude columns.
+
+        """
+        assert_raises(ValueError, serialization_plan, self.Person,
+                      include=['name'], exclude=['age'])
+
     def test_get_columns(self):
         """Test for getting the names of columns as strings."""
         columns = get_columns(self.Person)
@@ -248,6 +347,29 @@ class TestModelHelpers(TestSupport):
         relations = get_relations(self.Person)
         assert relations == ['computers']
 
+    def test_model_metadata_registry(self):
+        """Tests that the metadata of a model is computed once and is
+        recomputed after the mappers are configured, which may add backrefs.
+
+        """
+        configure_mappers()
+        relations = get_relations(self.Person)
+        assert sorted(relations) == ['computers', 'projects']
+        assert get_relations(self.Person) is relations
+        assert primary_key_names(self.Person) == ['id']
+        assert get_related_model(self.Person, 'projects') is self.Project
+        assert get_related_model(self.Person, 'bogus') is None
+
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            id = Column(Integer, primary_key=True)
+            person_id = Column(Integer, ForeignKey('person.id'))
+            person = relationship('Person', backref='tags')
+
+        configure_mappers()
+        assert 'tags' in get_relations(self.Person)
+        assert get_related_model(self.Person, 'tags') is Tag
+
     def test_is_like_list(self):
         """Tests if the relation of `instance` whose name is `relation` is
         list-like.
@@ -273,6 +395,66 @@ class TestModelHelpers(TestSupport):
         assert get_related_model(self.Person, 'is_above_21') is None, \
             'Person.is_above_21 should not have a model'
 
+    def test_projected_columns(self):
+        """Tests for determining the columns which must be loaded in order to
+        serialize instances of a model.
+
+        """
+        assert projected_columns(self.Person) is None
+        # Hybrid properties depend on the age column.
+        columns = projected_columns(self.Person, exclude=['age', 'other'])
+        assert columns == ['id', 'name', 'age', 'birth_date']
+        columns = projected_columns(self.Person, include=['name'])
+        assert columns == ['id', 'name']
+        # The foreign key of the owner relation is always loaded.
+        columns = projected_columns(self.Computer, include=['name'])
+        assert columns == ['id', 'name', 'owner_id']
+        # Included methods may use any column.
+        assert projected_columns(self.Person, exclude=['other'],
+                                 include_methods=['name_and_age']) is None
+
+
+class TestCount(TestSupportPrefilled):
+    """Unit tests for the :func:`flask.ext.restless.helpers.count` function
+    and related helpers.
+
+    """
+
+    def test_count(self):
+        """Tests for counting the results of a query."""
+        query = self.session.query(self.Person)
+        assert count(self.session, query) == 5
+        query = query.filter(self.Person.age > 20)
+        assert count(self.session, query) == 3
+
+    def test_limit_offset(self):
+        """Tests that counting a query with a limit or an offset gives the
+        same result as counting its results.
+
+        """
+        query = self.session.query(self.Person)
+        for limit in None, 0, 2, 10:
+            for offset in None, 1, 4, 10:
+                limited = query.limit(limit).offset(offset)
+                assert count(self.session, limited) == len(limited.all())
+
+    def test_count_cache_key(self):
+        """Tests that queries with the same filters have the same cache key,
+        and queries with different filters or on different databases have
+        different keys.
+
+        """
+        query = self.session.query(self.Person)
+        key1 = count_cache_key(self.session, query.filter_by(age=1))
+        key2 = count_cache_key(self.session, query.filter_by(age=1))
+        key3 = count_cache_key(self.session, query.filter_by(age=2))
+        assert key1 == key2
+        assert key1 != key3
+        engine = create_engine('sqlite://')
+        session = sessionmaker(bind=engine)()
+        query = session.query(self.Person).filter_by(age=1)
+        assert count_cache_key(session, query) != key1
+
 
 class TestFunctionEvaluation(TestSupportPrefilled):
     """Unit tests for the :func:`flask.ext.restless.helpers.evaluate_functions`
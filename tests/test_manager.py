@@ -26,6 +26,7 @@ from sqlalchemy import Integer
 from flask.ext.restless import APIManager
 from flask.ext.restless import url_for
 from flask.ext.restless import IllegalArgumentError
+from flask.ext.restless import JSONBackend
 from flask.ext.restless.helpers import to_dict
 from flask.ext.restless.helpers import get_columns
 
@@ -590,6 +591,73 @@ class TestAPIManager(TestSupport):
         self.manager.create_api(self.Person, exclude_columns=['id'],
                                 methods=['POST'])
 
+    @raises(IllegalArgumentError)
+    def test_unknown_loading_strategy(self):
+        """Tests that specifying an unknown strategy for loading a relation
+        raises an error.
+
+        """
+        self.manager.create_api(self.Person,
+                                loading_strategies={'computers': 'bogus'})
+
+    @raises(IllegalArgumentError)
+    def test_unknown_pagination(self):
+        """Tests that specifying an unknown pagination raises an error."""
+        self.manager.create_api(self.Person, pagination='bogus')
+
+    @raises(IllegalArgumentError)
+    def test_unknown_count_strategy(self):
+        """Tests that specifying an unknown count strategy raises an error."""
+        self.manager.create_api(self.Person, count_strategy='bogus')
+
+    @raises(IllegalArgumentError)
+    def test_unknown_version_column(self):
+        """Tests that specifying an unknown version column raises an error."""
+        self.manager.create_api(self.Person, etags=True,
+                                version_column='bogus')
+
+    @raises(IllegalArgumentError)
+    def test_group_commit_unscoped_session(self):
+        """Tests that enabling group commit on an API whose session is not a
+        scoped session raises an error.
+
+        """
+        manager = APIManager(Flask(__name__), session=self.session())
+        manager.create_api(self.Person, methods=['POST'], group_commit=True)
+
+    @raises(IllegalArgumentError)
+    def test_group_commit_custom_serializer(self):
+        """Tests that enabling group commit on an API with a custom serializer
+        raises an error.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                group_commit=True, serializer=lambda i: {})
+
+    def test_view_configured_once(self):
+        """Tests that the configuration of an API is computed once, not on
+        every request.
+
+        """
+        iterations = []
+
+        class Columns(object):
+            def __iter__(self):
+                iterations.append(1)
+                return iter(['other'])
+
+        self.manager.create_api(self.Person, exclude_columns=Columns(),
+                                methods=['GET', 'POST'])
+        num_iterations = len(iterations)
+        response = self.app.post('/api/person', data=dumps(dict(name=u'Foo')))
+        assert response.status_code == 201
+        for i in range(3):
+            response = self.app.get('/api/person/1')
+            assert response.status_code == 200
+            assert 'other' not in loads(response.data)
+        # The columns were read only when the view was first instantiated.
+        assert len(iterations) == num_iterations + 1
+
     def test_different_urls(self):
         """Tests that establishing different URL endpoints for the same model
         affect the same database table.
@@ -749,6 +817,93 @@ class TestSerialization(TestSupport):
         assert data['foo'] == 'bar'
 
 
+class TestJSONBackend(TestSupport):
+    """Tests for the ``json_backend`` keyword argument to
+    :class:`flask.ext.restless.APIManager`.
+
+    """
+
+    def setUp(self):
+        super(TestJSONBackend, self).setUp()
+        self.encoded = []
+        self.decoded = []
+
+        def encode(obj, **kw):
+            self.encoded.append(obj)
+            return json.dumps(obj, **kw).encode('utf-8')
+
+        def decode(data):
+            self.decoded.append(data)
+            return json.loads(data)
+
+        backend = JSONBackend(encode, decode, adapt=True)
+        del self.flaskapp.extensions['restless']
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  json_backend=backend)
+
+    def test_native_types(self):
+        """Tests that dates and times are encoded by the backend instead of
+        being converted when serializing instances.
+
+        """
+        buy_date = datetime.datetime(2015, 1, 2, 3, 4, 5)
+        self.session.add(self.Computer(id=1, name=u'lixeiro',
+                                       buy_date=buy_date))
+        self.session.commit()
+        self.manager.create_api(self.Computer)
+        for url in '/api/computer/1', '/api/computer':
+            del self.encoded[:]
+            response = self.app.get(url)
+            assert response.status_code == 200
+            assert len(self.encoded) == 1
+            assert buy_date.isoformat() in response.data.decode('utf-8')
+        assert self.encoded[0]['objects'][0]['buy_date'] == buy_date
+
+    def test_decode(self):
+        """Tests that request bodies and search queries are decoded by the
+        backend.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'POST'])
+        data = dict(name=u'Jeffrey', birth_date='1990-01-01')
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        assert loads(response.data)['birth_date'] == '1990-01-01'
+        query = dict(filters=[dict(name='name', op='eq', val=u'Jeffrey')])
+        response = self.app.get('/api/person?q=' + dumps(query))
+        assert response.status_code == 200
+        assert loads(response.data)['num_results'] == 1
+        assert len(self.decoded) == 2
+        response = self.app.post('/api/person', data='{"name":')
+        assert response.status_code == 400
+        response = self.app.get('/api/person?q={')
+        assert response.status_code == 400
+
+    def test_jsonp(self):
+        """Tests that JSONP responses are encoded by the backend."""
+        self.session.add(self.Person(id=1, birth_date=datetime.date(1990, 1,
+                                                                    1)))
+        self.session.commit()
+        self.manager.create_api(self.Person)
+        response = self.app.get('/api/person/1?callback=foo')
+        assert response.status_code == 200
+        assert response.data.startswith(b'foo(')
+        data = loads(response.data[4:-1])
+        assert data['data']['birth_date'] == '1990-01-01'
+
+    def test_streaming(self):
+        """Tests that streamed responses are encoded by the backend."""
+        self.session.add_all([self.Person(name=u'Jeffrey'),
+                              self.Person(name=u'Mary')])
+        self.session.commit()
+        self.manager.create_api(self.Person, streaming=True)
+        response = self.app.get('/api/person')
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert [p['name'] for p in data['objects']] == [u'Jeffrey', u'Mary']
+        assert len(self.encoded) == 3
+
+
 @skip_unless(has_flask_sqlalchemy, 'Flask-SQLAlchemy not found.')
 class TestFSA(FlaskTestBase):
     """Tests which use models defined using Flask-SQLAlchemy instead of pure
@@ -15,6 +15,8 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from flask.ext.restless.search import create_query
 from flask.ext.restless.search import search
+from flask.ext.restless.search import search_cache
+from flask.ext.restless.search import search_shape
 from flask.ext.restless.search import SearchParameters
 
 from .helpers import TestSupportPrefilled
@@ -414,3 +416,97 @@ class TestSearch(TestSupportPrefilled):
              'filters': [{'name': 'name', 'val': u'Lincoln', 'op': '=='}]}
         result = search(self.session, self.Person, d)
         assert result.name == u'Lincoln'
+
+
+class TestSearchCache(TestSupportPrefilled):
+    """Unit tests for reusing searches of the same shape via
+    :data:`flask_restless.search.search_cache`.
+
+    """
+
+    def setUp(self):
+        super(TestSearchCache, self).setUp()
+        search_cache.clear()
+
+    def test_shape(self):
+        """Tests that searches which differ only in their values have the same
+        shape, and that the values become parameters.
+
+        """
+        d1 = dict(filters=[dict(name='age', op='lt', val=20)], limit=1)
+        d2 = dict(filters=[dict(name='age', op='lt', val=25)], limit=2)
+        d3 = dict(filters=[dict(name='age', op='gt', val=20)])
+        shape1, template, params = search_shape(d1)
+        shape2 = search_shape(d2)[0]
+        shape3 = search_shape(d3)[0]
+        assert shape1 == shape2
+        assert shape1 != shape3
+        assert list(params.values()) == [20]
+        assert 'limit' not in template
+
+    def test_reuse(self):
+        """Tests that a search of a previously seen shape reuses the built
+        search with the new values.
+
+        """
+        hits, misses = search_cache.hits, search_cache.misses
+        d = dict(filters=[dict(name='name', op='eq', val=u'Lincoln')])
+        result = search(self.session, self.Person, d)
+        assert [p.name for p in result] == [u'Lincoln']
+        assert search_cache.misses == misses + 1
+        d = dict(filters=[dict(name='name', op='eq', val=u'Mary')])
+        result = search(self.session, self.Person, d)
+        assert [p.name for p in result] == [u'Mary']
+        assert search_cache.hits == hits + 1
+
+    def test_lists_and_suboperators(self):
+        """Tests that the values of the ``in`` and ``any`` operators are
+        parameters of the reused search.
+
+        """
+        d = dict(filters=[dict(name='age', op='in', val=[19, 23])])
+        assert search(self.session, self.Person, d).count() == 2
+        d = dict(filters=[dict(name='age', op='in', val=[7, 25])])
+        assert search(self.session, self.Person, d).count() == 2
+        # A list of a different length has a different shape.
+        d = dict(filters=[dict(name='age', op='in', val=[28])])
+        assert search(self.session, self.Person, d).count() == 1
+        computer = self.Computer(name=u'c1', vendor=u'foo')
+        self.people[0].computers = [computer]
+        self.session.commit()
+        for vendor, expected in ((u'foo', 1), (u'bar', 0)):
+            val = dict(name='vendor', op='eq', val=vendor)
+            d = dict(filters=[dict(name='computers', op='any', val=val)])
+            assert search(self.session, self.Person, d).count() == expected
+
+    def test_value_types(self):
+        """Tests that searches whose values have different types have
+        different shapes, and that the value of an ``in`` filter which is not
+        a list is searched as without the cache.
+
+        """
+        d1 = dict(filters=[dict(name='name', op='eq', val=u'1')])
+        d2 = dict(filters=[dict(name='name', op='eq', val=1)])
+        assert search_shape(d1)[0] != search_shape(d2)[0]
+        d = dict(filters=[dict(name='name', op='in', val=[u'Mary'])])
+        assert search(self.session, self.Person, d).count() == 1
+        d = dict(filters=[dict(name='name', op='in', val=u'Mary')])
+        assert search_shape(d)[2] == {}
+        # The operator compares the name to each character of the string.
+        assert search(self.session, self.Person, d).count() == 0
+        searchparams = SearchParameters.from_dictionary(d)
+        expected = create_query(self.session, self.Person, searchparams)
+        assert str(search(self.session, self.Person, d)) == str(expected)
+
+    def test_errors_not_cached(self):
+        """Tests that a search which cannot be built raises an error each time
+        it is requested, and that searches with an unhashable shape are built
+        without the cache.
+
+        """
+        d = dict(filters=[dict(name='bogus', op='eq', val=1)])
+        assert_raises(AttributeError, search, self.session, self.Person, d)
+        assert_raises(AttributeError, search, self.session, self.Person, d)
+        d = dict(filters=[dict(name='name', op=['eq'], val=u'Lincoln')])
+        assert_raises(TypeError, search, self.session, self.Person, d)
+        assert len(search_cache) == 0
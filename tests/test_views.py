@@ -13,8 +13,14 @@
 """
 from datetime import date
 from datetime import datetime
+from datetime import time
 from datetime import timedelta
 import math
+from operator import attrgetter
+import os
+import tempfile
+import threading
+import uuid
 # In Python 2, the function is `urllib.quote()`, in Python 3 it is
 # `urllib.parse.quote()`.
 try:
@@ -23,17 +29,23 @@ except:
     from urllib import quote as urlquote
 
 import dateutil
+from flask import abort
 from flask import json
+from flask import request
 try:
     from flask.ext.sqlalchemy import SQLAlchemy
 except:
     has_flask_sqlalchemy = False
 else:
     has_flask_sqlalchemy = True
+from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import event
 from sqlalchemy import ForeignKey
 from sqlalchemy import func
 from sqlalchemy import Integer
+from sqlalchemy import PickleType
 from sqlalchemy import String
 from sqlalchemy import Table
 from sqlalchemy import Unicode
@@ -41,10 +53,14 @@ from sqlalchemy.ext.associationproxy import association_proxy as prox
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref
 from sqlalchemy.orm import relationship as rel
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.collections import column_mapped_collection as col_mapped
 
+from flask.ext.restless import ProcessingException
 from flask.ext.restless.helpers import to_dict
 from flask.ext.restless.manager import APIManager
+from flask.ext.restless.views import _canonical_dumps
+from flask.ext.restless.views import _count_cache
 
 from .helpers import FlaskTestBase
 from .helpers import ManagerTestBase
@@ -68,6 +84,10 @@ MSIE8_UA = 'Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 6.0; Trident/4.0)'
 #: From <http://blogs.msdn.com/b/ie/archive/2010/03/23/introducing-ie9-s-user-agent-string.aspx>.
 MSIE9_UA = 'Mozilla/5.0 (compatible; MSIE 9.0; Windows NT 6.1; Trident/5.0)'
 
+#: Whether the installed version of SQLAlchemy (1.0 or later) supports bulk
+#: inserts.
+has_bulk_insert_mappings = hasattr(Session, 'bulk_insert_mappings')
+
 
 @skip_unless(has_flask_sqlalchemy, 'Flask-SQLAlchemy not found.')
 class TestFSAModel(FlaskTestBase):
@@ -1568,6 +1588,2384 @@ class TestAPI(TestSupport):
         assert 50 == data['number_of_pixels']
 
 
+class TestEagerLoading(TestSupport):
+    """Tests that relations included in responses are loaded eagerly, so that
+    the number of queries per request does not depend on the number of
+    instances in the response.
+
+    """
+
+    def setUp(self):
+        super(TestEagerLoading, self).setUp()
+        for i in range(5):
+            person = self.Person(name=u'person{0}'.format(i))
+            computer = self.Computer(name=u'computer{0}'.format(i),
+                                     owner=person)
+            computer.programs = [self.ComputerProgram(program=self.Program())
+                                 for j in range(2)]
+            self.session.add(computer)
+        self.session.commit()
+        self.session.remove()
+        self.statements = []
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+
+    def tearDown(self):
+        event.remove(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+        super(TestEagerLoading, self).tearDown()
+
+    def _count_statement(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_get_many(self):
+        """Tests that a :http:method:`get` request on a collection issues a
+        constant number of queries: one to count the instances, one for the
+        page of instances and their to-one relations, and one for their
+        to-many relations.
+
+        """
+        self.manager.create_api(self.Computer)
+        response = self.app.get('/api/computer')
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert len(data['objects']) == 5
+        for computer in data['objects']:
+            assert computer['owner']['name'].startswith('person')
+            assert len(computer['programs']) == 2
+        assert len(self.statements) == 3
+
+    def test_get_single(self):
+        """Tests that a :http:method:`get` request for a single instance loads
+        its relations eagerly.
+
+        """
+        self.manager.create_api(self.Computer)
+        response = self.app.get('/api/computer/1')
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert data['owner']['name'] == u'person0'
+        assert len(data['programs']) == 2
+        assert len(self.statements) == 2
+
+    def test_loading_strategies(self):
+        """Tests that the `loading_strategies` keyword argument overrides the
+        strategy used to load a relation.
+
+        """
+        self.manager.create_api(self.Computer,
+                                loading_strategies={'programs': 'joined'})
+        response = self.app.get('/api/computer')
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert len(data['objects']) == 5
+        for computer in data['objects']:
+            assert len(computer['programs']) == 2
+        assert len(self.statements) == 2
+
+    def test_excluded_relations(self):
+        """Tests that relations excluded from the response are not loaded."""
+        self.manager.create_api(self.Computer, exclude_columns=['programs'])
+        response = self.app.get('/api/computer')
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert all('programs' not in c for c in data['objects'])
+        assert len(self.statements) == 2
+
+
+class TestKeysetPagination(TestSupport):
+    """Tests for paginating responses to :http:method:`get` requests by keyset
+    using cursors.
+
+    """
+
+    def setUp(self):
+        super(TestKeysetPagination, self).setUp()
+        for i in range(25):
+            person = self.Person(name=u'person{0}'.format(i), age=i % 7,
+                                 birth_date=date(1990, 1, 1 + i % 5))
+            self.session.add(person)
+        self.session.commit()
+        self.flaskapp.secret_key = 'secret'
+        self.manager.create_api(self.Person, pagination='keyset',
+                                results_per_page=10)
+
+    def _walk(self, query=None, url='/api/person'):
+        """Follows the ``next_cursor`` of each page of the collection at `url`
+        and returns the list of pages.
+
+        """
+        params = {}
+        if query is not None:
+            params['q'] = dumps(query)
+        pages = []
+        response = self.app.get(url, query_string=params)
+        while True:
+            assert response.status_code == 200
+            data = loads(response.data)
+            pages.append(data)
+            if data['next_cursor'] is None:
+                return pages
+            params['cursor'] = data['next_cursor']
+            response = self.app.get(url, query_string=params)
+
+    def test_forward(self):
+        """Tests that following the next cursors visits each instance exactly
+        once, in order of primary key.
+
+        """
+        pages = self._walk()
+        assert [len(page['objects']) for page in pages] == [10, 10, 5]
+        ids = [person['id'] for page in pages for person in page['objects']]
+        assert ids == list(range(1, 26))
+        assert pages[0]['prev_cursor'] is None
+        assert all(page['prev_cursor'] is not None for page in pages[1:])
+        assert 'num_results' not in pages[0]
+
+    def test_order_by(self):
+        """Tests that pagination by keyset respects the requested ordering,
+        breaking ties by primary key.
+
+        """
+        people = self.session.query(self.Person).all()
+        for direction in 'asc', 'desc':
+            for field in 'age', 'birth_date':
+                query = dict(order_by=[dict(field=field,
+                                            direction=direction)])
+                pages = self._walk(query)
+                ids = [p['id'] for page in pages for p in page['objects']]
+                expected = sorted(people, key=attrgetter(field, 'id'),
+                                  reverse=(direction == 'desc'))
+                assert ids == [p.id for p in expected]
+
+    def test_mixed_directions(self):
+        """Tests that pagination by keyset works when columns are ordered in
+        different directions.
+
+        """
+        query = dict(order_by=[dict(field='age', direction='desc'),
+                               dict(field='id', direction='asc')])
+        pages = self._walk(query)
+        ids = [p['id'] for page in pages for p in page['objects']]
+        people = self.session.query(self.Person).all()
+        expected = sorted(people, key=lambda p: (-p.age, p.id))
+        assert ids == [p.id for p in expected]
+
+    def test_backward(self):
+        """Tests that following the previous cursor returns the previous
+        page.
+
+        """
+        query = dict(order_by=[dict(field='age', direction='desc')])
+        pages = self._walk(query)
+        response = self.app.get('/api/person', query_string=dict(
+            q=dumps(query), cursor=pages[2]['prev_cursor']))
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert data['objects'] == pages[1]['objects']
+        assert data['next_cursor'] is not None
+        response = self.app.get('/api/person', query_string=dict(
+            q=dumps(query), cursor=data['prev_cursor']))
+        data = loads(response.data)
+        assert data['objects'] == pages[0]['objects']
+        assert data['prev_cursor'] is None
+
+    def test_link_header(self):
+        """Tests that the ``Link`` header contains links to the next and
+        previous pages.
+
+        """
+        response = self.app.get('/api/person')
+        data = loads(response.data)
+        link = response.headers['Link']
+        assert 'cursor={0}'.format(data['next_cursor']) in link
+        assert 'rel="next"' in link
+        assert 'rel="prev"' not in link
+        response = self.app.get('/api/person', query_string=dict(
+            cursor=data['next_cursor']))
+        link = response.headers['Link']
+        assert 'rel="next"' in link
+        assert 'rel="prev"' in link
+
+    def test_invalid_cursor(self):
+        """Tests that a tampered cursor, or a cursor created for a search with
+        a different ordering, causes an error response.
+
+        """
+        response = self.app.get('/api/person')
+        cursor = loads(response.data)['next_cursor']
+        response = self.app.get('/api/person?cursor=bogus' + cursor)
+        assert response.status_code == 400
+        query = dumps(dict(order_by=[dict(field='age', direction='asc')]))
+        response = self.app.get('/api/person', query_string=dict(
+            q=query, cursor=cursor))
+        assert response.status_code == 400
+
+    def test_null_values(self):
+        """Tests that instances with ``NULL`` values in an ordering column are
+        neither skipped nor repeated, and come after all other instances in
+        ascending order.
+
+        """
+        for person in self.session.query(self.Person).filter(
+                self.Person.id % 3 == 0):
+            person.age = None
+        self.session.commit()
+        people = self.session.query(self.Person).all()
+
+        def key(person):
+            return person.age is None, person.age, person.id
+
+        for direction in 'asc', 'desc':
+            query = dict(order_by=[dict(field='age', direction=direction)])
+            pages = self._walk(query)
+            ids = [p['id'] for page in pages for p in page['objects']]
+            expected = sorted(people, key=key, reverse=(direction == 'desc'))
+            assert ids == [p.id for p in expected]
+            response = self.app.get('/api/person', query_string=dict(
+                q=dumps(query), cursor=pages[2]['prev_cursor']))
+            assert loads(response.data)['objects'] == pages[1]['objects']
+
+    def test_non_json_values(self):
+        """Tests that cursors can encode the values of interval, time, and
+        UUID columns.
+
+        """
+        self.session.add_all([self.Satellite(name=u'sat{0}'.format(i),
+                                             period=timedelta(hours=i % 4))
+                              for i in range(5)])
+        self.session.add_all([self.User(id=i, email=u'user{0}'.format(i),
+                                        wakeup=time(i % 3, 30))
+                              for i in range(5)])
+        self.session.add_all([self.Vehicle(uuid=uuid.uuid4())
+                              for i in range(5)])
+        self.session.commit()
+        self.manager.create_api(self.Satellite, pagination='keyset',
+                                results_per_page=2,
+                                exclude_columns=['period'])
+        self.manager.create_api(self.User, pagination='keyset',
+                                results_per_page=2)
+        self.manager.create_api(self.Vehicle, pagination='keyset',
+                                results_per_page=2)
+        query = dict(order_by=[dict(field='period', direction='asc')])
+        pages = self._walk(query, '/api/satellite')
+        names = [s['name'] for page in pages for s in page['objects']]
+        assert names == ['sat0', 'sat4', 'sat1', 'sat2', 'sat3']
+        query = dict(order_by=[dict(field='wakeup', direction='desc')])
+        pages = self._walk(query, '/api/user')
+        ids = [u['id'] for page in pages for u in page['objects']]
+        assert ids == [2, 4, 1, 3, 0]
+        pages = self._walk(url='/api/vehicle')
+        uuids = [v['uuid'] for page in pages for v in page['objects']]
+        assert len(set(uuids)) == 5
+
+    def test_secret_key_required(self):
+        """Tests that pagination by keyset is refused if the application has
+        no secret key with which to sign the cursors.
+
+        """
+        self.flaskapp.secret_key = None
+        response = self.app.get('/api/person')
+        assert response.status_code == 500
+
+
+class TestCountStrategies(TestSupportPrefilled):
+    """Tests for the strategies for counting the results of
+    :http:method:`get` requests on collections.
+
+    """
+
+    def setUp(self):
+        super(TestCountStrategies, self).setUp()
+        _count_cache.clear()
+
+    def test_none(self):
+        """Tests that the ``'none'`` count strategy indicates whether there is
+        a next page instead of counting the results.
+
+        """
+        self.manager.create_api(self.Person, count_strategy='none',
+                                results_per_page=2)
+        response = self.app.get('/api/person')
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert data['has_more']
+        assert len(data['objects']) == 2
+        assert 'num_results' not in data
+        assert 'total_pages' not in data
+        assert 'rel="next"' in response.headers['Link']
+        assert 'rel="last"' not in response.headers['Link']
+        response = self.app.get('/api/person?page=3')
+        data = loads(response.data)
+        assert not data['has_more']
+        assert len(data['objects']) == 1
+        assert 'Link' not in response.headers or \
+            'rel="next"' not in response.headers['Link']
+
+    def test_request_override(self):
+        """Tests that the client can override the count strategy with the
+        ``count`` query parameter.
+
+        """
+        self.manager.create_api(self.Person, results_per_page=2)
+        response = self.app.get('/api/person?count=none')
+        data = loads(response.data)
+        assert data['has_more']
+        assert 'num_results' not in data
+        response = self.app.get('/api/person?count=bogus')
+        assert response.status_code == 400
+
+    def test_estimated(self):
+        """Tests that the ``'estimated'`` count strategy uses the provided
+        estimator, and falls back to an exact count if there is no estimate.
+
+        """
+        self.manager.create_api(self.Person, count_strategy='estimated',
+                                count_estimator=lambda s, q: 42)
+        self.manager.create_api(self.Person, url_prefix='/api2',
+                                count_strategy='estimated',
+                                count_estimator=lambda s, q: None)
+        response = self.app.get('/api/person')
+        assert loads(response.data)['num_results'] == 42
+        response = self.app.get('/api2/person')
+        assert loads(response.data)['num_results'] == 5
+
+    def test_cached(self):
+        """Tests that the ``'cached'`` count strategy reuses the count of a
+        previous request with the same filters.
+
+        """
+        self.manager.create_api(self.Person, count_strategy='cached')
+        response = self.app.get('/api/person')
+        assert loads(response.data)['num_results'] == 5
+        self.session.add(self.Person(name=u'Paul'))
+        self.session.commit()
+        response = self.app.get('/api/person')
+        assert loads(response.data)['num_results'] == 5
+        query = dumps(dict(filters=[dict(name='age', op='>', val=20)]))
+        response = self.app.get('/api/person?q=' + query)
+        assert loads(response.data)['num_results'] == 3
+        response = self.app.get('/api/person?count=exact')
+        assert loads(response.data)['num_results'] == 6
+
+    def test_window(self):
+        """Tests that the ``'window'`` count strategy counts the results in
+        the same query that fetches the page.
+
+        """
+        self.manager.create_api(self.Person, count_strategy='window',
+                                results_per_page=2,
+                                exclude_columns=['computers', 'projects'])
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = self.Base.metadata.bind
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        try:
+            query = dumps(dict(filters=[dict(name='age', op='>', val=20)]))
+            response = self.app.get('/api/person?q=' + query)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+        data = loads(response.data)
+        assert data['num_results'] == 3
+        assert data['total_pages'] == 2
+        assert len(data['objects']) == 2
+        assert len(statements) == 1
+        # The results are counted separately if the page is empty.
+        response = self.app.get('/api/person?page=4')
+        data = loads(response.data)
+        assert data['num_results'] == 5
+        assert data['objects'] == []
+        # Limits and offsets in the search parameters are respected.
+        query = dumps(dict(limit=3, offset=1))
+        response = self.app.get('/api/person?q=' + query)
+        data = loads(response.data)
+        assert data['num_results'] == 3
+        assert len(data['objects']) == 2
+        assert data['objects'][0]['name'] == u'Mary'
+
+    def test_count_only(self):
+        """Tests that the ``count_only`` query parameter causes the response to
+        contain only the number of results.
+
+        """
+        self.manager.create_api(self.Person, count_strategy='none')
+        query = dumps(dict(filters=[dict(name='age', op='>', val=20)]))
+        response = self.app.get('/api/person?count_only=true&q=' + query)
+        assert response.status_code == 200
+        assert loads(response.data) == dict(num_results=3)
+
+
+class TestRelatedCollections(TestSupport):
+    """Tests for :http:method:`get` requests on to-many relations of an
+    instance, like :http:get:`/api/person/1/computers`.
+
+    """
+
+    def setUp(self):
+        super(TestRelatedCollections, self).setUp()
+        person1 = self.Person(name=u'person1')
+        person2 = self.Person(name=u'person2')
+        person1.computers = [self.Computer(name=u'computer{0}'.format(i),
+                                           buy_date=datetime(2015, 1, i + 1))
+                             for i in range(25)]
+        person2.computers = [self.Computer(name=u'other')]
+        lazyperson = self.LazyPerson(name=u'lazy')
+        lazyperson.computers = [self.LazyComputer(name=u'lazy{0}'.format(i))
+                                for i in range(15)]
+        self.session.add_all([person1, person2, lazyperson])
+        self.session.commit()
+        self.manager.create_api(self.Person)
+        self.manager.create_api(self.LazyPerson)
+
+    def test_pagination(self):
+        """Tests that only the requested page of related instances is
+        fetched.
+
+        """
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = self.Base.metadata.bind
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        try:
+            response = self.app.get('/api/person/1/computers?page=3')
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert data['num_results'] == 25
+        assert data['total_pages'] == 3
+        assert data['page'] == 3
+        names = [computer['name'] for computer in data['objects']]
+        assert names == ['computer{0}'.format(i) for i in range(20, 25)]
+        assert any('LIMIT' in statement for statement in statements)
+        response = self.app.get('/api/person/2/computers')
+        data = loads(response.data)
+        assert data['num_results'] == 1
+        assert data['objects'][0]['name'] == u'other'
+
+    def test_search(self):
+        """Tests that related instances can be filtered and ordered."""
+        query = dict(filters=[dict(name='buy_date', op='>=',
+                                   val='2015-01-20')],
+                     order_by=[dict(field='name', direction='desc')])
+        response = self.app.get('/api/person/1/computers?q=' + dumps(query))
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert data['num_results'] == 6
+        names = [computer['name'] for computer in data['objects']]
+        assert names == ['computer{0}'.format(i) for i in range(24, 18, -1)]
+        response = self.app.get('/api/person/1/computers?q=bogus')
+        assert response.status_code == 400
+
+    def test_relation_order_by(self):
+        """Tests that related instances are ordered as specified by the
+        relation unless the client requests another ordering.
+
+        """
+        class Item(self.Base):
+            __tablename__ = 'item'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+            owner_id = Column(Integer, ForeignKey('owner.id'))
+
+        class Owner(self.Base):
+            __tablename__ = 'owner'
+            id = Column(Integer, primary_key=True)
+            items = rel(Item, order_by=Item.name.desc())
+
+        self.Base.metadata.create_all()
+        self.session.add(Owner(items=[Item(name=name) for name in 'acb']))
+        self.session.commit()
+        self.manager.create_api(Owner)
+        response = self.app.get('/api/owner/1/items')
+        assert response.status_code == 200
+        names = [item['name'] for item in loads(response.data)['objects']]
+        assert names == ['c', 'b', 'a']
+        query = dumps(dict(order_by=[dict(field='name', direction='asc')]))
+        response = self.app.get('/api/owner/1/items?q=' + query)
+        names = [item['name'] for item in loads(response.data)['objects']]
+        assert names == ['a', 'b', 'c']
+
+    def test_dynamic(self):
+        """Tests that dynamic relations are paginated."""
+        response = self.app.get('/api/lazyperson/1/computers'
+                                '?results_per_page=5')
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert data['num_results'] == 15
+        assert len(data['objects']) == 5
+
+
+class TestStreaming(TestSupportPrefilled):
+    """Tests for streaming responses to :http:method:`get` requests on
+    collections.
+
+    """
+
+    def setUp(self):
+        super(TestStreaming, self).setUp()
+        self.manager.create_api(self.Person, streaming=True,
+                                results_per_page=2)
+        self.manager.create_api(self.Person, url_prefix='/buffered',
+                                results_per_page=2)
+
+    def test_streaming(self):
+        """Tests that the streamed response is the same as the buffered
+        response.
+
+        """
+        for url in '/person', '/person?page=3', '/person?count=none':
+            response = self.app.get('/api' + url)
+            buffered = self.app.get('/buffered' + url)
+            assert response.status_code == 200
+            # Streamed responses have no known length.
+            assert 'Content-Length' not in response.headers
+            assert 'Content-Length' in buffered.headers
+            assert response.mimetype == 'application/json'
+            assert loads(response.data) == loads(buffered.data)
+            link = buffered.headers['Link'].replace('/buffered/', '/api/')
+            assert response.headers['Link'] == link
+
+    def test_keyset(self):
+        """Tests that responses paginated by keyset can be streamed."""
+        self.flaskapp.secret_key = 'secret'
+        self.manager.create_api(self.Person, url_prefix='/keyset',
+                                streaming=True, pagination='keyset')
+        response = self.app.get('/keyset/person')
+        assert 'Content-Length' not in response.headers
+        data = loads(response.data)
+        assert len(data['objects']) == 5
+        assert data['next_cursor'] is None
+
+    def test_jsonp(self):
+        """Tests that JSONP responses are not streamed."""
+        response = self.app.get('/api/person?callback=foo')
+        assert response.status_code == 200
+        assert 'Content-Length' in response.headers
+        assert response.data.startswith(b'foo(')
+
+    def test_postprocessors(self):
+        """Tests that responses are not streamed if there are postprocessors
+        which need the complete result.
+
+        """
+        def add_key(result=None, **kw):
+            result['foo'] = 'bar'
+
+        self.manager.create_api(self.Person, url_prefix='/post',
+                                streaming=True,
+                                postprocessors=dict(GET_MANY=[add_key]))
+        response = self.app.get('/post/person')
+        assert 'Content-Length' in response.headers
+        data = loads(response.data)
+        assert data['foo'] == 'bar'
+        assert len(data['objects']) == 5
+
+
+class TestColumnProjection(TestSupport):
+    """Tests that columns which are not included in responses are not loaded
+    from the database.
+
+    """
+
+    def setUp(self):
+        super(TestColumnProjection, self).setUp()
+        person = self.Person(name=u'Jeffrey', age=24, other=1.5,
+                             birth_date=date(1990, 1, 1))
+        person.computers = [self.Computer(name=u'lixeiro', vendor=u'Lemote')]
+        self.session.add(person)
+        self.session.commit()
+        self.session.remove()
+        self.statements = []
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+
+    def tearDown(self):
+        event.remove(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+        super(TestColumnProjection, self).tearDown()
+
+    def _count_statement(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def _selected(self, column):
+        """Returns ``True`` if and only if any of the recorded statements
+        selects the specified column.
+
+        """
+        return any(column in statement.split('FROM')[0]
+                   for statement in self.statements)
+
+    def test_exclude_columns(self):
+        """Tests that excluded columns are not loaded."""
+        self.manager.create_api(self.Person,
+                                exclude_columns=['other', 'birth_date'])
+        for url in '/api/person', '/api/person/1':
+            del self.statements[:]
+            response = self.app.get(url)
+            assert response.status_code == 200
+            assert not self._selected('person.other')
+            assert not self._selected('person.birth_date')
+            assert self._selected('person.name')
+
+    def test_hybrid_dependencies(self):
+        """Tests that columns used by included hybrid properties are loaded
+        even if they are excluded.
+
+        """
+        self.manager.create_api(self.Person,
+                                exclude_columns=['age', 'other'])
+        response = self.app.get('/api/person/1')
+        data = loads(response.data)
+        assert 'age' not in data
+        assert not data['is_minor']
+        assert self._selected('person.age')
+        assert not self._selected('person.other')
+        # The hybrid properties did not cause any more queries.
+        num_statements = len(self.statements)
+        self.app.get('/api/person/1')
+        assert len(self.statements) == 2 * num_statements
+
+    def test_include_relations(self):
+        """Tests that only the included columns of related models are loaded,
+        along with the foreign keys needed for their relations.
+
+        """
+        self.manager.create_api(self.Person, include_columns=[
+            'id', 'name', 'computers', 'computers.name'])
+        response = self.app.get('/api/person')
+        data = loads(response.data)
+        assert data['objects'][0]['computers'] == [dict(name=u'lixeiro')]
+        assert self._selected('computer.name')
+        assert self._selected('computer.owner_id')
+        assert not self._selected('computer.vendor')
+        assert not self._selected('person.age')
+
+    def test_include_methods(self):
+        """Tests that all columns are loaded if there are included methods,
+        which may use any column.
+
+        """
+        self.manager.create_api(self.Person, exclude_columns=['other'],
+                                include_methods=['name_and_age'])
+        response = self.app.get('/api/person/1')
+        assert loads(response.data)['name_and_age'] == u'Jeffrey (aged 24)'
+        assert self._selected('person.other')
+
+
+class TestFastRead(TestSupport):
+    """Tests for the ``fast_read`` keyword argument, which serializes rows of
+    columns instead of instances of the model.
+
+    """
+
+    def setUp(self):
+        super(TestFastRead, self).setUp()
+        people = [self.Person(name=u'Jeffrey', age=24, other=1.5,
+                              birth_date=date(1990, 1, 1)),
+                  self.Person(name=u'Mary', age=15),
+                  self.Person(name=u'Lucy')]
+        people[0].computers = [self.Computer(name=u'lixeiro')]
+        self.session.add_all(people)
+        self.session.commit()
+        self.session.remove()
+        self.loaded = []
+        event.listen(self.Person, 'load', self._record_load)
+
+    def tearDown(self):
+        event.remove(self.Person, 'load', self._record_load)
+        super(TestFastRead, self).tearDown()
+
+    def _record_load(self, instance, context):
+        self.loaded.append(instance)
+
+    def _compare(self, url, **kw):
+        """Asserts that the responses to requests for `url` are the same with
+        and without ``fast_read``, and returns the response of the API using
+        ``fast_read``.
+
+        """
+        self.manager.create_api(self.Person, url_prefix='/slow', **kw)
+        self.manager.create_api(self.Person, url_prefix='/fast',
+                                fast_read=True, **kw)
+        expected = self.app.get('/slow' + url)
+        del self.loaded[:]
+        response = self.app.get('/fast' + url)
+        assert response.status_code == expected.status_code
+        assert loads(response.data) == loads(expected.data)
+        return response
+
+    def test_collection(self):
+        """Tests that a collection is serialized without loading instances of
+        the model.
+
+        """
+        response = self._compare('/person', include_columns=[
+            'id', 'name', 'age', 'other', 'birth_date'])
+        data = loads(response.data)
+        assert data['num_results'] == 3
+        assert data['objects'][0]['birth_date'] == '1990-01-01'
+        assert data['objects'][0]['other'] == 1.5
+        assert data['objects'][2]['age'] is None
+        assert self.loaded == []
+
+    def test_search(self):
+        """Tests that filtering, ordering, and single results are supported.
+
+        """
+        query = dict(filters=[dict(name='age', op='>', val=10)],
+                     order_by=[dict(field='age', direction='desc')])
+        url = '/person?q={0}'.format(dumps(query))
+        response = self._compare(url, include_columns=['id', 'name', 'age'])
+        names = [person['name'] for person in loads(response.data)['objects']]
+        assert names == [u'Jeffrey', u'Mary']
+        assert self.loaded == []
+        query = dict(filters=[dict(name='name', op='eq', val=u'Mary')],
+                     single=True)
+        url = '/person?q={0}'.format(dumps(query))
+        response = self.app.get('/fast' + url)
+        assert response.status_code == 200
+        assert loads(response.data)['age'] == 15
+        assert response.headers['Location'].endswith('/person/2')
+        assert self.loaded == []
+
+    def test_window_count(self):
+        """Tests that the window function count strategy serializes rows of
+        columns as well.
+
+        """
+        response = self._compare('/person?results_per_page=2',
+                                 include_columns=['id', 'name'],
+                                 count_strategy='window')
+        data = loads(response.data)
+        assert data['num_results'] == 3
+        assert len(data['objects']) == 2
+        assert self.loaded == []
+
+    def test_custom_query(self):
+        """Tests that rows are selected using the custom ``query`` attribute of
+        the model, so that the instances it hides are not revealed.
+
+        """
+        session = self.session
+
+        class Note(self.Base):
+            __tablename__ = 'note'
+            id = Column(Integer, primary_key=True)
+            text = Column(Unicode)
+            hidden = Column(Boolean)
+
+            @classmethod
+            def query(cls):
+                return session.query(cls).filter(cls.hidden.is_(False))
+
+        self.Base.metadata.create_all()
+        self.session.add_all([Note(text=u'public', hidden=False),
+                              Note(text=u'hidden', hidden=True)])
+        self.session.commit()
+        self.manager.create_api(Note, url_prefix='/slow')
+        self.manager.create_api(Note, url_prefix='/fast', fast_read=True)
+        for prefix in '/slow', '/fast':
+            response = self.app.get(prefix + '/note')
+            assert response.status_code == 200
+            texts = [note['text'] for note in loads(response.data)['objects']]
+            assert texts == [u'public']
+
+    def test_relations(self):
+        """Tests that instances are loaded if the response includes related
+        instances.
+
+        """
+        response = self._compare('/person')
+        assert len(loads(response.data)['objects']) == 3
+        assert len(self.loaded) == 3
+
+    def test_hybrid_properties(self):
+        """Tests that instances are loaded if the response includes hybrid
+        properties, whose SQL expressions may not compute the same values as
+        their Python implementations.
+
+        """
+        response = self._compare('/person',
+                                 exclude_columns=['computers', 'projects'])
+        assert loads(response.data)['objects'][0]['is_above_21']
+        assert len(self.loaded) == 3
+
+    def test_methods(self):
+        """Tests that instances are loaded if the response includes methods.
+        """
+        query = dict(filters=[dict(name='age', op='is_not_null')])
+        url = '/person?q={0}'.format(dumps(query))
+        self._compare(url, include_columns=['id', 'name'],
+                      include_methods=['name_and_age'])
+        assert len(self.loaded) == 2
+
+    def test_related_ordering(self):
+        """Tests that instances are loaded if the results are ordered by the
+        fields of related models.
+
+        """
+        query = dict(order_by=[dict(field='computers__name')])
+        url = '/person?q={0}'.format(dumps(query))
+        self._compare(url, include_columns=['id', 'name'])
+        assert len(self.loaded) > 0
+
+
+class TestBulkPost(TestSupport):
+    """Tests for creating many instances with a single :http:method:`post`
+    request whose body is a JSON array.
+
+    """
+
+    def setUp(self):
+        super(TestBulkPost, self).setUp()
+        self.constructed = []
+        event.listen(self.Person, 'init', self._record_init)
+
+    def tearDown(self):
+        event.remove(self.Person, 'init', self._record_init)
+        super(TestBulkPost, self).tearDown()
+
+    def _record_init(self, instance, args, kwargs):
+        self.constructed.append(instance)
+
+    @skip_unless(has_bulk_insert_mappings, 'SQLAlchemy 1.0 not found.')
+    def test_bulk_insert(self):
+        """Tests that instances with only columns are inserted without
+        constructing instances of the model, in a single transaction.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'])
+        data = [dict(name=u'Jeffrey', age=24, birth_date='1990-01-01'),
+                dict(name=u'Mary', age=15)]
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        result = loads(response.data)
+        assert result['num_created'] == 2
+        assert 'locations' not in result
+        assert self.constructed == []
+        people = self.session.query(self.Person).order_by(self.Person.id)
+        assert [p.name for p in people] == [u'Jeffrey', u'Mary']
+        assert people[0].birth_date == date(1990, 1, 1)
+        assert result['objects'] == [dict(id=p.id) for p in people]
+
+    @skip_unless(has_bulk_insert_mappings, 'SQLAlchemy 1.0 not found.')
+    def test_client_primary_keys(self):
+        """Tests that instances whose primary keys are specified by the client
+        are inserted by a single ``executemany()`` call.
+
+        """
+        inserts = []
+
+        def record_insert(conn, cursor, statement, parameters, context,
+                          executemany):
+            if statement.startswith('INSERT'):
+                inserts.append(executemany)
+
+        self.manager.create_api(self.Person, methods=['POST'])
+        data = [dict(id=i, name=u'person{0}'.format(i)) for i in (5, 7, 9)]
+        engine = self.Base.metadata.bind
+        event.listen(engine, 'before_cursor_execute', record_insert)
+        try:
+            response = self.app.post('/api/person', data=dumps(data))
+        finally:
+            event.remove(engine, 'before_cursor_execute', record_insert)
+        assert response.status_code == 201
+        assert loads(response.data)['objects'] == [dict(id=i)
+                                                   for i in (5, 7, 9)]
+        assert inserts == [True]
+        assert self.constructed == []
+        assert self.session.query(self.Person).count() == 3
+
+    def test_relations(self):
+        """Tests that instances with related instances are created through
+        the ORM.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'])
+        data = [dict(name=u'Jeffrey', computers=[dict(name=u'lixeiro')]),
+                dict(name=u'Mary')]
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        assert loads(response.data)['num_created'] == 2
+        assert len(self.constructed) == 2
+        jeffrey = self.session.query(self.Person).filter_by(name=u'Jeffrey')
+        assert [c.name for c in jeffrey.one().computers] == [u'lixeiro']
+
+    def test_locations(self):
+        """Tests that the ``locations`` query parameter requests the URLs of
+        the created instances.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'])
+        data = dumps([dict(name=u'Jeffrey'), dict(name=u'Mary')])
+        response = self.app.post('/api/person?locations=true', data=data)
+        assert response.status_code == 201
+        result = loads(response.data)
+        ids = [obj['id'] for obj in result['objects']]
+        assert result['locations'] == ['http://localhost/api/person/{0}'
+                                       .format(i) for i in ids]
+
+    def test_errors(self):
+        """Tests that no instances are created if any item is invalid, and
+        that the errors identify the invalid items.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'])
+        data = [dict(name=u'Jeffrey'), dict(bogus=1), 2]
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 400
+        errors = loads(response.data)['errors']
+        assert [error['index'] for error in errors] == [2]
+        data = [dict(name=u'Jeffrey'), dict(bogus=1)]
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 400
+        errors = loads(response.data)['errors']
+        assert [error['index'] for error in errors] == [1]
+        assert self.session.query(self.Person).count() == 0
+
+    def test_integrity_error(self):
+        """Tests that a database error rolls back the entire request."""
+        self.manager.create_api(self.Person, methods=['POST'])
+        data = [dict(name=u'Jeffrey'), dict(name=u'Jeffrey')]
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 400
+        assert self.session.query(self.Person).count() == 0
+
+    def test_max_bulk_size(self):
+        """Tests that requests with more than ``max_bulk_size`` objects are
+        rejected.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                max_bulk_size=1)
+        self.manager.create_api(self.Computer, methods=['POST'],
+                                max_bulk_size=0)
+        data = dumps([dict(name=u'Jeffrey'), dict(name=u'Mary')])
+        response = self.app.post('/api/person', data=data)
+        assert response.status_code == 413
+        response = self.app.post('/api/computer', data=data)
+        assert response.status_code == 400
+        assert self.session.query(self.Person).count() == 0
+
+    def test_processors(self):
+        """Tests that preprocessors are applied to each item and
+        postprocessors to the entire response.
+
+        """
+        def set_age(data=None, **kw):
+            data['age'] = 42
+
+        results = []
+
+        def record(result=None, **kw):
+            results.append(result)
+
+        self.manager.create_api(self.Person, methods=['POST'],
+                                preprocessors=dict(POST=[set_age]),
+                                postprocessors=dict(POST=[record]))
+        data = dumps([dict(name=u'Jeffrey'), dict(name=u'Mary')])
+        response = self.app.post('/api/person', data=data)
+        assert response.status_code == 201
+        assert [r['num_created'] for r in results] == [2]
+        people = self.session.query(self.Person)
+        assert [p.age for p in people] == [42, 42]
+
+
+class TestUpsert(TestSupportPrefilled):
+    """Tests for creating or updating instances with :http:method:`post`
+    requests with the ``upsert`` query parameter.
+
+    """
+
+    def _names(self):
+        people = self.session.query(self.Person).order_by(self.Person.id)
+        return [(person.name, person.age) for person in people]
+
+    def test_not_allowed(self):
+        """Tests that upserts are not allowed by default."""
+        self.manager.create_api(self.Person, methods=['POST'])
+        data = dumps(dict(id=1, name=u'Abraham'))
+        response = self.app.post('/api/person?upsert=true', data=data)
+        assert response.status_code == 400
+        assert self._names()[0] == (u'Lincoln', 23)
+
+    def test_primary_key(self):
+        """Tests that an upsert without configured keys updates the instance
+        with the same primary key, or creates a new one.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_upsert=True)
+        data = dumps(dict(id=1, name=u'Abraham'))
+        response = self.app.post('/api/person?upsert=true', data=data)
+        assert response.status_code == 200
+        assert response.headers['Location'].endswith('/api/person/1')
+        result = loads(response.data)
+        assert result['name'] == u'Abraham'
+        assert result['age'] == 23
+        data = dumps(dict(id=10, name=u'Jeffrey', age=24))
+        response = self.app.post('/api/person?upsert=true', data=data)
+        assert response.status_code == 200
+        assert loads(response.data)['id'] == 10
+        names = self._names()
+        assert names[0] == (u'Abraham', 23)
+        assert names[-1] == (u'Jeffrey', 24)
+        assert len(names) == 6
+
+    def test_string_primary_key(self):
+        """Tests that an upsert converts a primary key given as a string to
+        the type of its column, and rejects a string which is not a number.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_upsert=True)
+        data = dumps(dict(id=u'1', name=u'Abraham'))
+        response = self.app.post('/api/person?upsert=true', data=data)
+        assert response.status_code == 200
+        assert loads(response.data)['id'] == 1
+        data = dumps([dict(id=u'2', age=20), dict(id=u'10', name=u'Jeffrey')])
+        response = self.app.post('/api/person?upsert=true', data=data)
+        assert response.status_code == 200
+        assert loads(response.data)['objects'] == [dict(id=2), dict(id=10)]
+        names = self._names()
+        assert names[0] == (u'Abraham', 23)
+        assert names[1] == (u'Mary', 20)
+        assert names[-1] == (u'Jeffrey', None)
+        assert len(names) == 6
+        data = dumps(dict(id=u'foo', name=u'Abraham'))
+        response = self.app.post('/api/person?upsert=true', data=data)
+        assert response.status_code == 400
+
+    def test_upsert_keys(self):
+        """Tests that an upsert updates the instance with the same values of
+        the configured keys.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_upsert=True, upsert_keys=['name'])
+        data = dumps(dict(name=u'Lincoln', age=50))
+        response = self.app.post('/api/person?upsert=true', data=data)
+        assert response.status_code == 200
+        assert loads(response.data)['id'] == 1
+        assert self._names()[0] == (u'Lincoln', 50)
+        response = self.app.post('/api/person?upsert=true',
+                                 data=dumps(dict(age=50)))
+        assert response.status_code == 400
+        response = self.app.post('/api/person?upsert=true',
+                                 data=dumps(dict(name=u'Lincoln', foo=1)))
+        assert response.status_code == 400
+
+    def test_many(self):
+        """Tests that an upsert of a JSON array creates or updates an
+        instance for each object in it.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_upsert=True, upsert_keys=['name'])
+        data = [dict(name=u'Mary', age=20), dict(name=u'Jeffrey', age=24),
+                dict(name=u'Jeffrey', age=25)]
+        response = self.app.post('/api/person?upsert=true', data=dumps(data))
+        assert response.status_code == 200
+        result = loads(response.data)
+        assert result['num_upserted'] == 3
+        assert result['objects'] == [dict(id=2), dict(id=6), dict(id=6)]
+        names = self._names()
+        assert names[1] == (u'Mary', 20)
+        assert names[-1] == (u'Jeffrey', 25)
+        assert len(names) == 6
+
+    def test_many_errors(self):
+        """Tests that an upsert of a JSON array in which some objects do not
+        specify the keys changes nothing.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_upsert=True, upsert_keys=['name'])
+        data = [dict(name=u'Mary', age=20), dict(age=24), 1]
+        response = self.app.post('/api/person?upsert=true', data=dumps(data))
+        assert response.status_code == 400
+        errors = loads(response.data)['errors']
+        assert [error['index'] for error in errors] == [1, 2]
+        assert self._names()[1] == (u'Mary', 19)
+
+
+class TestBulkPatch(TestSupportPrefilled):
+    """Tests for updating all instances matched by a :http:method:`patch`
+    request on a collection with a single ``UPDATE`` statement.
+
+    """
+
+    def setUp(self):
+        super(TestBulkPatch, self).setUp()
+        self.session.remove()
+        self.loaded = []
+        event.listen(self.Person, 'load', self._record_load)
+
+    def tearDown(self):
+        event.remove(self.Person, 'load', self._record_load)
+        super(TestBulkPatch, self).tearDown()
+
+    def _record_load(self, instance, context):
+        self.loaded.append(instance)
+
+    def test_bulk_update(self):
+        """Tests that changing only columns updates the matching rows without
+        loading any instances.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'],
+                                allow_patch_many=True)
+        search = dict(filters=[dict(name='age', op='lt', val=24)],
+                      order_by=[dict(field='name')])
+        data = dict(other=3, birth_date='1990-01-01', q=search)
+        response = self.app.patch('/api/person', data=dumps(data))
+        assert response.status_code == 200
+        assert loads(response.data)['num_modified'] == 3
+        assert self.loaded == []
+        people = self.session.query(self.Person)
+        young = [p for p in people if p.age < 24]
+        assert all(p.other == 3 for p in young)
+        assert all(p.birth_date == date(1990, 1, 1) for p in young)
+        assert not any(p.other == 3 for p in people if p.age >= 24)
+
+    def test_orm_updates(self):
+        """Tests that ``orm_updates`` forces instances to be loaded and
+        updated through the ORM.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'],
+                                allow_patch_many=True, orm_updates=True)
+        response = self.app.patch('/api/person', data=dumps(dict(other=3)))
+        assert response.status_code == 200
+        assert loads(response.data)['num_modified'] == 5
+        assert len(self.loaded) == 5
+
+    def test_limit(self):
+        """Tests that searches with a limit update instances through the
+        ORM.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'],
+                                allow_patch_many=True)
+        data = dict(other=3, q=dict(limit=2))
+        response = self.app.patch('/api/person', data=dumps(data))
+        assert response.status_code == 200
+        assert loads(response.data)['num_modified'] == 2
+        assert self.session.query(self.Person).filter_by(other=3).count() == 2
+
+
+class TestUpdateOperators(TestSupportPrefilled):
+    """Tests for operator objects, like ``{"inc": 1}``, in the request data of
+    :http:method:`patch` requests.
+
+    """
+
+    def setUp(self):
+        super(TestUpdateOperators, self).setUp()
+        self.session.remove()
+        self.loaded = []
+        event.listen(self.Person, 'load', self._record_load)
+
+    def tearDown(self):
+        event.remove(self.Person, 'load', self._record_load)
+        super(TestUpdateOperators, self).tearDown()
+
+    def _record_load(self, instance, context):
+        self.loaded.append(instance)
+
+    def _values(self, field):
+        people = self.session.query(self.Person).order_by(self.Person.id)
+        return [getattr(person, field) for person in people]
+
+    def test_single(self):
+        """Tests that the response to a request updating a single instance
+        with operators contains the new values.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'])
+        data = dict(age={'inc': 2}, other={'mul': 2}, name=u'Abraham')
+        response = self.app.patch('/api/person/1', data=dumps(data))
+        assert response.status_code == 200
+        result = loads(response.data)
+        assert result['age'] == 25
+        assert result['other'] == 44
+        assert result['name'] == u'Abraham'
+        assert self._values('age')[0] == 25
+
+    def test_many(self):
+        """Tests that operators update all matching rows without loading any
+        instances.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'],
+                                allow_patch_many=True)
+        search = dict(filters=[dict(name='age', op='lt', val=24)])
+        data = dict(age={'dec': 1}, q=search)
+        response = self.app.patch('/api/person', data=dumps(data))
+        assert response.status_code == 200
+        assert loads(response.data)['num_modified'] == 3
+        assert self.loaded == []
+        assert self._values('age') == [22, 18, 25, 6, 28]
+
+    def test_min_max(self):
+        """Tests the ``min`` and ``max`` operators, including on a column
+        whose value is ``NULL``.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'],
+                                allow_patch_many=True)
+        data = dict(other=None)
+        response = self.app.patch('/api/person/5', data=dumps(data))
+        assert response.status_code == 200
+        data = dict(other={'max': 20})
+        response = self.app.patch('/api/person', data=dumps(data))
+        assert response.status_code == 200
+        assert self._values('other') == [22, 20, 20, 20, 20]
+        data = dict(age={'min': 20})
+        response = self.app.patch('/api/person', data=dumps(data))
+        assert response.status_code == 200
+        assert self._values('age') == [20, 19, 20, 7, 20]
+
+    def test_orm_updates(self):
+        """Tests that operators are applied when instances are updated
+        through the ORM.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'],
+                                allow_patch_many=True, orm_updates=True)
+        data = dict(age={'inc': 1})
+        response = self.app.patch('/api/person', data=dumps(data))
+        assert response.status_code == 200
+        assert loads(response.data)['num_modified'] == 5
+        assert self._values('age') == [24, 20, 26, 8, 29]
+
+    def test_bad_operand(self):
+        """Tests that an operator whose operand is not a number causes an
+        error response.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'])
+        for operand in (u'1', True, None, [1]):
+            data = dict(age={'inc': operand})
+            response = self.app.patch('/api/person/1', data=dumps(data))
+            assert response.status_code == 400
+        assert self._values('age')[0] == 23
+
+    def test_non_numeric_column(self):
+        """Tests that an operator on a column which is not numeric causes an
+        error response.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'])
+        for data in (dict(name={'inc': 2}), dict(birth_date={'mul': 2})):
+            response = self.app.patch('/api/person/1', data=dumps(data))
+            assert response.status_code == 400
+        assert self._values('name')[0] == u'Lincoln'
+
+    def test_object_column(self):
+        """Tests that an object which looks like an operator is set as the
+        value of a column which can hold objects.
+
+        """
+        class Document(self.Base):
+            __tablename__ = 'document'
+            id = Column(Integer, primary_key=True)
+            content = Column(PickleType)
+
+        self.Base.metadata.create_all()
+        self.session.add(Document(id=1, content=u'text'))
+        self.session.commit()
+        self.manager.create_api(Document, methods=['PATCH'])
+        data = dict(content={'inc': 1})
+        response = self.app.patch('/api/document/1', data=dumps(data))
+        assert response.status_code == 200
+        assert loads(response.data)['content'] == {'inc': 1}
+        self.session.remove()
+        assert self.session.query(Document).get(1).content == {'inc': 1}
+
+
+class TestWriteQueries(TestSupport):
+    """Tests that :http:method:`patch` and :http:method:`post` requests for a
+    single instance do not query the database more than necessary.
+
+    """
+
+    def setUp(self):
+        super(TestWriteQueries, self).setUp()
+        person = self.Person(name=u'Jeffrey', age=24)
+        person.computers = [self.Computer(name=u'lixeiro')]
+        self.session.add(person)
+        self.session.commit()
+        self.session.remove()
+        self.manager.create_api(self.Person, methods=['PATCH', 'POST'])
+        self.statements = []
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+
+    def tearDown(self):
+        event.remove(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+        super(TestWriteQueries, self).tearDown()
+
+    def _count_statement(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_patch(self):
+        """Tests that a :http:method:`patch` request fetches the instance and
+        its related instances once, updates it, and serializes it without
+        fetching it again.
+
+        """
+        data = dumps(dict(age=25))
+        response = self.app.patch('/api/person/1', data=data)
+        assert response.status_code == 200
+        result = loads(response.data)
+        assert result['age'] == 25
+        assert [c['name'] for c in result['computers']] == [u'lixeiro']
+        selects = [s for s in self.statements if s.startswith('SELECT')]
+        updates = [s for s in self.statements if s.startswith('UPDATE')]
+        # One query for the person and one for each of its relations.
+        assert len(selects) == 3
+        assert len([s for s in selects if s.startswith('SELECT person.')]) == 1
+        assert len(updates) == 1
+
+    def test_patch_not_found(self):
+        """Tests that a :http:method:`patch` request for an instance which
+        does not exist issues a single query.
+
+        """
+        response = self.app.patch('/api/person/2', data=dumps(dict(age=25)))
+        assert response.status_code == 404
+        assert len(self.statements) == 1
+
+    def test_post(self):
+        """Tests that a :http:method:`post` request serializes the new
+        instance without fetching it again.
+
+        """
+        data = dumps(dict(name=u'Mary', age=19))
+        response = self.app.post('/api/person', data=data)
+        assert response.status_code == 201
+        result = loads(response.data)
+        assert result['name'] == u'Mary'
+        assert result['computers'] == []
+        # The new row is not selected again, only its relations.
+        assert self.statements[0].startswith('INSERT')
+        assert not any('FROM person' in s for s in self.statements)
+
+    def _add_computers(self):
+        self.session.add_all([self.Computer(name=u'foo'),
+                              self.Computer(name=u'bar')])
+        self.session.commit()
+        self.session.remove()
+        del self.statements[:]
+
+    def _computer_lookups(self):
+        return [s for s in self.statements
+                if s.startswith('SELECT computer.') and 'FROM computer' in s
+                and 'FROM (' not in s]
+
+    def test_post_related(self):
+        """Tests that the existing instances referenced by the relations in
+        the request data of a :http:method:`post` request are loaded by a
+        single query.
+
+        """
+        self._add_computers()
+        computers = [dict(id=1), dict(id=2), dict(id=3), dict(name=u'baz')]
+        data = dumps(dict(name=u'Mary', computers=computers))
+        response = self.app.post('/api/person', data=data)
+        assert response.status_code == 201
+        result = loads(response.data)
+        names = sorted(c['name'] for c in result['computers'])
+        assert names == [u'bar', u'baz', u'foo', u'lixeiro']
+        assert len(self._computer_lookups()) == 1
+
+    def test_post_many_related(self):
+        """Tests that the existing instances referenced by the relations of
+        all objects in a :http:method:`post` request containing an array are
+        loaded by a single query.
+
+        """
+        self._add_computers()
+        data = [dict(name=u'Mary', computers=[dict(id=1), dict(id=2)]),
+                dict(name=u'Lucy', computers=[dict(id=3)])]
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        assert loads(response.data)['num_created'] == 2
+        assert len(self._computer_lookups()) == 1
+        lucy = self.session.query(self.Person).filter_by(name=u'Lucy').one()
+        assert [c.name for c in lucy.computers] == [u'bar']
+
+    def test_post_new_keyed_related(self):
+        """Tests that new related instances whose primary keys are given in
+        the request data of a :http:method:`post` request are not queried
+        for again after the single query for the existing instances.
+
+        """
+        self._add_computers()
+        computers = [dict(id=i, name=u'new{0}'.format(i))
+                     for i in range(10, 30)]
+        data = dumps(dict(name=u'Mary', computers=computers))
+        response = self.app.post('/api/person', data=data)
+        assert response.status_code == 201
+        assert len(loads(response.data)['computers']) == 20
+        assert len(self._computer_lookups()) == 1
+
+    def test_patch_add_related(self):
+        """Tests that the existing instances added to a relation by a
+        :http:method:`patch` request are loaded by a single query.
+
+        """
+        self._add_computers()
+        data = dict(computers=dict(add=[dict(id=2), dict(id=3)]))
+        response = self.app.patch('/api/person/1', data=dumps(data))
+        assert response.status_code == 200
+        assert len(loads(response.data)['computers']) == 3
+        assert len(self._computer_lookups()) == 1
+
+
+class TestCollectionRows(ManagerTestBase):
+    """Tests that adding, removing, and setting related instances with a
+    :http:method:`patch` request writes the association rows directly instead
+    of loading whole collections.
+
+    """
+
+    def setUp(self):
+        super(TestCollectionRows, self).setUp()
+        article_tag = Table('article_tag', self.Base.metadata,
+                            Column('article_id', Integer,
+                                   ForeignKey('article.id'),
+                                   primary_key=True),
+                            Column('tag_id', Integer, ForeignKey('tag.id'),
+                                   primary_key=True))
+
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class Comment(self.Base):
+            __tablename__ = 'comment'
+            id = Column(Integer, primary_key=True)
+            article_id = Column(Integer, ForeignKey('article.id'))
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            tags = rel(Tag, secondary=article_tag)
+            comments = rel(Comment)
+
+        self.Base.metadata.create_all()
+        self.article_tag = article_tag
+        self.Article = Article
+        self.Comment = Comment
+        self.Tag = Tag
+        article = Article(tags=[Tag(name=u'tag{0}'.format(i))
+                                for i in range(10)],
+                          comments=[Comment() for i in range(10)])
+        self.session.add_all([article, Tag(name=u'new'), Comment()])
+        self.session.commit()
+        self.session.remove()
+        self.manager.create_api(Article, methods=['PATCH'],
+                                allow_patch_many=True)
+        self.loaded = []
+        event.listen(Tag, 'load', self._record_load)
+        event.listen(Comment, 'load', self._record_load)
+
+    def tearDown(self):
+        event.remove(self.Tag, 'load', self._record_load)
+        event.remove(self.Comment, 'load', self._record_load)
+        self.Base.metadata.drop_all()
+
+    def _record_load(self, instance, context):
+        self.loaded.append(instance.id)
+
+    def _patch(self, data):
+        data['q'] = dict(filters=[dict(name='id', op='eq', val=1)])
+        response = self.app.patch('/api/article', data=dumps(data))
+        assert response.status_code == 200
+        self.session.remove()
+
+    def _tag_ids(self):
+        query = self.session.query(self.article_tag.c.tag_id)
+        return sorted(tag_id for tag_id, in query)
+
+    def _comment_ids(self):
+        query = self.session.query(self.Comment.id).filter_by(article_id=1)
+        return sorted(comment_id for comment_id, in query)
+
+    def test_add_secondary(self):
+        """Tests that adding an instance to a many-to-many relation inserts
+        an association row without loading the collection.
+
+        """
+        self._patch(dict(tags=dict(add=[dict(id=11), dict(id=1)])))
+        assert sorted(self.loaded) == [1, 11]
+        assert self._tag_ids() == list(range(1, 12))
+
+    def test_remove_secondary(self):
+        """Tests that removing an instance from a many-to-many relation
+        deletes its association row without loading the collection.
+
+        """
+        self._patch(dict(tags=dict(remove=[dict(id=1), dict(id=2)])))
+        assert sorted(self.loaded) == [1, 2]
+        assert self._tag_ids() == list(range(3, 11))
+        assert self.session.query(self.Tag).count() == 11
+
+    def test_set_secondary(self):
+        """Tests that setting a many-to-many relation writes only the
+        associations which change.
+
+        """
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        bind = self.Base.metadata.bind
+        event.listen(bind, 'before_cursor_execute', record)
+        try:
+            self._patch(dict(tags=[dict(id=1), dict(id=2), dict(id=11)]))
+        finally:
+            event.remove(bind, 'before_cursor_execute', record)
+        assert self._tag_ids() == [1, 2, 11]
+        inserts = [s for s in statements if s.startswith('INSERT')]
+        deletes = [s for s in statements if s.startswith('DELETE')]
+        assert len(inserts) == 1
+        assert len(deletes) == 1
+        assert sorted(self.loaded) == [1, 2, 11]
+
+    def test_one_to_many(self):
+        """Tests that adding, removing, and setting instances of a one-to-many
+        relation updates their foreign keys without loading the collection.
+
+        """
+        self._patch(dict(comments=dict(add=[dict(id=11)],
+                                       remove=[dict(id=1)])))
+        assert sorted(self.loaded) == [1, 11]
+        assert self._comment_ids() == list(range(2, 12))
+        del self.loaded[:]
+        self._patch(dict(comments=[dict(id=2), dict(id=3), dict(id=1)]))
+        assert sorted(self.loaded) == [1, 2, 3]
+        assert self._comment_ids() == [1, 2, 3]
+
+    def test_new_not_nullable(self):
+        """Tests that new instances added to or set on a one-to-many relation
+        whose foreign key is not nullable are inserted with the foreign key
+        of the instance they are related to.
+
+        """
+        class Page(self.Base):
+            __tablename__ = 'page'
+            id = Column(Integer, primary_key=True)
+            number = Column(Integer)
+            book_id = Column(Integer, ForeignKey('book.id'), nullable=False)
+
+        class Book(self.Base):
+            __tablename__ = 'book'
+            id = Column(Integer, primary_key=True)
+            pages = rel(Page)
+
+        self.Base.metadata.create_all()
+        self.session.add(Book(id=1, pages=[Page(id=1, number=1)]))
+        self.session.commit()
+        self.session.remove()
+        self.manager.create_api(Book, methods=['PATCH'],
+                                allow_patch_many=True)
+        query = dict(filters=[dict(name='id', op='eq', val=1)])
+        data = dict(pages=dict(add=[dict(number=2)]), q=query)
+        response = self.app.patch('/api/book', data=dumps(data))
+        assert response.status_code == 200
+        data = dict(pages=[dict(id=1), dict(id=2), dict(number=3)], q=query)
+        response = self.app.patch('/api/book', data=dumps(data))
+        assert response.status_code == 200
+        self.session.remove()
+        query = self.session.query(Page.number).filter_by(book_id=1)
+        assert sorted(number for number, in query) == [1, 2, 3]
+
+    def test_loaded_collection(self):
+        """Tests that a collection which is already loaded, like one which is
+        serialized in the response, is modified through the ORM.
+
+        """
+        self.manager.create_api(self.Article, methods=['PATCH'],
+                                url_prefix='/api2')
+        data = dict(tags=dict(add=[dict(id=11)], remove=[dict(id=1)]))
+        response = self.app.patch('/api2/article/1', data=dumps(data))
+        assert response.status_code == 200
+        tags = loads(response.data)['tags']
+        assert sorted(tag['id'] for tag in tags) == list(range(2, 12))
+        assert self._tag_ids() == list(range(2, 12))
+
+
+class TestBatch(TestSupportPrefilled):
+    """Tests for performing many operations in a single request with the
+    batch API.
+
+    """
+
+    def setUp(self):
+        """Creates the APIs for the people and computers and the batch API."""
+        super(TestBatch, self).setUp()
+        # pysqlite does not begin a transaction before a savepoint, so the
+        # transaction is begun explicitly, as described in the SQLAlchemy
+        # documentation for the SQLite dialect.
+        engine = self.Base.metadata.bind
+        connection = engine.raw_connection()
+        connection.connection.isolation_level = None
+        connection.close()
+        event.listen(engine, 'begin', self._begin)
+        self.manager.create_api(self.Person, methods=['GET', 'POST', 'PATCH',
+                                                      'DELETE'])
+        self.manager.create_api(self.Computer, methods=['POST'])
+        self.manager.create_batch_api(max_operations=5)
+
+    @staticmethod
+    def _begin(connection):
+        connection.execute('BEGIN')
+
+    def _names(self):
+        people = self.session.query(self.Person).order_by(self.Person.id)
+        return [person.name for person in people]
+
+    def test_operations(self):
+        """Tests that the operations are performed in order and that their
+        results are returned.
+
+        """
+        operations = [dict(method='post', collection='person',
+                           body=dict(name=u'Jeffrey')),
+                      dict(method='patch', collection='person', id=1,
+                           body=dict(name=u'Abraham')),
+                      dict(method='delete', collection='person', id=2),
+                      dict(method='get', collection='person', id=3),
+                      dict(method='get', collection='person',
+                           params=dict(q=dict(filters=[dict(name='age',
+                                                            op='lt',
+                                                            val=10)])))]
+        response = self.app.post('/api/_batch',
+                                 data=dumps(dict(operations=operations)))
+        assert response.status_code == 200
+        results = loads(response.data)['results']
+        assert [result['status'] for result in results] == [201, 200, 204,
+                                                            200, 200]
+        assert results[0]['body']['name'] == u'Jeffrey'
+        assert results[0]['location'].endswith('/api/person/6')
+        assert results[1]['body']['name'] == u'Abraham'
+        assert results[3]['body']['name'] == u'Lucy'
+        assert results[4]['body']['num_results'] == 1
+        assert self._names() == [u'Abraham', u'Lucy', u'Katy', u'John',
+                                 u'Jeffrey']
+
+    def test_request_hooks(self):
+        """Tests that the request hooks of the application run for each
+        operation, and that a hook may reject an operation.
+
+        """
+        paths = []
+        responses = []
+
+        @self.flaskapp.before_request
+        def check_request():
+            paths.append(request.path)
+            if request.method == 'DELETE':
+                abort(403)
+
+        @self.flaskapp.after_request
+        def record_response(response):
+            responses.append((request.path, response.status_code))
+            return response
+
+        operations = [dict(method='patch', collection='person', id=1,
+                           body=dict(name=u'Abraham')),
+                      dict(method='delete', collection='person', id=2)]
+        response = self.app.post('/api/_batch',
+                                 data=dumps(dict(operations=operations)))
+        assert response.status_code == 403
+        results = loads(response.data)['results']
+        assert [result['status'] for result in results] == [200, 403]
+        assert paths == ['/api/_batch', '/api/person/1', '/api/person/2']
+        assert responses == [('/api/person/1', 200), ('/api/_batch', 403)]
+        assert self._names()[:2] == [u'Lincoln', u'Mary']
+
+    def test_atomic(self):
+        """Tests that a failed operation rolls back all the operations and
+        stops the batch by default.
+
+        """
+        operations = [dict(method='post', collection='person',
+                           body=dict(name=u'Jeffrey')),
+                      dict(method='post', collection='person',
+                           body=dict(name=u'Lincoln')),
+                      dict(method='delete', collection='person', id=2)]
+        response = self.app.post('/api/_batch',
+                                 data=dumps(dict(operations=operations)))
+        assert response.status_code == 400
+        results = loads(response.data)['results']
+        assert [result['status'] for result in results] == [201, 400]
+        assert self._names() == [u'Lincoln', u'Mary', u'Lucy', u'Katy',
+                                 u'John']
+
+    def test_continue_on_error(self):
+        """Tests that failed operations are reported and rolled back without
+        affecting the other operations when ``atomic`` is ``false``.
+
+        """
+        operations = [dict(method='post', collection='person',
+                           body=dict(name=u'Jeffrey')),
+                      dict(method='post', collection='person',
+                           body=dict(name=u'Lincoln')),
+                      dict(method='post', collection='computer',
+                           body=dict(name=u'Foo', owner_id=1)),
+                      dict(method='patch', collection='person', id=1,
+                           body=dict(bogus=1)),
+                      dict(method='delete', collection='person', id=2)]
+        data = dict(operations=operations, atomic=False)
+        response = self.app.post('/api/_batch', data=dumps(data))
+        assert response.status_code == 200
+        results = loads(response.data)['results']
+        assert [result['status'] for result in results] == [201, 400, 201,
+                                                            400, 204]
+        assert self._names() == [u'Lincoln', u'Lucy', u'Katy', u'John',
+                                 u'Jeffrey']
+        assert self.session.query(self.Computer).count() == 1
+
+    def test_bad_operations(self):
+        """Tests that unknown methods, unknown collections and methods not
+        allowed on an API are reported as failed operations.
+
+        """
+        operations = [dict(method='foo', collection='person'),
+                      dict(method='get', collection='bogus'),
+                      dict(method='get', collection='computer', id=1)]
+        data = dict(operations=operations, atomic=False)
+        response = self.app.post('/api/_batch', data=dumps(data))
+        assert response.status_code == 200
+        results = loads(response.data)['results']
+        assert [result['status'] for result in results] == [400, 404, 405]
+
+    def test_bad_request(self):
+        """Tests that a request without a list of operations or with too many
+        operations causes an error response.
+
+        """
+        response = self.app.post('/api/_batch', data=dumps(dict(foo=1)))
+        assert response.status_code == 400
+        response = self.app.post('/api/_batch', data='bogus')
+        assert response.status_code == 400
+        operations = [dict(method='get', collection='person')] * 6
+        response = self.app.post('/api/_batch',
+                                 data=dumps(dict(operations=operations)))
+        assert response.status_code == 413
+
+    def test_processors(self):
+        """Tests that the preprocessors of the APIs are applied to the
+        operations.
+
+        """
+        def forbidden(**kw):
+            raise ProcessingException(description='forbidden', code=403)
+
+        self.manager.create_api(self.Computer, methods=['GET'],
+                                collection_name='computers',
+                                preprocessors=dict(GET_MANY=[forbidden]))
+        operations = [dict(method='get', collection='computers')]
+        response = self.app.post('/api/_batch',
+                                 data=dumps(dict(operations=operations)))
+        assert response.status_code == 403
+        result = loads(response.data)['results'][0]
+        assert result['body']['message'] == 'forbidden'
+
+
+class TestGroupCommit(ManagerTestBase):
+    """Tests for committing concurrent writes in shared transactions."""
+
+    def setUp(self):
+        """Binds the session to a SQLite file database, which, unlike the
+        in-memory database, is shared by the connections of all threads, and
+        creates the model and the API.
+
+        """
+        super(TestGroupCommit, self).setUp()
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        self.engine = create_engine('sqlite:///' + self.filename)
+        self.session.configure(bind=self.engine)
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode, unique=True)
+
+        self.Person = Person
+        self.Base.metadata.create_all(self.engine)
+        self.commits = []
+        event.listen(self.session, 'after_commit', self._record_commit)
+        self.manager.create_api(Person, methods=['POST', 'DELETE'],
+                                group_commit=True, group_commit_delay=0.2)
+
+    def tearDown(self):
+        """Removes the session and the database file."""
+        event.remove(self.session, 'after_commit', self._record_commit)
+        self.session.remove()
+        self.engine.dispose()
+        os.remove(self.filename)
+
+    def _record_commit(self, session):
+        self.commits.append(session)
+
+    def _concurrently(self, method, urls, bodies=None):
+        """Makes requests with the specified method on each of the URLs in
+        separate threads at the same time and returns the status codes of the
+        responses, in the same order.
+
+        """
+        bodies = bodies or [None] * len(urls)
+        statuses = [None] * len(urls)
+        start = threading.Event()
+
+        def request(i):
+            client = self.flaskapp.test_client()
+            start.wait()
+            data = None if bodies[i] is None else dumps(bodies[i])
+            response = client.open(urls[i], method=method, data=data,
+                                   content_type='application/json')
+            statuses[i] = response.status_code
+
+        threads = [threading.Thread(target=request, args=(i, ))
+                   for i in range(len(urls))]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_post(self):
+        """Tests that concurrent :http:method:`post` requests are committed
+        in fewer transactions than there are requests.
+
+        """
+        bodies = [dict(name=u'person{0}'.format(i)) for i in range(10)]
+        statuses = self._concurrently('POST', ['/api/person'] * 10, bodies)
+        assert statuses == [201] * 10
+        assert self.session.query(self.Person).count() == 10
+        assert len(self.commits) < 10
+
+    def test_fallback(self):
+        """Tests that a write which fails causes the others in its group to
+        be committed individually.
+
+        """
+        bodies = [dict(name=u'foo'), dict(name=u'bar'), dict(name=u'foo'),
+                  dict(name=u'baz')]
+        statuses = self._concurrently('POST', ['/api/person'] * 4, bodies)
+        assert sorted(statuses) == [201, 201, 201, 400]
+        names = sorted(person.name for person in
+                       self.session.query(self.Person))
+        assert names == [u'bar', u'baz', u'foo']
+
+    def test_delete(self):
+        """Tests that concurrent :http:method:`delete` requests are committed
+        and that each reports whether it deleted an instance.
+
+        """
+        self.session.add_all([self.Person(id=i) for i in range(1, 5)])
+        self.session.commit()
+        del self.commits[:]
+        urls = ['/api/person/{0}'.format(i) for i in (1, 2, 3, 10)]
+        statuses = self._concurrently('DELETE', urls)
+        assert statuses == [204, 204, 204, 404]
+        assert self.session.query(self.Person).count() == 1
+        assert len(self.commits) < 4
+
+    def test_batch(self):
+        """Tests that the operations of a batch request are not committed by
+        the committer thread, so that a failed operation rolls back the
+        operations before it.
+
+        """
+        # As in TestBatch, the transaction is begun explicitly so that
+        # pysqlite supports savepoints.
+        event.listen(self.engine, 'connect', self._autocommit)
+        event.listen(self.engine, 'begin', self._begin)
+        self.manager.create_batch_api()
+        operations = [dict(method='post', collection='person',
+                           body=dict(name=u'foo')),
+                      dict(method='post', collection='person',
+                           body=dict(bogus=u'bar'))]
+        response = self.app.post('/api/_batch',
+                                 data=dumps(dict(operations=operations)))
+        assert response.status_code == 400
+        assert self.session.query(self.Person).count() == 0
+
+    @staticmethod
+    def _autocommit(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @staticmethod
+    def _begin(connection):
+        connection.execute('BEGIN')
+
+
+class TestConditionalGet(TestSupportPrefilled):
+    """Tests for ETags, conditional :http:method:`get` requests, and the
+    :http:header:`Cache-Control` header.
+
+    """
+
+    def setUp(self):
+        """Records the statements executed by the database."""
+        super(TestConditionalGet, self).setUp()
+        self.statements = []
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+
+    def tearDown(self):
+        event.remove(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+        super(TestConditionalGet, self).tearDown()
+
+    def _count_statement(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def _get(self, url, etag):
+        del self.statements[:]
+        return self.app.get(url, headers={'If-None-Match': etag})
+
+    def test_disabled(self):
+        """Tests that responses have no ETag by default."""
+        self.manager.create_api(self.Person)
+        response = self.app.get('/api/person/1')
+        assert 'ETag' not in response.headers
+        assert 'Cache-Control' not in response.headers
+
+    def test_body(self):
+        """Tests that ETags are computed from the body of the response if
+        there is no version column.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'PATCH'],
+                                etags=True)
+        for url in '/api/person/1', '/api/person':
+            response = self.app.get(url)
+            etag = response.headers['ETag']
+            response = self._get(url, etag)
+            assert response.status_code == 304
+            assert response.data == b''
+            assert response.headers['ETag'] == etag
+        etag = self.app.get('/api/person/1').headers['ETag']
+        self.app.patch('/api/person/1', data=dumps(dict(name=u'Abraham')))
+        response = self._get('/api/person/1', etag)
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        assert loads(response.data)['name'] == u'Abraham'
+
+    def test_version_single(self):
+        """Tests that a conditional request for an instance is answered from
+        its version column alone.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'PATCH'],
+                                etags=True, version_column='age')
+        etag = self.app.get('/api/person/1').headers['ETag']
+        assert etag != self.app.get('/api/person/2').headers['ETag']
+        response = self._get('/api/person/1', etag)
+        assert response.status_code == 304
+        assert len(self.statements) == 1
+        assert 'person.name' not in self.statements[0]
+        self.app.patch('/api/person/1', data=dumps(dict(age=24)))
+        response = self._get('/api/person/1', etag)
+        assert response.status_code == 200
+        assert loads(response.data)['age'] == 24
+        response = self._get('/api/person/10', etag)
+        assert response.status_code == 404
+
+    def test_version_collection(self):
+        """Tests that a conditional request for a collection is answered from
+        a single aggregate query.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'DELETE'],
+                                etags=True, version_column='age',
+                                results_per_page=2)
+        etag = self.app.get('/api/person').headers['ETag']
+        assert etag != self.app.get('/api/person?page=2').headers['ETag']
+        response = self._get('/api/person', etag)
+        assert response.status_code == 304
+        assert len(self.statements) == 1
+        self.app.delete('/api/person/5')
+        response = self._get('/api/person', etag)
+        assert response.status_code == 200
+        assert loads(response.data)['num_results'] == 4
+
+    def test_version_custom_query(self):
+        """Tests that the version of a collection is computed using the custom
+        ``query`` attribute of the model, so that changes to the instances it
+        hides do not change the ETag.
+
+        """
+        session = self.session
+
+        class Note(self.Base):
+            __tablename__ = 'note'
+            id = Column(Integer, primary_key=True)
+            version = Column(Integer)
+            hidden = Column(Boolean)
+
+            @classmethod
+            def query(cls):
+                return session.query(cls).filter(cls.hidden.is_(False))
+
+        self.Base.metadata.create_all()
+        self.session.add_all([Note(id=1, version=1, hidden=False),
+                              Note(id=2, version=5, hidden=True)])
+        self.session.commit()
+        self.manager.create_api(Note, etags=True, version_column='version')
+        etag = self.app.get('/api/note').headers['ETag']
+        self.session.query(Note).get(2).version = 6
+        self.session.commit()
+        response = self._get('/api/note', etag)
+        assert response.status_code == 304
+        self.session.query(Note).get(1).version = 2
+        self.session.commit()
+        response = self._get('/api/note', etag)
+        assert response.status_code == 200
+
+    def test_canonical_body(self):
+        """Tests that ETags computed from the body of the response do not
+        depend on the order of the keys of the dictionaries in the body.
+
+        """
+        first = dict(a=1)
+        first['b'] = dict(c=2)
+        first['b']['d'] = 3
+        second = dict(b=dict(d=3))
+        second['b']['c'] = 2
+        second['a'] = 1
+        assert _canonical_dumps(first) == _canonical_dumps(second)
+        assert _canonical_dumps(first) == '{"a": 1, "b": {"c": 2, "d": 3}}'
+
+    def test_last_modified(self):
+        """Tests that a version column containing dates provides the
+        :http:header:`Last-Modified` header.
+
+        """
+        computer = self.Computer(name=u'foo',
+                                 buy_date=datetime(2015, 1, 2, 3, 4, 5))
+        self.session.add(computer)
+        self.session.commit()
+        self.manager.create_api(self.Computer, etags=True,
+                                version_column='buy_date')
+        response = self.app.get('/api/computer/1')
+        last_modified = response.headers['Last-Modified']
+        assert last_modified == 'Fri, 02 Jan 2015 03:04:05 GMT'
+        headers = {'If-Modified-Since': last_modified}
+        response = self.app.get('/api/computer/1', headers=headers)
+        assert response.status_code == 304
+        response = self.app.get('/api/computer', headers=headers)
+        assert response.status_code == 304
+        headers = {'If-Modified-Since': 'Thu, 01 Jan 2015 00:00:00 GMT'}
+        response = self.app.get('/api/computer/1', headers=headers)
+        assert response.status_code == 200
+
+    def test_cache_control(self):
+        """Tests that the configured :http:header:`Cache-Control` header is
+        included in responses.
+
+        """
+        self.manager.create_api(self.Person, etags=True,
+                                cache_control='public, max-age=5')
+        for url in '/api/person/1', '/api/person':
+            response = self.app.get(url)
+            assert response.headers['Cache-Control'] == 'public, max-age=5'
+            response = self._get(url, response.headers['ETag'])
+            assert response.status_code == 304
+            assert response.headers['Cache-Control'] == 'public, max-age=5'
+
+
+class TestPreferMinimal(TestSupportPrefilled):
+    """Tests for minimal responses to write requests with the
+    ``Prefer: return=minimal`` header.
+
+    """
+
+    def setUp(self):
+        """Creates the API and records the statements executed by the
+        database.
+
+        """
+        super(TestPreferMinimal, self).setUp()
+        self.manager.create_api(self.Person, methods=['POST', 'PATCH'],
+                                allow_patch_many=True)
+        self.statements = []
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+
+    def tearDown(self):
+        event.remove(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._count_statement)
+        super(TestPreferMinimal, self).tearDown()
+
+    def _count_statement(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_post(self):
+        """Tests that a minimal response to a :http:method:`post` request
+        contains only the :http:header:`Location` header.
+
+        """
+        headers = {'Prefer': 'respond-async, return=minimal'}
+        response = self.app.post('/api/person', headers=headers,
+                                 data=dumps(dict(name=u'Jeffrey')))
+        assert response.status_code == 201
+        assert response.headers['Location'].endswith('/api/person/6')
+        assert response.headers['Preference-Applied'] == 'return=minimal'
+        assert loads(response.data) == {}
+        assert not any(statement.startswith('SELECT')
+                       for statement in self.statements)
+        assert self.session.query(self.Person).get(6).name == u'Jeffrey'
+
+    def test_patch(self):
+        """Tests that a minimal response to a :http:method:`patch` request
+        has :http:statuscode:`204` and that the relations of the instance are
+        not loaded.
+
+        """
+        headers = {'Prefer': 'return=minimal'}
+        response = self.app.patch('/api/person/1', headers=headers,
+                                  data=dumps(dict(name=u'Abraham')))
+        assert response.status_code == 204
+        assert response.headers['Preference-Applied'] == 'return=minimal'
+        assert not any('computer' in statement
+                       for statement in self.statements)
+        assert self.session.query(self.Person).get(1).name == u'Abraham'
+        response = self.app.patch('/api/person/10', headers=headers,
+                                  data=dumps(dict(name=u'Abraham')))
+        assert response.status_code == 404
+
+    def test_patch_many(self):
+        """Tests that a minimal response to a :http:method:`patch` request on
+        a collection contains the number of modified instances.
+
+        """
+        headers = {'Prefer': 'return=minimal'}
+        response = self.app.patch('/api/person', headers=headers,
+                                  data=dumps(dict(other=5)))
+        assert response.status_code == 200
+        assert loads(response.data)['num_modified'] == 5
+
+    def test_representation(self):
+        """Tests that responses include the representation of the instance
+        without the header or with another preference.
+
+        """
+        headers = {'Prefer': 'return=representation'}
+        response = self.app.post('/api/person', headers=headers,
+                                 data=dumps(dict(name=u'Jeffrey')))
+        assert response.status_code == 201
+        assert 'Preference-Applied' not in response.headers
+        assert loads(response.data)['name'] == u'Jeffrey'
+        response = self.app.patch('/api/person/1',
+                                  data=dumps(dict(name=u'Abraham')))
+        assert response.status_code == 200
+        assert loads(response.data)['name'] == u'Abraham'
+
+
+class TestDeleteByIds(ManagerTestBase):
+    """Tests for deleting many instances of a model by a list of their
+    primary keys.
+
+    """
+
+    def setUp(self):
+        super(TestDeleteByIds, self).setUp()
+
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class Comment(self.Base):
+            __tablename__ = 'comment'
+            id = Column(Integer, primary_key=True)
+            article_id = Column(Integer, ForeignKey('article.id'))
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            comments = rel(Comment, cascade='all, delete-orphan')
+
+        self.Base.metadata.create_all()
+        self.Article = Article
+        self.Comment = Comment
+        self.Tag = Tag
+        self.session.add_all([Tag(name=u'tag{0}'.format(i))
+                              for i in range(1, 1202)])
+        self.session.add_all([Article(comments=[Comment(), Comment()])
+                              for i in range(3)])
+        self.session.commit()
+        self.manager.create_api(Tag, methods=['DELETE'],
+                                allow_delete_many=True)
+        self.manager.create_api(Article, methods=['DELETE'],
+                                allow_delete_many=True)
+        self.statements = []
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._record_statement)
+
+    def tearDown(self):
+        event.remove(self.Base.metadata.bind, 'before_cursor_execute',
+                     self._record_statement)
+        self.Base.metadata.drop_all()
+
+    def _record_statement(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_body(self):
+        """Tests that the primary keys given in the body of the request are
+        deleted by a single ``DELETE`` statement.
+
+        """
+        response = self.app.delete('/api/tag', data=dumps(dict(ids=[1, 3])))
+        assert response.status_code == 200
+        assert loads(response.data) == dict(num_deleted=2, chunks=[2])
+        assert not any(statement.startswith('SELECT')
+                       for statement in self.statements)
+        assert sum(statement.startswith('DELETE')
+                   for statement in self.statements) == 1
+        assert self.session.query(self.Tag).get(1) is None
+        assert self.session.query(self.Tag).get(2) is not None
+        assert self.session.query(self.Tag).get(3) is None
+
+    def test_query_parameter(self):
+        """Tests that the primary keys may be given as a JSON list in the
+        ``ids`` query parameter.
+
+        """
+        response = self.app.delete('/api/tag?ids=[2,4,5000]')
+        assert response.status_code == 200
+        assert loads(response.data) == dict(num_deleted=2, chunks=[2])
+        assert self.session.query(self.Tag).count() == 1199
+
+    def test_chunks(self):
+        """Tests that the number of instances deleted in each chunk of
+        primary keys is reported.
+
+        """
+        ids = list(range(1, 1202))
+        response = self.app.delete('/api/tag', data=dumps(dict(ids=ids)))
+        assert response.status_code == 200
+        data = loads(response.data)
+        assert data['num_deleted'] == 1201
+        assert data['chunks'] == [500, 500, 201]
+        assert self.session.query(self.Tag).count() == 0
+
+    def test_cascade(self):
+        """Tests that instances of a model with ORM cascades are deleted
+        through the ORM, so that their related instances are deleted too.
+
+        """
+        response = self.app.delete('/api/article',
+                                   data=dumps(dict(ids=[1, 2])))
+        assert response.status_code == 200
+        assert loads(response.data) == dict(num_deleted=2, chunks=[2])
+        assert self.session.query(self.Article).count() == 1
+        assert self.session.query(self.Comment).count() == 2
+
+    def test_nothing_deleted(self):
+        """Tests that a request which deletes no instances causes a
+        :http:statuscode:`404`.
+
+        """
+        response = self.app.delete('/api/tag', data=dumps(dict(ids=[5000])))
+        assert response.status_code == 404
+        response = self.app.delete('/api/tag', data=dumps(dict(ids=[])))
+        assert response.status_code == 404
+
+    def test_body_ignored(self):
+        """Tests that the body of a request which deletes a single instance,
+        or which gives a search query, is not read.
+
+        """
+        response = self.app.delete('/api/tag/1', data='{"ids": [2')
+        assert response.status_code == 204
+        query = dumps(dict(filters=[dict(name='id', op='eq', val=2)]))
+        response = self.app.delete('/api/tag?q={0}'.format(query),
+                                   data='{"ids": [3')
+        assert response.status_code == 200
+        assert loads(response.data)['num_deleted'] == 1
+        assert self.session.query(self.Tag).count() == 1199
+
+    def test_integrity_error(self):
+        """Tests that a database integrity error raised while deleting the
+        instances is reported as such, and that the session is rolled back.
+
+        """
+        class Pet(self.Base):
+            __tablename__ = 'pet'
+            id = Column(Integer, primary_key=True)
+            owner_id = Column(Integer, ForeignKey('owner.id'), nullable=False)
+
+        class Owner(self.Base):
+            __tablename__ = 'owner'
+            id = Column(Integer, primary_key=True)
+            pets = rel(Pet)
+
+        self.Base.metadata.create_all()
+        self.session.add(Owner(id=1, pets=[Pet()]))
+        self.session.commit()
+        self.manager.create_api(Owner, methods=['DELETE'],
+                                allow_delete_many=True)
+        response = self.app.delete('/api/owner', data=dumps(dict(ids=[1])))
+        assert response.status_code == 400
+        assert loads(response.data)['message'] == 'IntegrityError'
+        assert self.session.query(Owner).get(1) is not None
+
+    def test_bad_ids(self):
+        """Tests that malformed lists of primary keys cause a
+        :http:statuscode:`400`.
+
+        """
+        for data in (dict(ids=dict(id=1)), dict(ids=[[1]]), [1, 2]):
+            response = self.app.delete('/api/tag', data=dumps(data))
+            assert response.status_code == 400
+        response = self.app.delete('/api/tag?ids=1,2')
+        assert response.status_code == 400
+        query = dumps(dict(filters=[dict(name='id', op='lt', val=3)]))
+        response = self.app.delete('/api/tag?q={0}&ids=[1]'.format(query))
+        assert response.status_code == 400
+        assert self.session.query(self.Tag).count() == 1201
+
+    def test_preprocessor(self):
+        """Tests that the filters added by a preprocessor restrict the
+        instances deleted.
+
+        """
+        def restrict(search_params=None, **kw):
+            search_params['filters'].append(dict(name='name', op='eq',
+                                                 val=u'tag1'))
+
+        preprocessors = dict(DELETE_MANY=[restrict])
+        self.manager.create_api(self.Tag, methods=['DELETE'],
+                                url_prefix='/api2', allow_delete_many=True,
+                                preprocessors=preprocessors)
+        response = self.app.delete('/api2/tag', data=dumps(dict(ids=[1, 2])))
+        assert response.status_code == 200
+        assert loads(response.data)['num_deleted'] == 1
+        assert self.session.query(self.Tag).get(1) is None
+        assert self.session.query(self.Tag).get(2) is not None
+
+
 class TestHeaders(TestSupportPrefilled):
     """Tests for correct HTTP headers in responses."""
 